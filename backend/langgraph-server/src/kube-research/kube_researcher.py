@@ -5,12 +5,30 @@ from langgraph.checkpoint.memory import MemorySaver
 from subgraphs.planner_research.planner_schemas import PlanArgTool
 from subgraphs.planner_research.planner_schemas import PlannerStateOutput
 from utils.build import build_planner_research_graph
-from utils.schemas import TaskResearch, KubeResearcherState
+from utils.schemas import TaskResearch, KubeResearcherState, InvestigationBudget, BudgetUsage
+from utils.cluster_snapshot import collect_cluster_snapshot, render_cluster_snapshot
+from utils.section_scheduler import SectionDAG, run_section_dag
+from utils.notes import render_notes
+from subgraphs.supervisor_obs.supervisor_agent import SupervisorBuilder, AgentConfig
+from subgraphs.supervisor_obs.mcp_pool import MCPConnectionPool, PoolLimits
+from langchain_core.messages import HumanMessage
+from langgraph._internal._runnable import RunnableCallable
 from collections import deque
-from typing import Literal, Optional, List, Deque, Dict
+from typing import Any, Literal, Optional, List, Deque, Dict
 import attrs
+import logging
 from langchain_core.language_models.chat_models import BaseChatModel
 from langgraph.graph.state import CompiledStateGraph
+from pathlib import Path
+import asyncio
+import tomllib
+import time
+
+PROMPT_PATH = Path(__file__).parent / "prompts.toml"
+with open(PROMPT_PATH, "rb") as f:
+    PROMPTS = tomllib.load(f)
+
+logger = logging.getLogger(__name__)
 
 @attrs.define
 class KubeResearcherGraph:
@@ -19,7 +37,9 @@ class KubeResearcherGraph:
 
             Este grafo integra el subgrafo del planificador y define el flujo de control
             principal. Comienza con la planificación, luego, si se aprueba, transforma
-            el plan en una cola de tareas y finaliza. Si se cancela, el proceso termina
+            el plan en una cola de tareas, recolecta una sola vez el snapshot compartido
+            del clúster e investiga las secciones según sus dependencias (en paralelo las
+            que están listas) antes de finalizar. Si se cancela, el proceso termina
             inmediatamente.
 
             ## Diagrama del Grafo KubeResearcher
@@ -52,6 +72,18 @@ class KubeResearcherGraph:
                     │           └───────────┘
                     │
                     ▼
+            ┌──────────────────┐
+            │ cluster_snapshot │
+            │ (Node, MCP ∥)    │
+            └──────────────────┘
+                    │
+                    ▼
+            ┌───────────────────┐
+            │ research_sections │
+            │ (Node, DAG ∥)     │
+            └───────────────────┘
+                    │
+                    ▼
             ┌───────────────┐
             │ FINISH POINT  │
             └───────────────┘
@@ -59,7 +91,46 @@ class KubeResearcherGraph:
         """
     reasoning_llm : BaseChatModel
     one_shot_llm : BaseChatModel
-    mcp_connection_args : Dict
+    mcp_connection_args : Dict = attrs.field(factory=dict) #Servidores MCP adicionales a los de `config_agents` (solo para el snapshot)
+    max_feedback_rounds : int = attrs.field(default=5)
+    budget : InvestigationBudget = attrs.field(factory=InvestigationBudget) #Límites de tokens, llamadas y tiempo por investigación
+    snapshot_timeout : float = attrs.field(default=10.0) #Timeout por consulta del snapshot del clúster
+    config_agents : List[AgentConfig] = attrs.field(factory=list) #Agentes de investigación del supervisor de cada sección
+    max_parallel_sections : int = attrs.field(default=3) #Secciones listas que se investigan en paralelo
+    pool_limits : PoolLimits = attrs.field(factory=PoolLimits) #Límites del pool de sesiones MCP compartido por todo el reporte
+    __mcp_pool : Optional[MCPConnectionPool] = attrs.field(init=False , default=None)
+    __supervisor : Optional[CompiledStateGraph] = attrs.field(init=False , default=None)
+
+    def mcp_connections(self) -> Dict[str , Dict[str , Any]]:
+        """Conexiones MCP del reporte: las de `config_agents` más las adicionales de `mcp_connection_args`."""
+        connections = {agent.mcp_connection.id : agent.mcp_connection.connection_args for agent in self.config_agents}
+        return {**self.mcp_connection_args , **connections}
+
+    @property
+    def mcp_pool(self) -> MCPConnectionPool:
+        """Pool de sesiones MCP único del researcher, lo comparten el snapshot del clúster y el supervisor de cada sección."""
+        if self.__mcp_pool is None:
+            self.__mcp_pool = MCPConnectionPool(connections=self.mcp_connections() , limits=self.pool_limits)
+        return self.__mcp_pool
+
+    async def __asupervisor(self) -> CompiledStateGraph:
+        """Supervisor de observabilidad (agentes, tools MCP y router) construido una vez y reutilizado entre reportes."""
+        if self.__supervisor is None:
+            builder = SupervisorBuilder(
+                reasoning_llm=self.reasoning_llm,
+                one_shot_llm=self.one_shot_llm,
+                config_agents=self.config_agents,
+                pool_limits=self.pool_limits,
+                mcp_pool=self.mcp_pool
+            )
+            await builder.build()
+            self.__supervisor = builder.compile(name="research_supervisor")
+        return self.__supervisor
+
+    async def aclose(self) -> None:
+        """Cierra las sesiones MCP persistentes del pool del researcher."""
+        if self.__mcp_pool is not None:
+            await self.__mcp_pool.aclose()
 
     #Node
     def plan_as_queue(self , state : KubeResearcherState) -> KubeResearcherState:
@@ -111,7 +182,8 @@ class KubeResearcherGraph:
             ├── id: str                    ← "taskps_{section.number}"
             ├── plan_section: PlanSection  ← Referencia completa a la sección
             ├── status: Literal           ← "Pending" (estado inicial)
-            └── observability_notes: List ← [] (lista vacía para futuros hallazgos)
+            ├── observability_notes: List ← [] (lista vacía para futuros hallazgos)
+            └── budget: InvestigationBudget ← Parte del presupuesto global (budget.split)
         ```
         Flujo de Cola de Tareas
         ```text
@@ -196,19 +268,117 @@ class KubeResearcherGraph:
         """
         task_queue = deque()
         plan = state["plan"]
+        # El reloj del presupuesto comienza cuando el plan es aprobado y se reparte entre las secciones
+        budget = self.budget.model_copy(update={"started_at" : time.time()})
+        section_budgets = budget.split(len(plan.plan))
 
-        for section in plan.plan:
+        for section, section_budget in zip(plan.plan , section_budgets):
             task_queue.append(TaskResearch(
                 id=f"taskps_{section.number}",
                 plan_section=section,
                 status="Pending",
-                observability_notes=list()
+                observability_notes=list(),
+                budget=section_budget
             ))        
 
         return {
             "queue_tasks" : task_queue,
-            "queue_results_tasks" : deque()
+            "queue_result_tasks" : deque(),
+            "budget" : budget
+        }
+    #Node
+    async def acluster_snapshot(self , state : KubeResearcherState) -> KubeResearcherState:
+        """
+        Recolecta una sola vez por reporte los hechos base que todas las secciones necesitan
+        (información del clúster, nodos, alertas activas y health de cada servidor), consultando
+        concurrentemente todos los servidores MCP. El resultado se guarda compacto en `cluster_context`
+        y se inyecta en el prompt de cada agente, evitando que cada sección los redescubra.
+
+        ```text
+                          ┌──▶ kubernetes: k8s://cluster/info, k8s://nodes, health_check ──┐
+        cluster_snapshot ─┤                                                               ├──▶ cluster_context
+                          └──▶ prometheus: prometheus://alerts, health_check ─────────────┘
+        ```
+        """
+        snapshot = await collect_cluster_snapshot(self.mcp_pool , timeout=self.snapshot_timeout)
+        return {"cluster_context" : render_cluster_snapshot(snapshot)}
+
+    def cluster_snapshot(self , state : KubeResearcherState) -> KubeResearcherState:
+        return asyncio.run(self.acluster_snapshot(state))
+
+    #Node
+    async def aresearch_sections(self , state : KubeResearcherState) -> KubeResearcherState:
+        """
+        Scheduler de secciones según sus dependencias (`PlanSection.depends_on`). Las secciones sin
+        dependencias pendientes se investigan en paralelo (hasta `max_parallel_sections`) con el
+        supervisor de observabilidad, priorizando las que inician el camino crítico más largo, y cada
+        sección recibe en su mensaje inicial las notas de las secciones de las que depende.
+
+        ```text
+        queue_tasks ──▶ SectionDAG ──▶ listas (por camino crítico) ──▶ supervisor ∥ supervisor ∥ ...
+                            ▲                                                │
+                            └────── notas de la sección terminada ◀──────────┘
+                                                                             │
+                                                                             ▼
+                                                                    queue_result_tasks
+        ```
+        """
+        tasks = list(state.get("queue_tasks") or [])
+        if not tasks:
+            return {"queue_result_tasks" : deque()}
+        if not self.config_agents:
+            # Sin agentes configurados no hay quién investigue, las secciones se omiten
+            logger.warning(
+                "KubeResearcherGraph sin config_agents: las %d secciones del plan se marcan como 'Pass' sin investigar",
+                len(tasks)
+            )
+            return {
+                "queue_tasks" : deque(),
+                "queue_result_tasks" : deque(task.model_copy(update={"status" : "Pass"}) for task in tasks)
+            }
+        supervisor = await self.__asupervisor()
+        dag = SectionDAG.from_tasks(tasks)
+        cluster_context = state.get("cluster_context")
+
+        async def run_section(task : TaskResearch , upstream : List[TaskResearch]) -> TaskResearch:
+            result = await supervisor.ainvoke({
+                "messages" : [HumanMessage(content=self.__section_brief(task , upstream))],
+                "current_task" : task,
+                "budget" : task.budget or InvestigationBudget(),
+                "cluster_context" : cluster_context
+            })
+            return task.model_copy(update={
+                "status" : "Done",
+                "observability_notes" : list(result.get("current_notes") or []),
+                "budget" : result.get("budget" , task.budget)
+            })
+
+        results = await run_section_dag(dag , run_section , self.max_parallel_sections , budget=state.get("budget"))
+        used = sum((task.budget.used for task in results if task.budget is not None) , BudgetUsage())
+        return {
+            "queue_tasks" : deque(),
+            "queue_result_tasks" : deque(sorted(results , key=lambda task: task.plan_section.number)),
+            "budget" : used
         }
+
+    def research_sections(self , state : KubeResearcherState) -> KubeResearcherState:
+        return asyncio.run(self.aresearch_sections(state))
+
+    @staticmethod
+    def __section_brief(task : TaskResearch , upstream : List[TaskResearch]) -> str:
+        section = task.plan_section
+        upstream_notes = "\n\n".join(
+            f"#### {dependency.plan_section.number}. {dependency.plan_section.title}\n{render_notes(dependency.observability_notes , token_budget=800)}"
+            for dependency in upstream
+        )
+        return PROMPTS["supervisor"]["section_brief"].format(
+            number=section.number,
+            title=section.title,
+            objective=section.objective,
+            description=section.description,
+            upstream_notes=upstream_notes or "Ninguna, la sección es independiente"
+        )
+
     #Conditional Edges
     def aproved_or_cancelled_plan(self , state : PlannerStateOutput) -> Literal["plan_as_queue" , "__end__"]:
         """
@@ -239,16 +409,24 @@ class KubeResearcherGraph:
             return "__end__"
 
     def __call__(self) -> CompiledStateGraph:
-        planner_graph = build_planner_research_graph(reasoning_llm=self.reasoning_llm , one_shot_llm=self.one_shot_llm)
+        planner_graph = build_planner_research_graph(
+            reasoning_llm=self.reasoning_llm ,
+            one_shot_llm=self.one_shot_llm ,
+            max_feedback_rounds=self.max_feedback_rounds
+        )
         kube_researcher_graph = StateGraph(
             name="Kube Researcher",
             state_schema=KubeResearcherState
         )
         kube_researcher_graph.add_node("kube_researcher_planner" , planner_graph)
         kube_researcher_graph.add_node("plan_as_queue" , self.plan_as_queue)
+        kube_researcher_graph.add_node("cluster_snapshot" , RunnableCallable(self.cluster_snapshot , self.acluster_snapshot))
+        kube_researcher_graph.add_node("research_sections" , RunnableCallable(self.research_sections , self.aresearch_sections))
         kube_researcher_graph.set_entry_point("kube_researcher_planner")
         kube_researcher_graph.add_conditional_edges("kube_researcher_planner" , self.aproved_or_cancelled_plan)
-        kube_researcher_graph.set_finish_point("plan_as_queue")
+        kube_researcher_graph.add_edge("plan_as_queue" , "cluster_snapshot")
+        kube_researcher_graph.add_edge("cluster_snapshot" , "research_sections")
+        kube_researcher_graph.set_finish_point("research_sections")
         return kube_researcher_graph.compile(checkpointer=MemorySaver() , debug=True)
         
 
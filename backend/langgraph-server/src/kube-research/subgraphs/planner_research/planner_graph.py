@@ -5,7 +5,7 @@ from langchain_core.runnables import Runnable
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_community.tools import tool, BaseTool
 from langgraph.graph import StateGraph
-from langchain_core.messages import HumanMessage, filter_messages, ToolMessage
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage, filter_messages, ToolMessage
 from langchain_core.tools.render import render_text_description_and_args
 from langgraph.types import interrupt
 from langgraph.graph.state import CompiledStateGraph
@@ -13,7 +13,7 @@ from langgraph.prebuilt import ToolNode, tools_condition, InjectedState
 from langgraph.checkpoint.memory import MemorySaver
 from pydantic import BaseModel
 from subgraphs.planner_research.planner_config import PlannerAgentConfig
-from subgraphs.planner_research.planner_schemas import HumanFeedbackInputTool , HumanFeedback, PlanArgTool , PlannerState , PlannerStateOutput , PlannerFormatOutput
+from subgraphs.planner_research.planner_schemas import HumanFeedbackInputTool , HumanFeedback, PlanArgTool , PlanSectionPatch , PlannerState , PlannerStateOutput , PlannerFormatOutput
 from pathlib import Path
 import attrs
 import tomllib
@@ -35,6 +35,115 @@ PROMPT_TEMPLATE_PLANNER_FORMAT = ChatPromptTemplate.from_messages([
     ("system" , PLANNER_FORMAT_PROMPT)
 ])
 
+# Respuestas cerradas de HumanFeedback.answer que no requieren interpretación del LLM
+CLOSED_ANSWERS_FORMAT = {
+    "Comenzar el reporte" : PlannerFormatOutput(
+        status="APPROVED",
+        message="El usuario seleccionó 'Comenzar el reporte', el plan queda aprobado para iniciar la investigación."
+    ),
+    "Cancelar Reporte" : PlannerFormatOutput(
+        status="CANCELLED",
+        message="El usuario seleccionó 'Cancelar Reporte', la investigación no se realizará."
+    ),
+}
+
+def capped_answer_format(feedback : HumanFeedback , reason : str) -> PlannerFormatOutput:
+    """
+    Decisión del planificador cuando el plan ya no se revisará (rondas o reintentos agotados): solo
+    'Comenzar el reporte' aprueba el plan vigente, cualquier otra respuesta lo cancela.
+    """
+    if feedback.answer in CLOSED_ANSWERS_FORMAT:
+        return CLOSED_ANSWERS_FORMAT[feedback.answer]
+    return PlannerFormatOutput(status="CANCELLED" , message=f"{reason}, el usuario no aprobó el plan vigente.")
+
+def is_rejected_attempt(messages : list[BaseMessage] , index : int) -> bool:
+    """True si `messages[index]` es un AIMessage cuyo plan o parches se rechazaron (le sigue un ToolMessage de error)."""
+    return (
+        isinstance(messages[index] , AIMessage) and index + 1 < len(messages)
+        and isinstance(messages[index + 1] , ToolMessage) and messages[index + 1].status == "error"
+    )
+
+def rejected_attempts(messages : list[BaseMessage]) -> int:
+    """Intentos rechazados consecutivos desde la última ronda de feedback válida."""
+    last_round = max((i for i, message in enumerate(messages) if isinstance(message , ToolMessage) and message.status != "error") , default=-1)
+    return sum(1 for i in range(last_round + 1 , len(messages)) if is_rejected_attempt(messages , i))
+
+def feedback_messages(messages : list[BaseMessage]) -> list[ToolMessage]:
+    """
+    ToolMessages con la respuesta humana de cada ronda, excluyendo los errores de
+    parches devueltos al modelo (`status="error"`), que no cuentan como ronda de feedback.
+    """
+    return [
+        message for message in filter_messages(messages=messages , include_types=ToolMessage)
+        if message.status != "error"
+    ]
+
+def closed_answer_format(messages : list[BaseMessage]) -> Optional[PlannerFormatOutput]:
+    """
+    Deriva la decisión del planificador directamente del payload estructurado del último
+    `interrupt` (artifact del ToolMessage) cuando la respuesta es cerrada y no trae feedback
+    de texto libre. Devuelve None si la respuesta debe ser interpretada por el LLM.
+    """
+    tool_messages = feedback_messages(messages)
+    if not tool_messages or not isinstance(tool_messages[-1].artifact , HumanFeedback):
+        return None
+    human_feedback : HumanFeedback = tool_messages[-1].artifact
+    if human_feedback.feedback and human_feedback.feedback.strip():
+        return None
+    return CLOSED_ANSWERS_FORMAT.get(human_feedback.answer)
+
+def compact_planner_history(messages : list[BaseMessage] , remaining_rounds : int , digest_chars : int = 300) -> list[BaseMessage]:
+    """
+    Compacta el historial del planificador para que el prompt no crezca con cada ronda de feedback.
+
+    Se conservan los mensajes iniciales del usuario y solo la última ronda completa
+    (AIMessage con el plan vigente + ToolMessage con la respuesta humana). Las rondas
+    anteriores, incluidos sus planes, se reemplazan por un resumen de texto con el
+    feedback que el humano entregó en cada una.
+
+    ```text
+    [Human, AI(plan v1), Tool(fb 1), AI(plan v2), Tool(fb 2), AI(plan v3), Tool(fb 3)]
+                                    │
+                                    ▼
+    [Human, Human(resumen fb 1..2), AI(plan v3), Tool(fb 3)]
+    ```
+
+    De los intentos con parches inválidos (AIMessage seguido de ToolMessage con `status="error"`)
+    solo se conserva el último, para que el modelo vea el error y corrija sin que cada reintento
+    haga crecer el prompt.
+    """
+    rejected = [i for i in range(len(messages)) if is_rejected_attempt(messages , i)]
+    stale = set()
+    for index in rejected[:-1]:
+        stale.add(index)
+        index += 1
+        while index < len(messages) and isinstance(messages[index] , ToolMessage) and messages[index].status == "error":
+            stale.add(index)
+            index += 1
+    messages = [message for i, message in enumerate(messages) if i not in stale]
+    first_ai = next((i for i, message in enumerate(messages) if isinstance(message , AIMessage)) , len(messages))
+    head = list(messages[:first_ai])
+    rounds = [
+        i for i, message in enumerate(messages[:-1])
+        if isinstance(message , AIMessage) and message.tool_calls
+        and isinstance(messages[i + 1] , ToolMessage) and messages[i + 1].status != "error"
+    ]
+    if len(rounds) <= 1:
+        return list(messages)
+
+    digest_lines = []
+    for number, index in enumerate(rounds[:-1] , start=1):
+        feedback = " ".join(str(messages[index + 1].content).split())
+        if len(feedback) > digest_chars:
+            feedback = feedback[:digest_chars] + "..."
+        digest_lines.append(f"- Ronda {number}: {feedback}")
+    digest = HumanMessage(content=(
+        "RESUMEN DE RONDAS DE FEEDBACK ANTERIORES (los planes previos fueron reemplazados por el último plan):\n"
+        + "\n".join(digest_lines)
+        + f"\nQuedan {remaining_rounds} rondas de revisión disponibles, indícalo al usuario en `message_human`."
+    ))
+    return head + [digest] + list(messages[rounds[-1]:])
+
 @attrs.define(init=True)
 class PlannerResearchGraph:
     """
@@ -64,7 +173,10 @@ class PlannerResearchGraph:
     - `planner_agent` -> `response_format`: Después de que el agente planificador
         haya generado un plan de investigación, se llama al estado `response_format`
         para formatear la respuesta.
-        
+    - `planner_agent` -> `planner_agent`: Si los parches o el plan entregados son inválidos,
+        el error se devuelve al modelo como ToolMessage para que vuelva a intentarlo, con un
+        máximo de `max_patch_retries` reintentos con parches y uno final con el plan completo.
+
     Diagrama ilustrativo de la máquina de estados:
 
     ```text
@@ -93,6 +205,8 @@ class PlannerResearchGraph:
     """
     reasoning_llm : BaseChatModel
     one_shot_llm : BaseChatModel
+    max_feedback_rounds : int = attrs.field(default=5)
+    max_patch_retries : int = attrs.field(default=2)
     __llm_config : PlannerAgentConfig = attrs.field(init=False)    
     __tools : list[BaseTool] = attrs.field(init=False)
 
@@ -117,7 +231,11 @@ class PlannerResearchGraph:
             .add_node("tools" , tool_node)
             .add_node("response_format" , self.response_format_node)
             .set_entry_point("planner_agent")
-            .add_conditional_edges("planner_agent" , tools_condition , {"tools" : "tools" , "__end__" : "response_format"})
+            .add_conditional_edges(
+                "planner_agent" ,
+                self.route_planner ,
+                {"tools" : "tools" , "planner_agent" : "planner_agent" , "__end__" : "response_format"}
+            )
             .add_edge("tools" , "planner_agent")
         )
         return planner_graph.compile()
@@ -141,6 +259,16 @@ class PlannerResearchGraph:
 
         Returns:
             dict: El estado actualizado con el plan de investigación.
+
+        Solo se envía al modelo el último plan y un resumen del feedback previo
+        (ver `compact_planner_history`). Al alcanzar `max_feedback_rounds` no se
+        invoca al modelo: si la última respuesta no fue cerrada, un último `interrupt` ofrece solo
+        'Comenzar el reporte' o 'Cancelar Reporte' sobre el plan vigente (sin la revisión pedida) y
+        la decisión queda en `action` sin pasar por el `one_shot_llm`.
+
+        Un plan o parches inválidos se devuelven al modelo como error. Tras `max_patch_retries`
+        intentos rechazados se le exige el plan completo en `plan`, y si ese intento también falla
+        la planificación se cierra con la misma decisión cerrada sobre el plan vigente.
             
         Diagrama ilustrativo:
         
@@ -158,24 +286,117 @@ class PlannerResearchGraph:
             messages = [
                 HumanMessage(content="Por favor, diseña un plan de investigación para analizar el estado y métricas de mi clúster de Kubernetes.")
             ]
+        feedback_rounds = len(feedback_messages(messages))
+        if feedback_rounds >= self.max_feedback_rounds:
+            # Si la última respuesta pidió otra revisión, ya no se aplicará y el usuario decide sobre el plan vigente
+            action = closed_answer_format(messages) or self.__decide_on_current_plan(
+                state , f"Se alcanzó el máximo de {self.max_feedback_rounds} rondas de revisión, la última revisión solicitada no se aplicó"
+            )
+            return {
+                "messages" : state["messages"] + [AIMessage(content=action.message)],
+                "plan" : state.get("plan"),
+                "action" : action
+            }
+        attempts = rejected_attempts(messages)
+        if attempts > self.max_patch_retries:
+            # Tampoco el plan completo pedido tras agotar los reintentos con parches fue válido
+            action = self.__decide_on_current_plan(
+                state , f"El planificador no logró entregar un plan válido tras {attempts} intentos, los cambios propuestos no se aplicaron"
+            )
+            return {
+                "messages" : state["messages"] + [AIMessage(content=action.message)],
+                "plan" : state.get("plan"),
+                "action" : action
+            }
+        closed_format = closed_answer_format(messages)
+        if closed_format is not None:
+            # La planificación terminó con una respuesta cerrada, no hay plan que revisar
+            return {
+                "messages" : state["messages"] + [AIMessage(content=closed_format.message)],
+                "plan" : state["plan"]
+            }
+        messages = compact_planner_history(messages , remaining_rounds=self.max_feedback_rounds - feedback_rounds - 1)
         pipe_planner = self.__llm_config.build_pipe("tools" , PROMPT_TEMPLATE_PLANNER_RESEARCH)
         response = pipe_planner.invoke(
             {
                 "messages" : messages,
                 "tools_context" : state["tools_ctx"],
+                "current_plan" : state["plan"].model_dump_json() if state.get("plan") else "Aún no existe un plan, debes generar el plan inicial completo."
             },
             config
         )
 
-        return {
-            "messages" : state["messages"] + [response],
-            "plan" : PlanArgTool(**response.tool_calls[0]["args"]["plan"]) if response.tool_calls else state["plan"]
-        }
+        if not response.tool_calls:
+            return {"messages" : state["messages"] + [response] , "plan" : state["plan"]}
+        try:
+            plan = self.__resolve_plan(response.tool_calls[0]["args"] , state.get("plan") , allow_patches=attempts < self.max_patch_retries)
+        except ValueError as e:
+            # Parche inválido: se devuelve el error al modelo sin consultar al humano
+            if attempts + 1 >= self.max_patch_retries:
+                retry = "No envíes más parches, vuelve a llamar a la herramienta con el plan completo corregido en `plan`."
+            else:
+                retry = "Corrige los argumentos y vuelve a llamar a la herramienta."
+            rejected = [
+                ToolMessage(
+                    content=f"Error al aplicar el plan o los parches: {e}. El plan vigente no cambió. {retry}",
+                    tool_call_id=tool_call["id"],
+                    status="error"
+                )
+                for tool_call in response.tool_calls
+            ]
+            return {"messages" : state["messages"] + [response] + rejected , "plan" : state["plan"]}
+        return {"messages" : state["messages"] + [response] , "plan" : plan}
+
+    @staticmethod
+    def route_planner(state : PlannerState) -> Literal["tools" , "planner_agent" , "__end__"]:
+        """
+        Igual que `tools_condition`, pero vuelve a `planner_agent` cuando el último mensaje es
+        el error de un parche rechazado, para que el modelo lo corrija.
+        """
+        last_message = state["messages"][-1]
+        if isinstance(last_message , ToolMessage) and last_message.status == "error":
+            return "planner_agent"
+        return tools_condition(state)
+
+    def __decide_on_current_plan(self , state : PlannerState , reason : str) -> PlannerFormatOutput:
+        """
+        Cierra la planificación sin más revisiones: un último `interrupt` ofrece solo las respuestas
+        cerradas sobre el plan vigente. Sin plan vigente la investigación se cancela directamente.
+        """
+        if state.get("plan") is None:
+            return PlannerFormatOutput(status="CANCELLED" , message=f"{reason}, no existe un plan vigente y la investigación no se realizará.")
+        feedback = interrupt({
+            "message" : f"{reason}. ¿Deseas comenzar el reporte con el plan vigente o cancelarlo?",
+            "plan" : state["plan"],
+            "options" : list(CLOSED_ANSWERS_FORMAT)
+        })
+        return capped_answer_format(HumanFeedback(feedback=feedback.get("feedback") , answer=feedback.get("answer")) , reason)
+
+    @staticmethod
+    def __resolve_plan(tool_args : dict , current_plan : Optional[PlanArgTool] , allow_patches : bool = True) -> PlanArgTool:
+        """
+        Obtiene el plan vigente a partir de los argumentos de `__human_feedback_or_confirm`,
+        aplicando los parches por sección sobre el plan almacenado o tomando el plan completo
+        cuando el planificador lo regenera. Con `allow_patches=False` solo se acepta el plan completo.
+        """
+        if not allow_patches and not tool_args.get("plan"):
+            raise ValueError("Tras los reintentos con parches solo se acepta el plan completo en `plan`")
+        if allow_patches and tool_args.get("patches") and current_plan is not None:
+            return current_plan.apply_patches([PlanSectionPatch(**patch) for patch in tool_args["patches"]])
+        if tool_args.get("plan"):
+            return PlanArgTool(**tool_args["plan"])
+        if current_plan is None:
+            raise ValueError("El planificador no entregó un plan inicial completo")
+        return current_plan
 
     def response_format_node(self , state : PlannerState , config) -> PlannerStateOutput:
         """
         Formatea la respuesta del agente planificador para que sea más legible para los humanos.
 
+        Si el usuario respondió con una opción cerrada ('Comenzar el reporte' o 'Cancelar Reporte')
+        sin feedback adicional, la decisión se deriva directamente del payload del interrupt y no
+        se invoca al `one_shot_llm`.
+
         Esta función toma la salida sin procesar del agente planificador, que es una lista de
         objetos Pydantic que representan el plan de investigación, y la formatea en una
         cadena legible por humanos. Esto es útil para mostrar el plan al usuario
@@ -196,11 +417,25 @@ class PlannerResearchGraph:
         'plan': PlanArgTool(\nplan=[\nPlanSection( \nnumber=1, \ntitle='Visión General de Nodos', \nobjective='Obtener información básica sobre el estado ... función get_nodes().', \ndescription='Se utilizará la función `get_nodes()` para recopilar datos sobre cada nodo, ...'),\nPlanSection(...)'\n)])
         ```
         """
-        tool_calls = filter_messages(messages=state["messages"] , include_types=ToolMessage)
+        if isinstance(state.get("action") , PlannerFormatOutput):
+            # Decisión ya tomada por `planner_agent` al agotarse las rondas de revisión
+            return {
+                "action" : state["action"],
+                "plan" : state["plan"],
+                "messages" : state["messages"]
+            }
+        closed_format = closed_answer_format(state["messages"])
+        if closed_format is not None:
+            return {
+                "action" : closed_format,
+                "plan" : state["plan"],
+                "messages" : state["messages"]
+            }
+        tool_calls = feedback_messages(state["messages"])
         pipe_sto = self.__llm_config.build_pipe("response_format" , PROMPT_TEMPLATE_PLANNER_FORMAT)
         response = pipe_sto.invoke({
             "human_response" : tool_calls[-1].content,
-            "current_plan" : state["plan"].model_dump()
+            "current_plan" : [f"{section.number}. {section.title}" for section in state["plan"].plan]
         } , config)
         return {
             "action" : response,
@@ -209,8 +444,13 @@ class PlannerResearchGraph:
         }
     
     @staticmethod
-    @tool(args_schema=HumanFeedbackInputTool)
-    def __human_feedback_or_confirm(message_human : str , plan : PlanArgTool):
+    @tool(args_schema=HumanFeedbackInputTool , response_format="content_and_artifact")
+    def __human_feedback_or_confirm(
+        message_human : str ,
+        state : Annotated[dict , InjectedState] ,
+        plan : Optional[PlanArgTool] = None ,
+        patches : Optional[list[PlanSectionPatch]] = None
+    ):
         """
             HERRAMIENTA CRÍTICA Y OBLIGATORIA para solicitar feedback humano sobre el plan de investigación propuesto.
             
@@ -229,25 +469,36 @@ class PlannerResearchGraph:
                     - Solicitar explícitamente aprobación o cambios
                     - Usar un tono profesional pero accesible
                     
-                plan (PlanArgTool): Plan estructurado con lista ordenada de secciones que contiene:
+                plan (PlanArgTool): Plan estructurado completo, SOLO para el plan inicial o una
+                    reestructuración total, con lista ordenada de secciones que contiene:
                     - Secciones numeradas secuencialmente (1, 2, 3, etc.)
                     - Títulos descriptivos y específicos
                     - Objetivos claros que mencionen las herramientas específicas a utilizar
                     - Descripción detallada de las secciones
+
+                patches (List[PlanSectionPatch]): Parches sobre el plan vigente para revisiones,
+                    con operaciones add, edit, remove o reorder referidas por `number`.
+                    Solo incluye las secciones que cambian.
             
             Returns:
-                str: Respuesta formateada del usuario que incluye:
+                tuple[str, HumanFeedback]: Respuesta formateada del usuario que incluye:
                     - La respuesta del usuario (aprobación/rechazo/modificaciones)
                     - Cualquier feedback específico o sugerencias de cambios
+                  y como artifact el `HumanFeedback` estructurado del interrupt.
             
             Ejemplo de uso correcto:
                 message_human="He diseñado un plan de 4 secciones para analizar las métricas de tu clúster de Kubernetes. 
                             ¿Estás de acuerdo con este enfoque o necesitas alguna modificación?"
                 plan=PlanArgTool(plan=[...secciones estructuradas...])
+
+            Ejemplo de revisión con parches:
+                message_human="Actualicé la sección 2 y eliminé la sección 4 según tu feedback."
+                patches=[{"op": "edit", "number": 2, "objective": "..."}, {"op": "remove", "number": 4}]
         """
+        # El nodo planner ya aplicó el plan completo o los parches sobre el estado
         feedback = interrupt({
             "message" : message_human,
-            "plan" : plan
+            "plan" : state["plan"]
         })
 
         feedback_parsed = HumanFeedback(feedback=feedback["feedback"] , answer=feedback["answer"])
@@ -255,7 +506,7 @@ class PlannerResearchGraph:
         HUMAN FEEDBACK:
         El humano respondio lo siguiente : {feedback_parsed.answer}
         El humano retroalimento lo siguiente: {feedback_parsed.feedback if feedback_parsed.feedback else "No retroalimento nada"}
-        """
+        """ , feedback_parsed
 
 
 
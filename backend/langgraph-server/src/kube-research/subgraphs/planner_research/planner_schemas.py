@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from langgraph.graph import MessagesState, add_messages
 from langgraph.prebuilt import InjectedState
 from langchain_core.messages import AnyMessage
@@ -10,13 +10,77 @@ class PlanSection(BaseModel):
     title : str = Field(description="Título de la sección del informe")
     objective : str = Field(description="Objetivo de la sección del informe")
     description : str = Field(description="Descripción detallada de la sección del informe")
+    depends_on : List[int] = Field(default_factory=list, description="Números de las secciones cuyos hallazgos necesita esta sección, vacío si es independiente")
+
+class PlanSectionPatch(BaseModel):
+    op : Literal["add" , "edit" , "remove" , "reorder"] = Field(description="Operación sobre la sección: add (insertar), edit (modificar campos), remove (eliminar) o reorder (mover)")
+    number : int = Field(description="Número de la sección afectada, en add es la posición donde se inserta la nueva sección")
+    title : Optional[str] = Field(default=None, description="Nuevo título (obligatorio en add, opcional en edit)")
+    objective : Optional[str] = Field(default=None, description="Nuevo objetivo (obligatorio en add, opcional en edit)")
+    description : Optional[str] = Field(default=None, description="Nueva descripción (obligatoria en add, opcional en edit)")
+    new_number : Optional[int] = Field(default=None, description="Nueva posición de la sección, solo para reorder")
+    depends_on : Optional[List[int]] = Field(default=None, description="Nuevas dependencias de la sección (add o edit), numeradas según el plan previo al parche")
 
 class PlanArgTool(BaseModel):
     plan : List[PlanSection] = Field(description="Lista de secciones del informe ordenadas por su número")
 
+    @model_validator(mode="after")
+    def drop_invalid_dependencies(self) -> "PlanArgTool":
+        """Descarta dependencias hacia secciones inexistentes o hacia la propia sección."""
+        numbers = {section.number for section in self.plan}
+        for section in self.plan:
+            section.depends_on = sorted({number for number in section.depends_on if number in numbers and number != section.number})
+        return self
+
+    def apply_patches(self , patches : List[PlanSectionPatch]) -> "PlanArgTool":
+        """
+        Aplica en orden una lista de parches por sección y devuelve un nuevo plan
+        renumerado secuencialmente (1, 2, 3, ...). Los números de cada parche se
+        interpretan sobre el plan resultante del parche anterior, y las dependencias
+        (`depends_on`) se renumeran junto a las secciones, descartando las eliminadas.
+        """
+        sections = [section.model_copy(deep=True) for section in sorted(self.plan , key=lambda section: section.number)]
+        for patch in patches:
+            index = patch.number - 1
+            # Número previo al parche de cada sección, para renumerar sus dependencias
+            previous = {id(section) : section.number for section in sections}
+            if patch.op == "add":
+                if not (patch.title and patch.objective and patch.description):
+                    raise ValueError(f"El parche add en la posición {patch.number} requiere title, objective y description")
+                index = min(max(index , 0) , len(sections))
+                sections.insert(index , PlanSection(
+                    number=patch.number,
+                    title=patch.title,
+                    objective=patch.objective,
+                    description=patch.description,
+                    depends_on=patch.depends_on or []
+                ))
+            else:
+                if not 0 <= index < len(sections):
+                    raise ValueError(f"No existe la sección {patch.number} para aplicar el parche {patch.op}")
+                if patch.op == "edit":
+                    changes = patch.model_dump(include={"title" , "objective" , "description" , "depends_on"} , exclude_none=True)
+                    edited = sections[index].model_copy(update=changes)
+                    previous[id(edited)] = sections[index].number
+                    sections[index] = edited
+                elif patch.op == "remove":
+                    sections.pop(index)
+                elif patch.op == "reorder":
+                    if patch.new_number is None:
+                        raise ValueError(f"El parche reorder de la sección {patch.number} requiere new_number")
+                    section = sections.pop(index)
+                    sections.insert(min(max(patch.new_number - 1 , 0) , len(sections)) , section)
+            renumbered = {previous[id(section)] : number for number, section in enumerate(sections , start=1) if id(section) in previous}
+            for number, section in enumerate(sections , start=1):
+                section.number = number
+                section.depends_on = [renumbered[dependency] for dependency in section.depends_on if dependency in renumbered]
+        return PlanArgTool(plan=sections)
+
 class HumanFeedbackInputTool(BaseModel):
     message_human : str = Field(description="Mensaje al usuario sobre el plan")
-    plan : PlanArgTool = Field(description="Plan actual generado")
+    plan : Optional[PlanArgTool] = Field(default=None, description="Plan completo, solo para el plan inicial o una reestructuración total")
+    patches : Optional[List[PlanSectionPatch]] = Field(default=None, description="Parches por sección sobre el plan vigente, preferidos para revisiones")
+    state : Annotated[dict , InjectedState]
 
 class HumanFeedback(BaseModel):
     feedback : Optional[str] = Field(default=None)
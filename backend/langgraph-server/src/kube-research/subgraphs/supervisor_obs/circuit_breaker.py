@@ -0,0 +1,133 @@
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Literal, Optional
+import asyncio
+import attrs
+import json
+import time
+
+BreakerState = Literal["closed" , "open" , "half_open"]
+
+@attrs.define
+class CircuitBreaker:
+    """
+    Circuit breaker por servidor MCP con timeout adaptativo.
+
+    - `closed`: las llamadas pasan, cada latencia exitosa alimenta una ventana móvil y el timeout
+      efectivo es el percentil `latency_percentile` por `timeout_multiplier`, acotado entre
+      `min_timeout` y el timeout configurado de la tool.
+    - `open`: tras `failure_threshold` fallas consecutivas (timeouts o errores de transporte) las
+      llamadas fallan de inmediato con un resultado "unavailable" durante `reset_timeout` segundos.
+    - `half_open`: vencido `reset_timeout` se ejecuta una sonda (la tool `health_check` del servidor
+      si existe, o la propia llamada si no), si responde el circuito se cierra y si falla se reabre.
+      Si la sonda se cancela el circuito vuelve a `open`, y una sonda sin resultado por más de
+      `reset_timeout` se da por perdida y se admite una nueva.
+
+    ```text
+      closed ──(N fallas)──▶ open ──(reset_timeout)──▶ half_open ──(sonda ok)──▶ closed
+                              ▲                            │
+                              └────────(sonda falla)───────┘
+    ```
+    """
+    server_id : str
+    failure_threshold : int = 3
+    reset_timeout : float = 30.0
+    min_timeout : float = 2.0
+    latency_percentile : float = 0.95
+    timeout_multiplier : float = 3.0
+    min_samples : int = 10
+    probe : Optional[Callable[[] , Awaitable[object]]] = attrs.field(default=None)
+    state : BreakerState = attrs.field(default="closed" , init=False)
+    consecutive_failures : int = attrs.field(default=0 , init=False)
+    opened_at : float = attrs.field(default=0.0 , init=False)
+    probe_started_at : float = attrs.field(default=0.0 , init=False)
+    latencies : Deque[float] = attrs.field(factory=lambda: deque(maxlen=200) , init=False)
+    rejected_calls : int = attrs.field(default=0 , init=False)
+
+    def adaptive_timeout(self , configured : Optional[float]) -> Optional[float]:
+        """Timeout efectivo de la siguiente llamada a partir de la distribución de latencias observada."""
+        if len(self.latencies) < self.min_samples:
+            return configured
+        ordered = sorted(self.latencies)
+        percentile = ordered[min(int(len(ordered) * self.latency_percentile) , len(ordered) - 1)]
+        adaptive = max(self.min_timeout , percentile * self.timeout_multiplier)
+        return min(adaptive , configured) if configured is not None else adaptive
+
+    async def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if (
+            (self.state == "half_open" and now - self.probe_started_at < self.reset_timeout)
+            or (self.state == "open" and now - self.opened_at < self.reset_timeout)
+        ):
+            # Circuito abierto o con una sonda en curso
+            self.rejected_calls += 1
+            return False
+        self.state = "half_open"
+        self.probe_started_at = now
+        if self.probe is None:
+            # Sin sonda dedicada la llamada actual actúa como sonda
+            return True
+        try:
+            await asyncio.wait_for(self.probe() , self.adaptive_timeout(self.reset_timeout))
+        except Exception:
+            self.__trip()
+            self.rejected_calls += 1
+            return False
+        except BaseException:
+            self.abandon_probe()
+            raise
+        self.record_success(time.monotonic() - now)
+        return True
+
+    def abandon_probe(self) -> None:
+        """La sonda en curso terminó sin resultado (p. ej. cancelada), el circuito vuelve a `open` sin reiniciar `opened_at`."""
+        if self.state == "half_open":
+            self.state = "open"
+
+    def record_success(self , latency : float) -> None:
+        self.latencies.append(latency)
+        self.consecutive_failures = 0
+        self.state = "closed"
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.__trip()
+
+    def __trip(self) -> None:
+        self.state = "open"
+        self.opened_at = time.monotonic()
+
+    def unavailable_result(self) -> str:
+        """Resultado estructurado que recibe el agente cuando el circuito está abierto."""
+        retry_after = max(0.0 , self.reset_timeout - (time.monotonic() - self.opened_at))
+        return json.dumps({
+            "status" : "unavailable",
+            "server" : self.server_id,
+            "reason" : "El servidor MCP no responde o está degradado, la llamada no se ejecutó",
+            "retry_after_seconds" : round(retry_after , 1),
+            "hint" : "Continúa la investigación con otras herramientas o registra la indisponibilidad como hallazgo"
+        } , ensure_ascii=False)
+
+    def snapshot(self) -> Dict[str , object]:
+        return {
+            "state" : self.state,
+            "consecutive_failures" : self.consecutive_failures,
+            "rejected_calls" : self.rejected_calls,
+            "samples" : len(self.latencies),
+            "adaptive_timeout" : self.adaptive_timeout(None)
+        }
+
+# Breakers compartidos por servidor MCP entre todos los agentes conectados al mismo servidor
+_SERVER_BREAKERS : Dict[str , CircuitBreaker] = dict()
+
+def get_circuit_breaker(server_id : str , probe : Optional[Callable[[] , Awaitable[object]]] = None , **options) -> CircuitBreaker:
+    if server_id not in _SERVER_BREAKERS:
+        _SERVER_BREAKERS[server_id] = CircuitBreaker(server_id=server_id , probe=probe , **options)
+    elif probe is not None and _SERVER_BREAKERS[server_id].probe is None:
+        _SERVER_BREAKERS[server_id].probe = probe
+    return _SERVER_BREAKERS[server_id]
+
+def circuit_breakers_snapshot() -> Dict[str , Dict[str , object]]:
+    return {server_id : breaker.snapshot() for server_id, breaker in _SERVER_BREAKERS.items()}
@@ -1,4 +1,4 @@
-from langchain_core.tools import tool, BaseTool, InjectedToolCallId
+from langchain_core.tools import tool, BaseTool, InjectedToolCallId, StructuredTool, ToolException
 from langgraph.prebuilt import InjectedState
 from langgraph.types import Command, Send
 from langgraph_supervisor.handoff import METADATA_KEY_HANDOFF_DESTINATION
@@ -8,11 +8,16 @@ from langgraph_supervisor.handoff import (
     _remove_non_handoff_tool_calls,
     METADATA_KEY_HANDOFF_DESTINATION,
 )
-from typing import Deque, Literal, Optional, List, Annotated, cast
+from typing import Any, Callable, Deque, Literal, Optional, List, Annotated, Tuple, cast
+import asyncio
+import time
 import uuid
 from datetime import date
 from utils.schemas import ObservabilityNote , ObservabilityNoteInjectedAgent , TaskResearch
+from subgraphs.supervisor_obs.circuit_breaker import CircuitBreaker
+from subgraphs.supervisor_obs.prefetch import ToolResultCache, is_read_only_tool
 from textwrap import dedent
+from pydantic import BaseModel, Field, SkipValidation, ValidationError
 
 def create_register_observability_note_for_agent(agent_name : str):
     """
@@ -20,7 +25,7 @@ def create_register_observability_note_for_agent(agent_name : str):
     agregado con la finalidad de mantener una coherencia entre el responsable de generar la nota de observabilidad, evitando sesgos por 
     parte del modelo.
     """
-    @tool
+    @tool(response_format="content_and_artifact")
     def register_observability_note(
     # Core fields  
     severity: Literal["info", "warning", "critical"], 
@@ -50,7 +55,7 @@ def create_register_observability_note_for_agent(agent_name : str):
     # Additional context  
     tags: Optional[List[str]],
     confidence_score: Optional[float]
-    ) -> ObservabilityNoteInjectedAgent:
+    ) -> Tuple[str , ObservabilityNoteInjectedAgent]:
         """
         Herramienta utilizada para registrar una nota de observabilidad sobre la tarea.  
         Esta nota permite documentar hallazgos, métricas y contexto relacionado con la
@@ -77,8 +82,9 @@ def create_register_observability_note_for_agent(agent_name : str):
             confidence_score (Optional[float]): Nivel de confianza (0 a 1) en la precisión del hallazgo.
 
         Returns:
-            ObservabilityNoteInjectedAgent: Objeto estandarizado que encapsula toda la información
-            registrada sobre el hallazgo de observabilidad, incluyendo el nombre del agente que lo reporta.
+            Tuple[str, ObservabilityNoteInjectedAgent]: Mensaje de confirmación para el modelo y, como artifact,
+            el objeto estandarizado que encapsula toda la información registrada sobre el hallazgo de
+            observabilidad, incluyendo el nombre del agente que lo reporta.
         """
         new_obervability_note = ObservabilityNoteInjectedAgent(
             agent_name=agent_name,
@@ -100,10 +106,127 @@ def create_register_observability_note_for_agent(agent_name : str):
             tags=tags,
             confidence_score=confidence_score
             )
-        return new_obervability_note
+        return f"Nota de observabilidad registrada ({severity}): {description}" , new_obervability_note
     return register_observability_note
 
-        
+
+
+class ObservabilityNotesBatchInput(BaseModel):
+    # SkipValidation conserva el JSON schema de ObservabilityNote para el modelo, pero la validación
+    # se hace item por item dentro de la herramienta para reportar errores individuales
+    notes : List[SkipValidation[ObservabilityNote]] = Field(description="Lista de notas de observabilidad a registrar en una sola llamada")
+
+def create_register_observability_notes_batch_for_agent(agent_name : str):
+    """
+    Variante por lotes de `create_register_observability_note_for_agent`, devuelve una tool que registra
+    varias notas en una sola llamada, inyectando el nombre del agente en cada una. Las notas válidas
+    se registran aunque otras del lote fallen, informando los errores por item al modelo.
+    """
+    @tool(args_schema=ObservabilityNotesBatchInput , response_format="content_and_artifact")
+    def register_observability_notes(notes : List[ObservabilityNote]) -> Tuple[str , List[ObservabilityNoteInjectedAgent]]:
+        """
+        Herramienta utilizada para registrar VARIAS notas de observabilidad en una sola llamada.
+        Úsala cuando identifiques más de un hallazgo, cada nota tiene exactamente los mismos campos
+        que `register_observability_note` (severity y description obligatorios, el resto opcionales).
+
+        Args:
+            notes (List[ObservabilityNote]): Lista de hallazgos a registrar.
+
+        Returns:
+            Tuple[str, List[ObservabilityNoteInjectedAgent]]: Resumen de las notas registradas con los
+            errores de validación por item y, como artifact, las notas válidas con el nombre del agente.
+        """
+        registered : List[ObservabilityNoteInjectedAgent] = []
+        errors : List[str] = []
+        for index, raw_note in enumerate(notes):
+            payload = raw_note.model_dump() if isinstance(raw_note , BaseModel) else raw_note
+            try:
+                if not isinstance(payload , dict):
+                    raise TypeError(f"se esperaba un objeto, se recibió {type(payload).__name__}")
+                registered.append(ObservabilityNoteInjectedAgent(**{**payload , "agent_name" : agent_name}))
+            except (ValidationError , TypeError) as e:
+                errors.append(f"- item {index}: {' '.join(str(e).split())}")
+        summary = f"Notas de observabilidad registradas: {len(registered)}/{len(notes)}"
+        if errors:
+            summary += "\nErrores de validación (corrige y vuelve a registrar solo estos items):\n" + "\n".join(errors)
+        return summary , registered
+    return register_observability_notes
+
+def with_tool_limits(
+    base_tool : BaseTool ,
+    semaphore : Callable[[] , asyncio.Semaphore] ,
+    timeout : Optional[float] ,
+    breaker : Optional[CircuitBreaker] = None ,
+    cache : Optional[ToolResultCache] = None
+) -> BaseTool:
+    """
+    Envuelve una herramienta (típicamente MCP) para que su ejecución asíncrona respete el semáforo
+    del servidor y un timeout por herramienta. El semáforo se resuelve en cada llamada, ya que
+    depende del event loop en curso (ver `ServerSemaphores`). Al vencer el timeout la llamada en curso se cancela
+    y se devuelve un resultado de error estructurado en vez de bloquear el resto de las llamadas
+    del mismo AIMessage, que el `ToolNode` ejecuta concurrentemente y devuelve en orden.
+
+    Con un `CircuitBreaker` el timeout se ajusta a la latencia observada del servidor y, si el
+    circuito está abierto, la llamada falla de inmediato con un resultado "unavailable".
+
+    Con un `ToolResultCache` las tools de solo lectura reutilizan resultados recientes o prefetch en vuelo.
+    """
+    def as_result(content : str):
+        return (content , None) if base_tool.response_format == "content_and_artifact" else content
+
+    async def limited_coroutine(**kwargs : Any):
+        if cache is not None and is_read_only_tool(base_tool):
+            return await cache.get_or_run(base_tool.name , kwargs , lambda: execute(**kwargs))
+        return await execute(**kwargs)
+
+    async def execute(**kwargs : Any):
+        if breaker is not None and not await breaker.allow():
+            return as_result(breaker.unavailable_result())
+        try:
+            return await limited_call(**kwargs)
+        except BaseException:
+            # Llamada cancelada antes de registrar su resultado, si actuaba como sonda se libera el half-open
+            if breaker is not None:
+                breaker.abandon_probe()
+            raise
+
+    async def limited_call(**kwargs : Any):
+        call_timeout = breaker.adaptive_timeout(timeout) if breaker is not None else timeout
+        async with semaphore():
+            started = time.monotonic()
+            try:
+                if base_tool.coroutine is not None:
+                    # Llamada directa para conservar el formato content_and_artifact de la tool original
+                    result = await asyncio.wait_for(base_tool.coroutine(**kwargs) , call_timeout)
+                else:
+                    result = await asyncio.wait_for(base_tool.ainvoke(kwargs) , call_timeout)
+            except asyncio.TimeoutError:
+                if breaker is not None:
+                    breaker.record_failure()
+                return as_result(f"Error: la herramienta {base_tool.name} excedió el timeout de {call_timeout}s y fue cancelada")
+            except ToolException:
+                # El servidor respondió con un error de la herramienta, el servidor está disponible
+                if breaker is not None:
+                    breaker.record_success(time.monotonic() - started)
+                raise
+            except Exception:
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            if breaker is not None:
+                breaker.record_success(time.monotonic() - started)
+            return result
+
+    return StructuredTool(
+        name=base_tool.name,
+        description=base_tool.description,
+        args_schema=base_tool.args_schema,
+        func=getattr(base_tool , "func" , None),
+        coroutine=limited_coroutine,
+        response_format=base_tool.response_format,
+        metadata=base_tool.metadata,
+    )
+
 def create_handoff_research_tool(
     agent_name: str,
     description: str,
@@ -190,10 +313,11 @@ def create_handoff_research_tool(
                 # (similar al comportamiento de create_handoff_tool)
                 handoff_messages = state["messages"][:-1]
 
+            # El presupuesto no se reescribe, su reducer solo acepta reemplazos al inicializar
             return Command(
                 goto=agent_name,
                 graph=Command.PARENT,
-                update={**state, "messages": handoff_messages},
+                update={**{key : value for key, value in state.items() if key != "budget"}, "messages": handoff_messages},
             )
 
     # Metadata para poder identificar el destino del handoff desde fuera si es necesario
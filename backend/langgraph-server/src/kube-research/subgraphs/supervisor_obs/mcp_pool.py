@@ -0,0 +1,255 @@
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from mcp import ClientSession
+from typing import Any, Dict, Optional
+from importlib.util import find_spec
+import asyncio
+import attrs
+import httpx
+import time
+import weakref
+
+# HTTP/2 requiere el extra `httpx[http2]` (paquete h2), si no está instalado se usa HTTP/1.1 con keep-alive
+HTTP2_AVAILABLE = find_spec("h2") is not None
+POOLED_TRANSPORTS = ("streamable_http" , "sse")
+
+@attrs.define
+class PoolLimits:
+    max_connections : int = 20
+    max_keepalive_connections : int = 10
+    keepalive_expiry : float = 60.0
+    idle_timeout : float = 300.0
+    health_check_interval : float = 30.0
+    health_check_timeout : float = 5.0
+    request_timeout : float = 30.0
+    max_concurrent_calls : int = 4
+
+    def httpx_client_factory(self):
+        """Factory compatible con `McpHttpClientFactory` que configura keep-alive, HTTP/2 y límite de conexiones."""
+        def factory(headers : Optional[Dict[str , str]] = None , timeout : Optional[httpx.Timeout] = None , auth : Optional[httpx.Auth] = None) -> httpx.AsyncClient:
+            return httpx.AsyncClient(
+                headers=headers,
+                timeout=timeout or httpx.Timeout(self.request_timeout),
+                auth=auth,
+                http2=HTTP2_AVAILABLE,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry
+                )
+            )
+        return factory
+
+@attrs.define
+class ServerPoolMetrics:
+    sessions_opened : int = 0
+    sessions_evicted : int = 0
+    health_checks_failed : int = 0
+    calls : int = 0
+    errors : int = 0
+    in_flight : int = 0
+    setup_seconds : float = 0.0
+    last_used : float = attrs.field(factory=time.monotonic)
+
+class ServerSemaphores:
+    """
+    Semáforos de llamadas concurrentes por servidor MCP, compartidos por todos los agentes del mismo
+    servidor. Un `asyncio.Semaphore` queda ligado al event loop en el que se usa por primera vez, por
+    lo que se crean por `(loop, server_id)` y se liberan junto con el loop.
+    """
+    def __init__(self , max_concurrency : int) -> None:
+        self.max_concurrency = max_concurrency
+        self.__by_loop : "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop , Dict[str , asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+    def get(self , server_id : str) -> asyncio.Semaphore:
+        semaphores = self.__by_loop.setdefault(asyncio.get_running_loop() , dict())
+        if server_id not in semaphores:
+            semaphores[server_id] = asyncio.Semaphore(self.max_concurrency)
+        return semaphores[server_id]
+
+class PooledSession:
+    """
+    Proxy con la interfaz de `ClientSession` usada por `load_mcp_tools` (`list_tools`, `call_tool`) y el snapshot del clúster (`list_resources`, `read_resource`).
+    Cada llamada obtiene la sesión viva del servidor desde el pool, abriéndola de nuevo si fue
+    desalojada por inactividad o por un health check fallido, por lo que las tools cargadas con
+    este proxy sobreviven al reciclaje de sesiones.
+    """
+    def __init__(self , pool : "MCPConnectionPool" , server_id : str) -> None:
+        self.pool = pool
+        self.server_id = server_id
+
+    async def __call(self , method : str , *args , **kwargs) -> Any:
+        metrics = self.pool.metrics_for(self.server_id)
+        session = await self.pool.acquire(self.server_id)
+        metrics.calls += 1
+        metrics.in_flight += 1
+        try:
+            return await getattr(session , method)(*args , **kwargs)
+        except Exception:
+            metrics.errors += 1
+            raise
+        finally:
+            metrics.in_flight -= 1
+            metrics.last_used = time.monotonic()
+
+    async def list_tools(self , *args , **kwargs):
+        return await self.__call("list_tools" , *args , **kwargs)
+
+    async def call_tool(self , *args , **kwargs):
+        return await self.__call("call_tool" , *args , **kwargs)
+
+    async def list_resources(self , *args , **kwargs):
+        return await self.__call("list_resources" , *args , **kwargs)
+
+    async def read_resource(self , *args , **kwargs):
+        return await self.__call("read_resource" , *args , **kwargs)
+
+    async def send_ping(self):
+        return await self.__call("send_ping")
+
+class MCPConnectionPool:
+    """
+    Pool de sesiones MCP con una sesión persistente por servidor compartida por todos los agentes y
+    solicitudes. Las conexiones HTTP se configuran con keep-alive, HTTP/2 (si está disponible) y un
+    límite de conexiones, un loop de fondo hace ping a las sesiones y desaloja las inactivas o caídas.
+
+    Cada sesión vive dentro de su propia tarea de asyncio, porque los transportes de `mcp` usan
+    cancel scopes de anyio que deben abrirse y cerrarse en la misma tarea.
+
+    ```text
+    ResearchAgent A ──┐                     ┌──────────────────────────────┐
+    ResearchAgent B ──┼──▶ PooledSession ──▶│ server_id -> ClientSession   │──▶ MCP server (keep-alive)
+    ResearchAgent C ──┘                     │ health check / idle eviction │
+                                            └──────────────────────────────┘
+    ```
+    """
+    def __init__(self , connections : Dict[str , Dict[str , Any]] , limits : Optional[PoolLimits] = None) -> None:
+        self.limits = limits or PoolLimits()
+        pooled_connections = dict()
+        for server_id, connection in connections.items():
+            connection = dict(connection)
+            if connection.get("transport") in POOLED_TRANSPORTS:
+                connection.setdefault("httpx_client_factory" , self.limits.httpx_client_factory())
+            pooled_connections[server_id] = connection
+        self.client = MultiServerMCPClient(connections=pooled_connections)
+        self.__sessions : Dict[str , ClientSession] = dict()
+        self.__session_tasks : Dict[str , asyncio.Task] = dict()
+        self.__stop_events : Dict[str , asyncio.Event] = dict()
+        self.__locks : Dict[str , asyncio.Lock] = dict()
+        self.__metrics : Dict[str , ServerPoolMetrics] = {server_id : ServerPoolMetrics() for server_id in pooled_connections}
+        self.__health_task : Optional[asyncio.Task] = None
+        self.__loop : Optional[asyncio.AbstractEventLoop] = None
+        self.semaphores = ServerSemaphores(self.limits.max_concurrent_calls)
+
+    def session(self , server_id : str) -> PooledSession:
+        if server_id not in self.client.connections:
+            raise ValueError(f"Servidor MCP no configurado: {server_id}")
+        return PooledSession(self , server_id)
+
+    def metrics_for(self , server_id : str) -> ServerPoolMetrics:
+        return self.__metrics[server_id]
+
+    def metrics(self) -> Dict[str , Dict[str , Any]]:
+        now = time.monotonic()
+        return {
+            server_id : {
+                **attrs.asdict(metrics , filter=lambda attribute, _: attribute.name != "last_used"),
+                "open" : server_id in self.__sessions,
+                "idle_seconds" : round(now - metrics.last_used , 2)
+            }
+            for server_id, metrics in self.__metrics.items()
+        }
+
+    def __bind_loop(self) -> None:
+        """
+        Las sesiones viven en tareas del loop que las abrió. Si el pool se usa desde otro loop (nodos
+        síncronos que corren con `asyncio.run`), las sesiones anteriores se descartan y se reabren.
+        """
+        loop = asyncio.get_running_loop()
+        if self.__loop is loop:
+            return
+        self.__loop = loop
+        self.__sessions.clear()
+        self.__session_tasks.clear()
+        self.__stop_events.clear()
+        self.__locks.clear()
+        self.__health_task = None
+
+    async def acquire(self , server_id : str) -> ClientSession:
+        self.__bind_loop()
+        session = self.__sessions.get(server_id)
+        if session is not None:
+            return session
+        lock = self.__locks.setdefault(server_id , asyncio.Lock())
+        async with lock:
+            if server_id not in self.__sessions:
+                await self.__open(server_id)
+        self.__ensure_health_loop()
+        return self.__sessions[server_id]
+
+    async def __open(self , server_id : str) -> None:
+        started = time.monotonic()
+        ready = asyncio.get_running_loop().create_future()
+        stop = asyncio.Event()
+
+        async def hold_session():
+            session = None
+            try:
+                async with self.client.session(server_id) as session:
+                    ready.set_result(session)
+                    await stop.wait()
+            except Exception as e:
+                if not ready.done():
+                    ready.set_exception(e)
+            finally:
+                # Solo se retira si no fue reemplazada por una sesión nueva mientras se cerraba
+                if session is not None and self.__sessions.get(server_id) is session:
+                    self.__sessions.pop(server_id)
+
+        self.__stop_events[server_id] = stop
+        self.__session_tasks[server_id] = asyncio.create_task(hold_session() , name=f"mcp-session-{server_id}")
+        self.__sessions[server_id] = await ready
+        metrics = self.__metrics[server_id]
+        metrics.sessions_opened += 1
+        metrics.setup_seconds += time.monotonic() - started
+        metrics.last_used = time.monotonic()
+
+    async def evict(self , server_id : str) -> None:
+        self.__sessions.pop(server_id , None)
+        stop = self.__stop_events.pop(server_id , None)
+        task = self.__session_tasks.pop(server_id , None)
+        if stop is not None:
+            stop.set()
+        if task is not None:
+            await asyncio.gather(task , return_exceptions=True)
+            self.__metrics[server_id].sessions_evicted += 1
+
+    def __ensure_health_loop(self) -> None:
+        if self.__health_task is None or self.__health_task.done():
+            self.__health_task = asyncio.create_task(self.__health_loop() , name="mcp-pool-health")
+
+    async def __health_loop(self) -> None:
+        while self.__sessions:
+            await asyncio.sleep(self.limits.health_check_interval)
+            now = time.monotonic()
+            for server_id, session in list(self.__sessions.items()):
+                metrics = self.__metrics[server_id]
+                if metrics.in_flight == 0 and now - metrics.last_used > self.limits.idle_timeout:
+                    await self.evict(server_id)
+                    continue
+                try:
+                    await asyncio.wait_for(session.send_ping() , self.limits.health_check_timeout)
+                except Exception:
+                    metrics.health_checks_failed += 1
+                    await self.evict(server_id)
+
+    async def aclose(self) -> None:
+        if self.__loop is not asyncio.get_running_loop():
+            # Las sesiones pertenecen a otro loop (ya cerrado), no hay nada que esperar
+            self.__bind_loop()
+            return
+        if self.__health_task is not None:
+            self.__health_task.cancel()
+            await asyncio.gather(self.__health_task , return_exceptions=True)
+        for server_id in list(self.__session_tasks):
+            await self.evict(server_id)
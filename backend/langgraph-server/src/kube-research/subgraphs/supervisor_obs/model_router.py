@@ -0,0 +1,121 @@
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from typing import Callable, Deque, Dict, List, Literal, Optional, Sequence
+from collections import deque
+import attrs
+import threading
+
+Route = Literal["fast" , "reasoning"]
+COMPLEX_TASK_KEYWORDS = ("causa raíz" , "root cause" , "correlaciona" , "correlación" , "tendencia" , "capacidad" , "compara")
+NOTE_TOOLS = ("register_observability_note" , "register_observability_notes")
+
+@attrs.define(frozen=True)
+class RouteSignals:
+    """Señales de un turno del agente usadas por las reglas de ruteo."""
+    step : int # Turnos del agente ya ejecutados en esta subtarea
+    last_round_tool_calls : int # Resultados de herramientas que el modelo debe procesar en este turno
+    last_round_tools : Sequence[str]
+    last_round_errors : int
+    task_complexity : int # Heurística: 0 simple, 1 media, 2 compleja
+
+    @classmethod
+    def from_state(cls , agent_name : str , messages : Sequence[BaseMessage] , task : str) -> "RouteSignals":
+        last_round : List[ToolMessage] = []
+        for message in reversed(messages):
+            if not isinstance(message , ToolMessage):
+                break
+            last_round.append(message)
+        complexity = sum(keyword in task.lower() for keyword in COMPLEX_TASK_KEYWORDS) + (len(task) > 1500)
+        return cls(
+            step=sum(1 for message in messages if isinstance(message , AIMessage) and message.name == agent_name),
+            last_round_tool_calls=len(last_round),
+            last_round_tools=tuple(message.name or "" for message in last_round),
+            last_round_errors=sum(
+                1 for message in last_round
+                if message.status == "error" or str(message.content).startswith("Error") or '"status": "unavailable"' in str(message.content)
+            ),
+            task_complexity=min(complexity , 2)
+        )
+
+@attrs.define(frozen=True)
+class RoutingRule:
+    name : str
+    route : Route
+    when : Callable[[RouteSignals] , bool]
+
+def default_routing_rules() -> List[RoutingRule]:
+    """
+    Reglas por defecto, evaluadas en orden (gana la primera que aplica):
+
+    1. El primer turno planifica la investigación de la subtarea → reasoning.
+    2. La ronda anterior tuvo errores o servidores no disponibles → reasoning, hay que replantear.
+    3. Tareas complejas (causa raíz, correlaciones, tendencias) con muchos resultados por analizar → reasoning.
+    4. La ronda anterior solo registró notas → fast, normalmente el agente está cerrando.
+    5. El resto de turnos (elegir la siguiente herramienta obvia, registrar hallazgos) → fast.
+    """
+    return [
+        RoutingRule("first_step" , "reasoning" , lambda signals: signals.step == 0),
+        RoutingRule("tool_errors" , "reasoning" , lambda signals: signals.last_round_errors > 0),
+        RoutingRule(
+            "complex_analysis" , "reasoning" ,
+            lambda signals: signals.task_complexity >= 2 or (signals.task_complexity == 1 and signals.last_round_tool_calls >= 3)
+        ),
+        RoutingRule(
+            "notes_only" , "fast" ,
+            lambda signals: bool(signals.last_round_tools) and all(tool in NOTE_TOOLS for tool in signals.last_round_tools)
+        ),
+    ]
+
+@attrs.define
+class RouteStats:
+    calls : int = 0
+    total_seconds : float = 0.0
+    latencies : Deque[float] = attrs.field(factory=lambda: deque(maxlen=500))
+    rules : Dict[str , int] = attrs.field(factory=dict)
+
+    def snapshot(self) -> Dict[str , object]:
+        ordered = sorted(self.latencies)
+        def percentile(p : float) -> Optional[float]:
+            return round(ordered[min(int(len(ordered) * p) , len(ordered) - 1)] , 3) if ordered else None
+        return {
+            "calls" : self.calls,
+            "avg_seconds" : round(self.total_seconds / self.calls , 3) if self.calls else None,
+            "p50_seconds" : percentile(0.5),
+            "p95_seconds" : percentile(0.95),
+            "rules" : dict(self.rules)
+        }
+
+@attrs.define
+class ModelRouter:
+    """
+    Política de ruteo de modelos por turno para los agentes de investigación. Decide entre el modelo
+    rápido (`one_shot_llm`) y el de razonamiento a partir de `RouteSignals`, con reglas configurables
+    y estadísticas de latencia por ruta.
+    """
+    reasoning_llm : BaseChatModel
+    fast_llm : BaseChatModel
+    rules : List[RoutingRule] = attrs.field(factory=default_routing_rules)
+    default_route : Route = attrs.field(default="fast")
+    stats : Dict[Route , RouteStats] = attrs.field(factory=lambda: {"fast" : RouteStats() , "reasoning" : RouteStats()})
+    _lock : threading.Lock = attrs.field(factory=threading.Lock)
+
+    def models(self) -> Dict[Route , BaseChatModel]:
+        return {"fast" : self.fast_llm , "reasoning" : self.reasoning_llm}
+
+    def select(self , signals : RouteSignals) -> tuple[Route , str]:
+        """Devuelve la ruta elegida y el nombre de la regla que la decidió."""
+        for rule in self.rules:
+            if rule.when(signals):
+                return rule.route , rule.name
+        return self.default_route , "default"
+
+    def record(self , route : Route , rule : str , seconds : float) -> None:
+        with self._lock:
+            stats = self.stats[route]
+            stats.calls += 1
+            stats.total_seconds += seconds
+            stats.latencies.append(seconds)
+            stats.rules[rule] = stats.rules.get(rule , 0) + 1
+
+    def snapshot(self) -> Dict[str , Dict[str , object]]:
+        return {route : stats.snapshot() for route, stats in self.stats.items()}
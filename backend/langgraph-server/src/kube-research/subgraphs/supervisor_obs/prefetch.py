@@ -0,0 +1,122 @@
+from langchain_core.tools import BaseTool
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import asyncio
+import attrs
+import json
+import re
+import time
+
+# Prefijos de tools de solo lectura que se pueden ejecutar de forma especulativa sin efectos secundarios
+READ_ONLY_PREFIXES = ("get_" , "list_" , "describe_" , "query_" , "health_check")
+MUTATING_KEYWORDS = ("scale" , "restart" , "delete" , "create" , "update" , "patch" , "apply" , "exec")
+# Orden de preferencia de las tools sin argumentos obligatorios al comenzar una sección
+PREFETCH_PRIORITY = ("health_check" , "get_resource_usage")
+# Respuestas de error estructuradas: las del circuit breaker ("unavailable") y las de los servidores MCP
+# (`{"status":"error","errorType":"unavailable"|"timeout"|...}`), ambas con `status` como primera clave
+ERROR_STATUS = re.compile(r'^\s*\{\s*"status"\s*:\s*"(?:error|unavailable)"')
+# Consultas PromQL probables según palabras clave del objetivo de la sección
+PROMQL_HINTS : Tuple[Tuple[Tuple[str , ...] , str] , ...] = (
+    (("memoria" , "memory") , "node_memory_MemAvailable_bytes"),
+    (("cpu" , "procesador") , "node_cpu_seconds_total"),
+    (("reinicio" , "restart" , "crash") , "kube_pod_container_status_restarts_total"),
+    (("pod" , "disponibilidad" , "availability") , "kube_pod_status_ready"),
+    (("http" , "request" , "tráfico" , "latencia") , "http_requests_total"),
+)
+
+def is_read_only_tool(tool : BaseTool) -> bool:
+    name = tool.name.lower()
+    return name.startswith(READ_ONLY_PREFIXES) and not any(keyword in name for keyword in MUTATING_KEYWORDS)
+
+def required_args(tool : BaseTool) -> List[str]:
+    schema = tool.args_schema if isinstance(tool.args_schema , dict) else (tool.args_schema.model_json_schema() if tool.args_schema else {})
+    return list(schema.get("required" , []))
+
+def normalize_args(args : Dict[str , Any]) -> str:
+    """Clave canónica de los argumentos: sin valores None y con claves ordenadas."""
+    return json.dumps({key : value for key, value in args.items() if value is not None} , sort_keys=True , default=str)
+
+def call_key(tool_name : str , args : Dict[str , Any]) -> str:
+    """Identificador de una llamada (tool y argumentos normalizados) que se puede guardar en el estado."""
+    return f"{tool_name}:{normalize_args(args)}"
+
+def infer_prefetch_calls(objective : str , tools : List[BaseTool] , max_calls : int = 4) -> List[Tuple[BaseTool , Dict[str , Any]]]:
+    """
+    Infiere las primeras llamadas de solo lectura que un agente probablemente hará para una sección:
+    tools de diagnóstico sin argumentos obligatorios (`health_check`, `get_resource_usage`) y tools de
+    consulta con un único argumento `query`, rellenado con PromQL según las palabras clave del objetivo.
+    """
+    objective = objective.lower()
+    read_only = [tool for tool in tools if is_read_only_tool(tool)]
+    calls : List[Tuple[BaseTool , Dict[str , Any]]] = []
+
+    no_args = [tool for tool in read_only if not required_args(tool)]
+    no_args.sort(key=lambda tool: PREFETCH_PRIORITY.index(tool.name) if tool.name in PREFETCH_PRIORITY else len(PREFETCH_PRIORITY))
+    calls.extend((tool , {}) for tool in no_args if tool.name in PREFETCH_PRIORITY)
+
+    query_tools = [tool for tool in read_only if required_args(tool) == ["query"]]
+    for keywords, promql in PROMQL_HINTS:
+        if any(keyword in objective for keyword in keywords):
+            calls.extend((tool , {"query" : promql}) for tool in query_tools)
+    return calls[:max_calls]
+
+@attrs.define
+class ToolResultCache:
+    """
+    Caché de resultados de tools de solo lectura con TTL. Guarda la tarea en curso (no solo el resultado)
+    para que una llamada del agente que coincide con un prefetch aún en vuelo espere ese mismo resultado
+    en vez de repetir la llamada. Los resultados con error no se conservan, las entradas vencidas se
+    podan en cada inserción y sobre `max_entries` se descartan las más antiguas.
+    """
+    ttl : float = 60.0
+    max_entries : int = 256
+    hits : int = 0
+    misses : int = 0
+    _entries : Dict[Tuple[str , str] , Tuple[float , asyncio.Task]] = attrs.field(factory=dict)
+
+    @staticmethod
+    def is_error(result : Any) -> bool:
+        content = result[0] if isinstance(result , tuple) else result
+        return isinstance(content , str) and (content.startswith("Error") or ERROR_STATUS.match(content) is not None)
+
+    async def get_or_run(self , tool_name : str , args : Dict[str , Any] , run : Callable[[] , Awaitable[Any]]) -> Any:
+        key = (tool_name , normalize_args(args))
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            self.hits += 1
+            task = entry[1]
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(run())
+            # Una tarea que falla o se cancela (p. ej. al cerrarse el loop de `asyncio.run`) sale de la caché
+            task.add_done_callback(lambda done: (done.cancelled() or done.exception() is not None) and self.__evict(key , done))
+            self._entries.pop(key , None)
+            self.__prune()
+            self._entries[key] = (time.monotonic() , task)
+        # shield: si el turno que espera se cancela, el prefetch compartido sigue su curso
+        result = await asyncio.shield(task)
+        if self.is_error(result):
+            self.__evict(key , task)
+        return result
+
+    def __prune(self) -> None:
+        """Elimina las entradas vencidas y, si se supera `max_entries`, las más antiguas (orden de inserción)."""
+        now = time.monotonic()
+        for key in [key for key, (stored_at , _) in self._entries.items() if now - stored_at >= self.ttl]:
+            self._entries.pop(key)
+        while len(self._entries) >= self.max_entries:
+            self._entries.pop(next(iter(self._entries)))
+
+    def __evict(self , key : Tuple[str , str] , task : asyncio.Task) -> None:
+        if key in self._entries and self._entries[key][1] is task:
+            self._entries.pop(key)
+
+    def prefetch(self , calls : List[Tuple[BaseTool , Dict[str , Any]]]) -> List[asyncio.Task]:
+        """Lanza concurrentemente las llamadas inferidas, la caché se llena a través de `get_or_run` de cada tool."""
+        tasks = [asyncio.ensure_future(tool.ainvoke(args)) for tool, args in calls]
+        for task in tasks:
+            # Los errores del prefetch se ignoran, el agente repetirá la llamada si la necesita
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return tasks
+
+    def snapshot(self) -> Dict[str , Any]:
+        return {"entries" : len(self._entries) , "hits" : self.hits , "misses" : self.misses}
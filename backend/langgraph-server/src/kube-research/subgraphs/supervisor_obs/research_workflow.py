@@ -1,11 +1,11 @@
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.tools import BaseTool
 from langchain_core.runnables import RunnableSerializable
-from langchain_core.messages import BaseMessage, AIMessage , ToolMessage, filter_messages
+from langchain_core.messages import BaseMessage, AIMessage , ToolMessage
 from langchain_core.tools.render import render_text_description_and_args
 from langchain_core.prompts import ChatPromptTemplate
 
-from typing import Optional, List, Literal, TypedDict, Annotated , Sequence
+from typing import Optional, List, Literal, TypedDict, Annotated , Sequence, Dict, NotRequired, Union
 
 from langgraph.graph import StateGraph, add_messages
 from langgraph.graph.state import CompiledStateGraph
@@ -15,13 +15,23 @@ from langgraph.typing import ContextT
 from langgraph.runtime import Runtime
 from langgraph._internal._runnable import RunnableCallable
 
-from pydantic import BaseModel , Field , PrivateAttr
+from pydantic import BaseModel , ConfigDict , Field , PrivateAttr
 from textwrap import dedent
 from pathlib import Path
 import tomllib
+import time
 
-from utils.schemas import TaskResearch, ObservabilityNoteInjectedAgent
-from subgraphs.supervisor_obs.common_tools import create_register_observability_note_for_agent
+from utils.schemas import TaskResearch, ObservabilityNoteInjectedAgent, InvestigationBudget, BudgetUsage, consume_budget
+from utils.notes import render_notes, merge_notes, NoteStore
+from subgraphs.supervisor_obs.common_tools import (
+    create_register_observability_note_for_agent,
+    create_register_observability_notes_batch_for_agent,
+    with_tool_limits,
+)
+from subgraphs.supervisor_obs.circuit_breaker import get_circuit_breaker
+from subgraphs.supervisor_obs.mcp_pool import ServerSemaphores
+from subgraphs.supervisor_obs.model_router import ModelRouter, Route, RouteSignals
+from subgraphs.supervisor_obs.prefetch import ToolResultCache, call_key, infer_prefetch_calls
 
 PROMPT_PATH = Path(__file__).parent.parent.parent / "prompts.toml"
 
@@ -37,58 +47,151 @@ def factory_prompt_template() -> str:
 class ResearchSchema(TypedDict):
     messages : Annotated[Sequence[BaseMessage], add_messages] #Lista de mensajes que puede visualizar el agente
     current_task : str # La tarea actual que el agente de investigación debe realizar
-    current_notes : List[ObservabilityNoteInjectedAgent] #Notas de investigaciones que se han hecho en el proceso de investigación
+    current_notes : Annotated[NoteStore , merge_notes] #Notas de investigaciones que se han hecho en el proceso de investigación, deduplicadas por recurso y métrica
+    budget : Annotated[InvestigationBudget , consume_budget] #Presupuesto de la investigación, cada llamada al modelo o a herramientas lo descuenta
+    cluster_context : NotRequired[Optional[str]] #Snapshot compartido del clúster recolectado una vez por reporte
+    prefetched_calls : NotRequired[List[str]] #Llamadas especulativas ya descontadas del presupuesto que el agente aún no ha consumido
+
+class ResearchHandoffSchema(TypedDict):
+    messages : Annotated[Sequence[BaseMessage], add_messages]
+    current_task : str
+    current_notes : Annotated[NoteStore , merge_notes]
+    budget : Union[InvestigationBudget , BudgetUsage] #Entra el presupuesto vigente del supervisor y sale solo el consumo del agente
+    cluster_context : NotRequired[Optional[str]]
+
+def usage_from_response(response : AIMessage) -> BudgetUsage:
+    """Consumo de una respuesta del modelo a partir de su `usage_metadata` (si el proveedor lo reporta)."""
+    usage = response.usage_metadata or {}
+    return BudgetUsage(tokens=usage.get("total_tokens" , 0) , llm_calls=1)
+
+def budget_exhausted_message(agent_name : str , reason : str) -> AIMessage:
+    return AIMessage(
+        content=f"Presupuesto de la investigación agotado por {reason}. Finalizo con las notas registradas hasta ahora.",
+        name=agent_name
+    )
 
 class ResearchAgent(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
     agent_name : str
     agent_description : str
     model : BaseChatModel
+    router : Optional[ModelRouter] = Field(default=None, description="Política de ruteo entre el modelo rápido y el de razonamiento por turno, si es None se usa siempre `model`")
     tools : Optional[List[BaseTool]] = Field(default=[])
+    server_id : Optional[str] = Field(default=None, description="Servidor MCP de las tools, comparte el límite de concurrencia entre agentes")
+    max_tool_concurrency : int = Field(default=4, description="Máximo de llamadas concurrentes al servidor MCP, si no se entregan `semaphores` compartidos")
+    semaphores : Optional[ServerSemaphores] = Field(default=None, description="Semáforos por servidor compartidos entre agentes, normalmente los del `MCPConnectionPool`")
+    tool_timeout : Optional[float] = Field(default=30.0, description="Timeout por defecto en segundos para cada tool")
+    tool_timeouts : Dict[str , float] = Field(default_factory=dict, description="Timeouts específicos por nombre de tool")
+    prefetch : bool = Field(default=True, description="Ejecuta especulativamente las primeras tools de solo lectura mientras corre el primer turno del modelo")
+    max_prefetch_calls : int = Field(default=4)
+    tool_cache_ttl : float = Field(default=60.0, description="Segundos que se reutiliza el resultado de una tool de solo lectura")
     __description_tools : Optional[str] = PrivateAttr(default=None)
     __prompt : ChatPromptTemplate = PrivateAttr(default_factory=factory_prompt_template)
     __llm_runnable : RunnableSerializable = PrivateAttr()
+    __routed_runnables : Dict[str , RunnableSerializable] = PrivateAttr(default_factory=dict)
+    __fixed_tools : List[BaseTool] = PrivateAttr(default_factory=list)
+    __limited_tools_cache : List[BaseTool] = PrivateAttr(default_factory=list)
+    __tool_cache : Optional[ToolResultCache] = PrivateAttr(default=None)
+    __research_graph : Optional[CompiledStateGraph] = PrivateAttr(default=None)
 
-    def __build_runnable(self) -> RunnableSerializable:
-        fixed_tools = [create_register_observability_note_for_agent(agent_name=f"{self.agent_name}")]
-        return self.__prompt | self.model.bind_tools(tools=self.tools + fixed_tools)
+    def __build_runnable(self , model : Optional[BaseChatModel] = None) -> RunnableSerializable:
+        return self.__prompt | (model or self.model).bind_tools(tools=self.tools + self.__fixed_tools)
 
     def model_post_init(self, context) -> None:
+        self.__fixed_tools = [
+            create_register_observability_note_for_agent(agent_name=f"{self.agent_name}"),
+            create_register_observability_notes_batch_for_agent(agent_name=f"{self.agent_name}")
+        ]
         self.__llm_runnable = self.__build_runnable()
+        self.__tool_cache = ToolResultCache(ttl=self.tool_cache_ttl)
+        if self.router is not None:
+            self.__routed_runnables = {route : self.__build_runnable(model) for route, model in self.router.models().items()}
         self.__description_tools = render_text_description_and_args(self.tools)
 
             
 
+    def __prompt_input(self , state : ResearchSchema) -> Dict[str , str]:
+        return {
+            "agent_name" : f"{self.agent_name}" , 
+            "agent_description" : f"{self.agent_description}",
+            "specialized_tools" : f"{self.__description_tools}",
+            "current_task" : f"{state["current_task"]}",
+            "current_notes" : render_notes(state["current_notes"]),
+            "cluster_context" : state.get("cluster_context") or "No disponible"
+            }
+
+    def __select_runnable(self , state : ResearchSchema) -> tuple[RunnableSerializable , Optional[Route] , Optional[str]]:
+        """Runnable del turno según el router (si está configurado), junto a la ruta y la regla aplicada."""
+        if self.router is None:
+            return self.__llm_runnable , None , None
+        signals = RouteSignals.from_state(self.agent_name , state["messages"] , f"{state["current_task"]}")
+        route, rule = self.router.select(signals)
+        return self.__routed_runnables[route] , route , rule
+
+    def __exhausted_update(self , state : ResearchSchema) -> Optional[ResearchSchema]:
+        """Si el presupuesto se agotó, el agente termina sin invocar al modelo conservando sus notas."""
+        budget = state.get("budget")
+        reason = budget.exhausted_reason() if budget is not None else None
+        if reason is None:
+            return None
+        return {
+            "messages" : [budget_exhausted_message(self.agent_name , reason)]
+        }
+
     def call_model(self , state : ResearchSchema , config) -> ResearchSchema:
-        response = self.__llm_runnable.invoke(
-            input={
-                "agent_name" : f"{self.agent_name}" , 
-                "agent_description" : f"{self.agent_description}",
-                "specialized_tools" : f"{self.__description_tools}",
-                "current_task" : f"{state["current_task"]}",
-                "current_notes" : f"{state["current_notes"]}"
-                },
+        exhausted = self.__exhausted_update(state)
+        if exhausted is not None:
+            return exhausted
+        runnable, route, rule = self.__select_runnable(state)
+        started = time.monotonic()
+        response = runnable.invoke(
+            input=self.__prompt_input(state),
             config=config
             )
+        if route is not None:
+            self.router.record(route , rule , time.monotonic() - started)
         response.name = self.agent_name
         return {
-            "messages" : [response]
+            "messages" : [response],
+            "budget" : usage_from_response(response)
         }
 
     async def acall_model(self , state : ResearchSchema , context : Runtime[ContextT]) -> ResearchSchema:
-            response = await self.__llm_runnable.ainvoke(
-                input={
-                    "agent_name" : f"{self.agent_name}" , 
-                    "agent_description" : f"{self.agent_description}",
-                    "specialized_tools" : f"{self.__description_tools}",
-                    "current_task" : f"{state["current_task"]}",
-                    "current_notes" : f"{state["current_notes"]}"
-                    }
+            exhausted = self.__exhausted_update(state)
+            if exhausted is not None:
+                return exhausted
+            update : ResearchSchema = {}
+            prefetch_usage = BudgetUsage()
+            if self.prefetch and not any(isinstance(message , AIMessage) and message.name == self.agent_name for message in state["messages"]):
+                # Primer turno: las tools probables corren mientras el modelo decide y llenan la caché
+                calls = infer_prefetch_calls(f"{state["current_task"]}" , self.__limited_tools_cache , self.max_prefetch_calls)
+                budget = state.get("budget")
+                if budget is not None and budget.max_tool_calls is not None:
+                    calls = calls[:max(budget.max_tool_calls - budget.used.tool_calls , 0)]
+                # Las llamadas especulativas llegan al servidor y se descuentan al lanzarse aunque el agente no las
+                # use, cuando el agente las repite y la caché las sirve `push_note_hook` no las vuelve a descontar
+                self.__tool_cache.prefetch(calls)
+                prefetch_usage = BudgetUsage(tool_calls=len(calls))
+                update["prefetched_calls"] = [call_key(tool.name , args) for tool, args in calls]
+            runnable, route, rule = self.__select_runnable(state)
+            started = time.monotonic()
+            response = await runnable.ainvoke(
+                input=self.__prompt_input(state)
                 )
+            if route is not None:
+                self.router.record(route , rule , time.monotonic() - started)
             response.name = self.agent_name
             return {
-                "messages" : [response]
+                **update,
+                "messages" : [response],
+                "budget" : usage_from_response(response) + prefetch_usage
             }
 
+    @property
+    def tool_cache_stats(self) -> Dict[str , int]:
+        """Entradas, aciertos y fallos de la caché de resultados de tools (incluye los prefetch)."""
+        return self.__tool_cache.snapshot()
+
     def should_continue(self, state : ResearchSchema) -> Literal["tools" , "__end__"]:
         last_message = state["messages"][-1]
         if isinstance(last_message , AIMessage) and last_message.tool_calls:
@@ -96,19 +199,85 @@ class ResearchAgent(BaseModel):
         return "__end__"
 
     def push_note_hook(self , state : ResearchSchema) -> ResearchSchema:
-        last_tool_messages : list[ToolMessage] = filter_messages(messages=state["messages"] , include_types=ToolMessage)
-        if len(last_tool_messages) == 0:
-            return state
-        last_message = last_tool_messages[-1]
-        if last_message.name == "register_observability_note" and isinstance(last_message.content , ObservabilityNoteInjectedAgent):
-            return {
-                "current_notes" : state["current_notes"] + [last_message.content]
-            }
-        return state
+        """
+        Recolecta las notas registradas en la última ronda de herramientas (los ToolMessage posteriores
+        al último AIMessage) y devuelve solo las notas nuevas, el reducer `merge_notes` las fusiona en el estado.
+        También descuenta del presupuesto las llamadas a herramientas de la ronda, salvo las que repiten
+        un prefetch, que ya se descontó al lanzarse.
+        """
+        new_notes : list[ObservabilityNoteInjectedAgent] = []
+        prefetched = list(state.get("prefetched_calls") or [])
+        pending_prefetch = len(prefetched)
+        round_messages : list[ToolMessage] = []
+        round_calls : Dict[str , dict] = {}
+        for message in reversed(state["messages"]):
+            if not isinstance(message , ToolMessage):
+                if isinstance(message , AIMessage):
+                    round_calls = {call["id"] : call for call in message.tool_calls}
+                break
+            round_messages.append(message)
+        tool_calls = 0
+        for message in round_messages:
+            call = round_calls.get(message.tool_call_id)
+            key = call_key(call["name"] , call["args"]) if call is not None else None
+            if key in prefetched:
+                prefetched.remove(key)
+            else:
+                tool_calls += 1
+            if message.name == "register_observability_note" and isinstance(message.artifact , ObservabilityNoteInjectedAgent):
+                new_notes.append(message.artifact)
+            elif message.name == "register_observability_notes" and isinstance(message.artifact , list):
+                # Se invierte para conservar el orden del lote al revertir la lista completa
+                new_notes.extend(reversed(message.artifact))
+        update : ResearchSchema = {"budget" : BudgetUsage(tool_calls=tool_calls)}
+        if len(prefetched) != pending_prefetch:
+            update["prefetched_calls"] = prefetched
+        if new_notes:
+            update["current_notes"] = list(reversed(new_notes))
+        return update
 
     
+    def __limited_tools(self) -> List[BaseTool]:
+        """
+        Tools especializadas envueltas con el semáforo del servidor, su timeout correspondiente y el
+        circuit breaker del servidor, que usa la tool `health_check` (si existe) como sonda en half-open.
+        """
+        server_id = self.server_id or self.agent_name
+        semaphores = self.semaphores or ServerSemaphores(self.max_tool_concurrency)
+        semaphore = lambda: semaphores.get(server_id)
+        health_check = next((tool for tool in self.tools if tool.name == "health_check") , None)
+        breaker = get_circuit_breaker(
+            server_id ,
+            probe=(lambda: health_check.ainvoke({})) if health_check is not None else None
+        )
+        return [
+            with_tool_limits(tool , semaphore , self.tool_timeouts.get(tool.name , self.tool_timeout) , breaker , self.__tool_cache)
+            for tool in self.tools
+        ]
+
+    @staticmethod
+    def __handoff_output(state : ResearchHandoffSchema , result : ResearchSchema) -> ResearchHandoffSchema:
+        """Salida hacia el supervisor: mensajes y notas del agente, y como presupuesto solo lo que consumió."""
+        return {
+            "messages" : result["messages"],
+            "current_notes" : result["current_notes"],
+            "budget" : result["budget"].used - state["budget"].used
+        }
+
+    def handoff(self , state : ResearchHandoffSchema , config) -> ResearchHandoffSchema:
+        return self.__handoff_output(state , self.__research_graph.invoke(state , config))
+
+    async def ahandoff(self , state : ResearchHandoffSchema , config) -> ResearchHandoffSchema:
+        return self.__handoff_output(state , await self.__research_graph.ainvoke(state , config))
+
     def compile(self) -> CompiledStateGraph:
-        tool_node = ToolNode(self.tools)
+        """
+        Compila el agente envuelto en un grafo de handoff: el supervisor recibe el consumo del agente
+        como `BudgetUsage` y no su copia del presupuesto, de modo que los handoffs paralelos se suman
+        en vez de sobrescribirse.
+        """
+        self.__limited_tools_cache = self.__limited_tools()
+        tool_node = ToolNode(self.__limited_tools_cache + self.__fixed_tools)
         research_workflow = StateGraph(state_schema=ResearchSchema)
         research_workflow.add_node("llm_call" , RunnableCallable(self.call_model , self.acall_model))
         research_workflow.add_node("tools" , tool_node)
@@ -117,4 +286,9 @@ class ResearchAgent(BaseModel):
         research_workflow.add_edge("tools" , "push_note_hook")
         research_workflow.add_edge("push_note_hook" , "llm_call")
         research_workflow.add_conditional_edges("llm_call" , self.should_continue)
-        return research_workflow.compile(debug=True , name=self.agent_name)
\ No newline at end of file
+        self.__research_graph = research_workflow.compile(debug=True , name=self.agent_name)
+        handoff_workflow = StateGraph(state_schema=ResearchHandoffSchema)
+        handoff_workflow.add_node("research" , RunnableCallable(self.handoff , self.ahandoff))
+        handoff_workflow.set_entry_point("research")
+        handoff_workflow.set_finish_point("research")
+        return handoff_workflow.compile(name=self.agent_name)
\ No newline at end of file
@@ -1,23 +1,28 @@
-from typing import Any, Annotated, List , Dict, Optional, Self
+from typing import Any, Annotated, List , Dict, NotRequired, Optional, Self
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate , PromptTemplate
 from langchain_community.tools import BaseTool
 from langchain_mcp_adapters.sessions import Connection
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
 from langgraph_supervisor import create_supervisor
 
 from langgraph.graph.state import CompiledStateGraph
 from langgraph.prebuilt.chat_agent_executor import AgentState
 from langgraph.runtime import Runtime
 
-from pydantic import BaseModel, Field, PrivateAttr
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
 from textwrap import dedent
 from pathlib import Path
 import tomllib
 
 from subgraphs.supervisor_obs.common_tools import create_register_observability_note_for_agent, create_handoff_research_tool
-from subgraphs.supervisor_obs.research_workflow import ResearchAgent
-from utils.schemas import TaskResearch
+from subgraphs.supervisor_obs.research_workflow import ResearchAgent, usage_from_response, budget_exhausted_message
+from subgraphs.supervisor_obs.mcp_pool import MCPConnectionPool, PoolLimits
+from subgraphs.supervisor_obs.circuit_breaker import circuit_breakers_snapshot
+from subgraphs.supervisor_obs.model_router import ModelRouter
+from utils.schemas import TaskResearch, InvestigationBudget, consume_budget
+from utils.notes import render_notes, merge_notes, NoteStore
+from utils.prompt_cache import PromptCacheStats, cacheable_system_message
 PROMPT_PATH = Path(__file__).parent.parent.parent / "prompts.toml"
 with open(PROMPT_PATH, "rb") as f:
     PROMPTS = tomllib.load(f)
@@ -40,8 +45,12 @@ class AgentConfig(BaseModel):
 
 class SupervisorState(AgentState):
     current_task : TaskResearch
+    budget : Annotated[InvestigationBudget , consume_budget]
+    cluster_context : NotRequired[Optional[str]]
+    current_notes : Annotated[NoteStore , merge_notes] #Notas que devuelven los agentes de investigación de la sección
 
 class SupervisorBuilder(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
     reasoning_llm : BaseChatModel
     one_shot_llm : BaseChatModel
     config_agents : Annotated[
@@ -51,36 +60,75 @@ class SupervisorBuilder(BaseModel):
             este serializable se obtiene directamente de la base de datos al momento de construir el grafo
             """
     )]
-    __mcp_connections : Optional[MultiServerMCPClient] = PrivateAttr(default=None)
+    model_router : Optional[ModelRouter] = Field(default=None, description="Política de ruteo de modelos de los agentes, por defecto usa one_shot_llm como modelo rápido")
+    pool_limits : PoolLimits = Field(default_factory=PoolLimits, description="Límites del pool de sesiones MCP compartido por los agentes")
+    mcp_pool : Optional[MCPConnectionPool] = Field(default=None, description="Pool de sesiones MCP externo (p. ej. el del researcher), si es None el builder crea y cierra el suyo")
+    __mcp_connections : Optional[MCPConnectionPool] = PrivateAttr(default=None)
     __sub_agents_ctx : Dict[str,str] = PrivateAttr(default_factory=dict)
     __sub_agents : Dict[str , CompiledStateGraph]= PrivateAttr(default_factory=dict)
     __is_built : bool = PrivateAttr(default=False)
+    __stable_prompt : Optional[Dict[str , Any]] = PrivateAttr(default=None)
+    __cache_stats : PromptCacheStats = PrivateAttr(default_factory=PromptCacheStats)
 
     def __dynamic_prompt(self , state : SupervisorState , config : Dict[str , Any]) -> ChatPromptTemplate:
-        """Callable interno de la clase, totalmente privado encargado de la construcción de un SystemPrompt para el agente supervisor"""
-        
-        prompt = PromptTemplate(
-            template=PROMPTS["supervisor"]["base_research_supervisor"],
+        """
+        Callable interno de la clase, totalmente privado encargado de la construcción de un SystemPrompt para el agente supervisor.
+
+        El prompt se divide en un prefijo estable (rol, agentes y proceso de delegación), que se
+        formatea una sola vez en `compile` y se marca como cacheable, y un sufijo volátil con la
+        tarea y las notas actuales que se agrega al final para no invalidar el prefijo ni el historial.
+        El sufijo se envía como mensaje de usuario, de modo que el único mensaje de sistema sea el inicial.
+        """
+        volatile_prompt = PromptTemplate(
+            template=PROMPTS["supervisor"]["base_research_supervisor_state"],
             input_variables=[
-                "agents_ctx",
                 "current_notes",
                 "current_task",
+                "cluster_context",
             ]
         )
-        task_dump = state["current_task"].model_dump(exclude={"observability_notes"})
-        prompt_format = prompt.format(
-            current_notes=state["current_task"].observability_notes,
+        task_dump = state["current_task"].model_dump(exclude={"observability_notes" , "budget"})
+        volatile_format = volatile_prompt.format(
+            current_notes=render_notes(state.get("current_notes") or state["current_task"].observability_notes),
             current_task=task_dump,
-            agents_ctx=self.__sub_agents_ctx
+            cluster_context=state.get("cluster_context") or "No disponible"
+        )
+        return [self.__stable_prompt] + state["messages"] + [{"role": "user", "content": volatile_format}]
+
+    def __budget_hook(self , state : SupervisorState) -> Dict[str , Any]:
+        """
+        Post model hook del supervisor: descuenta la llamada al modelo del presupuesto y, si este se agotó,
+        reemplaza la respuesta (mismo id) por una sin handoffs para que el supervisor termine con las notas actuales.
+        """
+        last_message = state["messages"][-1]
+        usage = usage_from_response(last_message)
+        reason = state["budget"].consume(usage).exhausted_reason() if state.get("budget") is not None else None
+        if reason is None or not last_message.tool_calls:
+            return {"budget" : usage}
+        closing = budget_exhausted_message(last_message.name , reason)
+        closing.id = last_message.id
+        return {"messages" : [closing] , "budget" : usage}
+
+    def __build_stable_prompt(self) -> Self:
+        stable_prompt = PromptTemplate(
+            template=PROMPTS["supervisor"]["base_research_supervisor"],
+            input_variables=["agents_ctx"]
+        )
+        self.__stable_prompt = cacheable_system_message(
+            stable_prompt.format(agents_ctx=self.__sub_agents_ctx),
+            self.one_shot_llm
         )
-        return [{"role": "system", "content": prompt_format}] + state["messages"]
+        return self
 
     def __build_mcp_connections(self) -> Self:
+        if self.mcp_pool is not None:
+            self.__mcp_connections = self.mcp_pool
+            return self
         connections = dict()
         for conf in self.config_agents:
             connections[conf.mcp_connection.id] = conf.mcp_connection.connection_args
-        self.__mcp_connections = MultiServerMCPClient(connections=connections)
-        print(f"CONNECTIONS : {self.__mcp_connections}")
+        self.__mcp_connections = MCPConnectionPool(connections=connections , limits=self.pool_limits)
+        print(f"CONNECTIONS : {self.__mcp_connections.client}")
         return self
 
 
@@ -102,13 +150,19 @@ class SupervisorBuilder(BaseModel):
         para los subagentes espcializados.
         """
         agents : Dict[str , CompiledStateGraph] = dict()
+        if self.model_router is None:
+            self.model_router = ModelRouter(reasoning_llm=self.reasoning_llm , fast_llm=self.one_shot_llm)
         for agent in self.config_agents:
-            mcp_tools : list[BaseTool] = await self.__mcp_connections.get_tools(server_name=agent.mcp_connection.id)
+            # Las tools quedan ligadas a la sesión persistente del pool en vez de abrir una sesión por llamada
+            mcp_tools : list[BaseTool] = await load_mcp_tools(self.__mcp_connections.session(agent.mcp_connection.id))
             research_agent = ResearchAgent(
                 agent_name=agent.name,
                 agent_description=agent.description,
                 model=self.reasoning_llm,
-                tools=mcp_tools
+                router=self.model_router,
+                tools=mcp_tools,
+                server_id=agent.mcp_connection.id,
+                semaphores=self.__mcp_connections.semaphores
             ).compile()
             agents[agent.name] = research_agent
             self.__sub_agents_ctx[agent.name] = agent.description
@@ -142,16 +196,50 @@ class SupervisorBuilder(BaseModel):
             ))
 
 
+        self.__build_stable_prompt()
+        supervisor_model = self.one_shot_llm.model_copy(
+            update={"callbacks" : list(self.one_shot_llm.callbacks or []) + [self.__cache_stats]}
+        )
         supervisor_agent = create_supervisor(
-            model=self.one_shot_llm,
+            model=supervisor_model,
             agents=list(self.__sub_agents.values()),
             tools=handoff_tools,
             prompt=self.__dynamic_prompt,
             state_schema=SupervisorState,
+            post_model_hook=self.__budget_hook,
             supervisor_name=name
         )
         return supervisor_agent.compile(name=name)
     
+    async def aclose(self) -> None:
+        """Cierra las sesiones MCP persistentes del pool, salvo que el pool sea externo."""
+        if self.__mcp_connections is not None and self.__mcp_connections is not self.mcp_pool:
+            await self.__mcp_connections.aclose()
+
+    @property
+    def mcp_pool_metrics(self) -> Dict[str , Dict[str , Any]]:
+        """Métricas por servidor MCP del pool de sesiones (sesiones abiertas, desalojos, llamadas, tiempo de setup)."""
+        return self.__mcp_connections.metrics() if self.__mcp_connections is not None else {}
+
+    @property
+    def circuit_breakers(self) -> Dict[str , Dict[str , object]]:
+        """Estado de los circuit breakers por servidor MCP (estado, fallas consecutivas, timeout adaptativo)."""
+        return {
+            server_id : snapshot
+            for server_id, snapshot in circuit_breakers_snapshot().items()
+            if server_id in {agent.mcp_connection.id for agent in self.config_agents}
+        }
+
+    @property
+    def routing_stats(self) -> Dict[str , Dict[str , object]]:
+        """Llamadas, latencias (promedio, p50, p95) y reglas aplicadas por ruta de modelo de los agentes."""
+        return self.model_router.snapshot() if self.model_router is not None else {}
+
+    @property
+    def prompt_cache_stats(self) -> Dict[str , float]:
+        """Tokens de entrada y tokens leídos desde la caché de prompts en los turnos del supervisor."""
+        return self.__cache_stats.snapshot()
+
     @property
     def is_ready(self) -> bool:
         """Indica si el builder está listo para compilar."""
@@ -0,0 +1,107 @@
+from subgraphs.supervisor_obs.mcp_pool import MCPConnectionPool, PooledSession
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+
+# Recursos y tools de descubrimiento que todas las secciones necesitan, se consultan una vez por reporte
+SNAPSHOT_RESOURCES = ("k8s://cluster/info" , "k8s://nodes" , "prometheus://alerts")
+SNAPSHOT_TOOLS = ("health_check" ,)
+
+def _parse_text(contents : List[Any]) -> Any:
+    text = next((getattr(content , "text" , None) for content in contents if getattr(content , "text" , None)) , None)
+    if text is None:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+async def _collect_server(session : PooledSession , timeout : float) -> Dict[str , Any]:
+    facts : Dict[str , Any] = dict()
+    resources, tools = await asyncio.gather(
+        asyncio.wait_for(session.list_resources() , timeout),
+        asyncio.wait_for(session.list_tools() , timeout),
+        return_exceptions=True
+    )
+    available_resources = {str(resource.uri) for resource in resources.resources} if not isinstance(resources , BaseException) else set()
+    available_tools = {tool.name for tool in tools.tools} if not isinstance(tools , BaseException) else set()
+
+    async def read(uri : str):
+        result = await asyncio.wait_for(session.read_resource(uri) , timeout)
+        return uri , _parse_text(result.contents)
+
+    async def call(name : str):
+        result = await asyncio.wait_for(session.call_tool(name , {}) , timeout)
+        return name , result.structuredContent or _parse_text(result.content)
+
+    jobs = [read(uri) for uri in SNAPSHOT_RESOURCES if uri in available_resources]
+    jobs += [call(name) for name in SNAPSHOT_TOOLS if name in available_tools]
+    for outcome in await asyncio.gather(*jobs , return_exceptions=True):
+        if not isinstance(outcome , BaseException):
+            facts[outcome[0]] = outcome[1]
+    return facts
+
+async def collect_cluster_snapshot(pool : MCPConnectionPool , timeout : float = 10.0) -> Dict[str , Dict[str , Any]]:
+    """
+    Consulta concurrentemente en todos los servidores MCP del pool los recursos y tools de descubrimiento
+    (`SNAPSHOT_RESOURCES`, `SNAPSHOT_TOOLS`) que cada servidor expone. Los servidores que fallan o
+    exceden el timeout se omiten, el snapshot nunca detiene el reporte. Las sesiones quedan abiertas
+    en el pool para las secciones.
+    """
+    server_ids = list(pool.client.connections)
+    if not server_ids:
+        return dict()
+    results = await asyncio.gather(
+        *(_collect_server(pool.session(server_id) , timeout) for server_id in server_ids),
+        return_exceptions=True
+    )
+    return {
+        server_id : facts
+        for server_id, facts in zip(server_ids , results)
+        if not isinstance(facts , BaseException) and facts
+    }
+
+def render_cluster_snapshot(snapshot : Dict[str , Dict[str , Any]]) -> Optional[str]:
+    """
+    Contexto compartido y compacto del clúster para los prompts de los agentes:
+
+    ```text
+    cluster: test-cluster v1.28.2 | nodos 3 | pods 9 | servicios 5 | deployments 5 | namespaces: default, kube-system
+    nodos: node-1(Ready, control-plane) node-2(Ready, worker) node-3(Ready, worker)
+    alertas activas: HighMemoryUsage[warning] High memory usage on node-2 | PodRestartLoop[critical](pending) Pod restart detected
+    health <server>: Healthy
+    ```
+    """
+    facts : Dict[str , Any] = dict()
+    health : Dict[str , Any] = dict()
+    for server_id, server_facts in snapshot.items():
+        for key, value in server_facts.items():
+            if key in SNAPSHOT_TOOLS:
+                health[server_id] = value
+            else:
+                facts[key] = value
+    lines : List[str] = []
+
+    info = facts.get("k8s://cluster/info")
+    if isinstance(info , dict):
+        lines.append(
+            f"cluster: {info.get('cluster_name')} {info.get('version')} | nodos {info.get('nodes')} | pods {info.get('total_pods')}"
+            f" | servicios {info.get('total_services')} | deployments {info.get('total_deployments')}"
+            f" | namespaces: {', '.join(info.get('namespaces' , []))}"
+        )
+    nodes = facts.get("k8s://nodes")
+    if isinstance(nodes , dict) and nodes.get("nodes"):
+        lines.append("nodos: " + " ".join(f"{node['name']}({node['status']}, {node['roles']})" for node in nodes["nodes"]))
+    alerts = facts.get("prometheus://alerts")
+    if isinstance(alerts , dict):
+        active = [alert for alert in alerts.get("alerts" , []) if alert.get("state") in ("firing" , "pending")]
+        lines.append("alertas activas: " + (" | ".join(
+            f"{alert['name']}[{alert.get('labels' , {}).get('severity' , '?')}]"
+            + ("" if alert["state"] == "firing" else f"({alert['state']})")
+            + f" {alert.get('annotations' , {}).get('summary' , '')}"
+            for alert in active
+        ) or "ninguna"))
+    for server_id, status in health.items():
+        overall = status.get("overall_status") if isinstance(status , dict) else status
+        lines.append(f"health {server_id}: {overall}")
+    return "\n".join(lines) if lines else None
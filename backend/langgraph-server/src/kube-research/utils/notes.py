@@ -0,0 +1,284 @@
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from pydantic import BaseModel, Field, PrivateAttr
+import zlib
+from utils.schemas import ObservabilityNote, ObservabilityNoteInjectedAgent
+
+# Abreviaturas de los campos de ObservabilityNote usados al renderizar notas en los prompts
+NOTE_KEY_ABBREVIATIONS : Dict[str , str] = {
+    "agent_name" : "by",
+    "severity" : "sev",
+    "description" : "desc",
+    "metric" : "m",
+    "metric_value" : "val",
+    "metric_threshold" : "thr",
+    "metric_unit" : "unit",
+    "category" : "cat",
+    "impact_level" : "imp",
+    "urgency" : "urg",
+    "recommendations" : "rec",
+    "root_cause" : "rc",
+    "status" : "st",
+    "tags" : "tags",
+    "confidence_score" : "conf",
+}
+# Campos que se renderizan en la cabecera del grupo o que no aportan al razonamiento del modelo
+NOTE_GROUP_FIELDS = ("namespace" , "resource_type" , "resource_name")
+NOTE_SKIPPED_FIELDS = {"timestamp"}
+SEVERITY_RANK = {"critical" : 0 , "warning" : 1 , "info" : 2}
+DEFAULT_NOTES_TOKEN_BUDGET = 2000
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text : str) -> int:
+    """Estimación aproximada de tokens (~4 caracteres por token) sin depender de un tokenizador."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _format_value(value) -> str:
+    if isinstance(value , float):
+        return f"{value:g}"
+    if isinstance(value , (list , tuple)):
+        return "|".join(str(item) for item in value)
+    return str(value)
+
+def _render_note(note : ObservabilityNote) -> str:
+    fields = note.model_dump(exclude_none=True , exclude=set(NOTE_GROUP_FIELDS) | NOTE_SKIPPED_FIELDS)
+    if fields.get("status") == "new":
+        # "new" es el valor por defecto, no aporta información
+        fields.pop("status")
+    parts = [
+        f"{NOTE_KEY_ABBREVIATIONS.get(key , key)}={_format_value(value)}"
+        for key, value in fields.items()
+        if value not in ("" , [])
+    ]
+    return "- " + "; ".join(parts)
+
+def _group_key(note : ObservabilityNote) -> Tuple[str , str , str]:
+    return (note.namespace or "-" , note.resource_type or "-" , note.resource_name or "-")
+
+def render_notes(
+    notes : Iterable[ObservabilityNote],
+    token_budget : Optional[int] = DEFAULT_NOTES_TOKEN_BUDGET
+) -> str:
+    """
+    Renderiza las notas de observabilidad en un formato compacto para inyectarlas en los prompts.
+
+    - Omite campos vacíos, el timestamp y los valores por defecto.
+    - Agrupa las notas por recurso `[namespace/resource_type/resource_name]`.
+    - Abrevia las claves repetidas según una leyenda (`NOTE_KEY_ABBREVIATIONS`).
+    - Respeta un presupuesto de tokens priorizando las notas más severas (y más recientes),
+      indicando cuántas notas se omitieron por severidad.
+
+    ```text
+    claves: by=agent_name, sev=severity, desc=description, ...
+    [default/deployment/api-service]
+    - by=K8's Observer; sev=critical; desc=CrashLoop en 2 pods; m=restart_count; val=5; thr=2
+    [-/node/node-2]
+    - by=Prometheus; sev=warning; desc=Memoria sobre 80%; m=memory_usage; val=85.4; unit=%
+    (3 notas omitidas por presupuesto: info=3)
+    ```
+    """
+    notes = list(notes)
+    if not notes:
+        return "Sin notas registradas."
+
+    ordered = sorted(
+        enumerate(notes),
+        key=lambda item: (SEVERITY_RANK.get(item[1].severity , len(SEVERITY_RANK)) , -item[0])
+    )
+    used_keys = {
+        key
+        for note in notes
+        for key, value in note.model_dump(exclude_none=True).items()
+        if key in NOTE_KEY_ABBREVIATIONS
+    }
+    legend = "claves: " + ", ".join(
+        f"{abbreviation}={key}" for key, abbreviation in NOTE_KEY_ABBREVIATIONS.items() if key in used_keys
+    )
+    used_tokens = estimate_tokens(legend)
+    groups : Dict[Tuple[str , str , str] , List[Tuple[int , str]]] = defaultdict(list)
+    omitted : Dict[str , int] = defaultdict(int)
+
+    for position, note in ordered:
+        key = _group_key(note)
+        line = _render_note(note)
+        cost = estimate_tokens(line) + (0 if key in groups else estimate_tokens("[{}/{}/{}]".format(*key)))
+        if token_budget is not None and used_tokens + cost > token_budget:
+            omitted[note.severity] += 1
+            continue
+        used_tokens += cost
+        groups[key].append((position , line))
+
+    lines = [legend]
+    for key, rendered in groups.items():
+        lines.append("[{}/{}/{}]".format(*key))
+        lines.extend(line for _, line in sorted(rendered))
+    if omitted:
+        summary = ", ".join(f"{severity}={count}" for severity, count in omitted.items())
+        lines.append(f"({sum(omitted.values())} notas omitidas por presupuesto: {summary})")
+    return "\n".join(lines)
+
+
+NoteKey = Tuple[str , ...]
+
+def note_key(note : ObservabilityNote) -> NoteKey:
+    """
+    Identidad de un hallazgo: (namespace, resource_type, resource_name, metric). Las notas sin
+    recurso ni métrica se identifican por su descripción normalizada para no fusionar hallazgos distintos.
+    """
+    if note.resource_name is None and note.metric is None:
+        return ("description" , " ".join(note.description.lower().split()))
+    return (note.namespace or "" , note.resource_type or "" , note.resource_name or "" , note.metric or "")
+
+def merge_note(current : ObservabilityNoteInjectedAgent , incoming : ObservabilityNoteInjectedAgent) -> ObservabilityNoteInjectedAgent:
+    """
+    Fusiona dos notas del mismo hallazgo: prevalecen los campos de la nota más reciente (último valor
+    de la métrica), se conserva la severidad más alta y se unen recomendaciones y etiquetas.
+    """
+    if incoming.timestamp < current.timestamp:
+        current, incoming = incoming, current
+    update = incoming.model_dump(exclude_none=True)
+    if SEVERITY_RANK[current.severity] < SEVERITY_RANK[incoming.severity]:
+        update["severity"] = current.severity
+    for field in ("recommendations" , "tags"):
+        merged = list(dict.fromkeys((getattr(current , field) or []) + (getattr(incoming , field) or [])))
+        if merged:
+            update[field] = merged
+    return current.model_copy(update=update)
+
+# Cubetas en que `NoteStore` reparte las notas, la unidad que se copia al modificar una copia del almacén
+NOTE_BUCKETS = 64
+
+NoteEntry = Tuple[int , ObservabilityNoteInjectedAgent] # (orden de registro, nota)
+NoteIndex = Dict[str , Dict[object , Set[str]]] # índice secundario ("severity" | "category" | "resource") -> valor -> claves
+
+def _bucket_of(key : str) -> int:
+    # crc32 y no hash(): la cubeta de cada clave debe ser la misma en el proceso que restaura el estado
+    return zlib.crc32(key.encode()) % NOTE_BUCKETS
+
+def _index_values(note : ObservabilityNoteInjectedAgent) -> Iterator[Tuple[str , object]]:
+    yield "severity" , note.severity
+    if note.category:
+        yield "category" , note.category
+    yield "resource" , _group_key(note)
+
+def _build_index(bucket : Dict[str , NoteEntry]) -> NoteIndex:
+    index : NoteIndex = {"severity" : defaultdict(set) , "category" : defaultdict(set) , "resource" : defaultdict(set)}
+    for key, (_, note) in bucket.items():
+        for name, value in _index_values(note):
+            index[name][value].add(key)
+    return index
+
+class NoteStore(BaseModel):
+    """
+    Almacén de notas de observabilidad indexado por `note_key`, los duplicados se fusionan con
+    `merge_note`. Mantiene índices secundarios por severidad, categoría y recurso para consultas
+    sin recorrer todas las notas. Se comporta como un iterable de notas en orden de registro.
+
+    Las notas se reparten en `NOTE_BUCKETS` cubetas según su clave, cada una con su propio índice
+    (construido al consultarlo por primera vez). `fork` devuelve una copia que comparte todas las
+    cubetas y cada lado copia una cubeta solo antes de modificarla, así registrar notas sobre una
+    copia cuesta lo que las cubetas tocadas y no el total de notas.
+    """
+    buckets : List[Dict[str , NoteEntry]] = Field(default_factory=lambda: [dict() for _ in range(NOTE_BUCKETS)])
+    registered : int = 0 # notas distintas registradas, da el orden de registro
+    __indexes : List[Optional[NoteIndex]] = PrivateAttr(default_factory=lambda: [None] * NOTE_BUCKETS)
+    __owned : Set[int] = PrivateAttr(default_factory=lambda: set(range(NOTE_BUCKETS))) # cubetas que no comparte con otra copia
+
+    @staticmethod
+    def __store_key(note : ObservabilityNote) -> str:
+        # Las claves del dict deben ser str para que el estado sea serializable por el checkpointer
+        return "|".join(note_key(note))
+
+    def fork(self) -> "NoteStore":
+        """Copia en O(`NOTE_BUCKETS`) que comparte las cubetas con este almacén hasta que alguno las modifica."""
+        store = NoteStore.model_construct(buckets=list(self.buckets) , registered=self.registered)
+        store.__indexes = list(self.__indexes)
+        store.__owned = set()
+        self.__owned = set()
+        return store
+
+    def __writable(self , slot : int) -> Dict[str , NoteEntry]:
+        """Cubeta `slot` lista para modificarse, copiándola (con su índice) si todavía es compartida."""
+        if slot not in self.__owned:
+            self.buckets[slot] = dict(self.buckets[slot])
+            index = self.__indexes[slot]
+            if index is not None:
+                self.__indexes[slot] = {
+                    name : defaultdict(set , {value : set(keys) for value, keys in values.items()})
+                    for name, values in index.items()
+                }
+            self.__owned.add(slot)
+        return self.buckets[slot]
+
+    def add(self , note : ObservabilityNoteInjectedAgent) -> ObservabilityNoteInjectedAgent:
+        key = self.__store_key(note)
+        slot = _bucket_of(key)
+        bucket = self.__writable(slot)
+        index = self.__indexes[slot]
+        entry = bucket.get(key)
+        if entry is not None:
+            position, current = entry
+            if index is not None:
+                for name, value in _index_values(current):
+                    index[name][value].discard(key)
+            note = merge_note(current , note)
+        else:
+            position = self.registered
+            self.registered += 1
+        bucket[key] = (position , note)
+        if index is not None:
+            for name, value in _index_values(note):
+                index[name][value].add(key)
+        return note
+
+    def extend(self , notes : Iterable[ObservabilityNoteInjectedAgent]) -> "NoteStore":
+        for note in notes:
+            self.add(note)
+        return self
+
+    def __lookup(self , name : str , value : object) -> List[ObservabilityNoteInjectedAgent]:
+        notes = []
+        for slot, bucket in enumerate(self.buckets):
+            index = self.__indexes[slot]
+            if index is None:
+                index = self.__indexes[slot] = _build_index(bucket)
+            notes.extend(bucket[key][1] for key in index[name].get(value , ()))
+        return notes
+
+    def by_severity(self , severity : str) -> List[ObservabilityNoteInjectedAgent]:
+        return self.__lookup("severity" , severity)
+
+    def by_category(self , category : str) -> List[ObservabilityNoteInjectedAgent]:
+        return self.__lookup("category" , category)
+
+    def by_resource(
+        self ,
+        namespace : Optional[str] = None ,
+        resource_type : Optional[str] = None ,
+        resource_name : Optional[str] = None
+    ) -> List[ObservabilityNoteInjectedAgent]:
+        return self.__lookup("resource" , (namespace or "-" , resource_type or "-" , resource_name or "-"))
+
+    def __iter__(self) -> Iterator[ObservabilityNoteInjectedAgent]:
+        entries = sorted((entry for bucket in self.buckets for entry in bucket.values()) , key=lambda entry: entry[0])
+        return (note for _, note in entries)
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.buckets)
+
+NoteUpdate = Union[NoteStore , ObservabilityNoteInjectedAgent , Iterable[ObservabilityNoteInjectedAgent] , None]
+
+def merge_notes(current : Optional[NoteStore] , update : NoteUpdate) -> NoteStore:
+    """
+    Reducer de LangGraph para las notas de observabilidad. Los nodos devuelven solo las notas nuevas
+    y el reducer las fusiona sobre un `fork` del almacén existente (las notas no se mutan, `merge_note`
+    devuelve copias), de modo que el valor anterior del canal no cambia y solo se copian las cubetas tocadas.
+    """
+    if isinstance(current , NoteStore) and (update is None or update is current):
+        return current
+    store = current.fork() if isinstance(current , NoteStore) else NoteStore().extend(current or [])
+    if update is None:
+        return store
+    if isinstance(update , ObservabilityNoteInjectedAgent):
+        update = [update]
+    return store.extend(update)
@@ -0,0 +1,66 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import LLMResult
+from typing import Any, Dict
+import threading
+
+# Familias de modelos que requieren marcadores explícitos `cache_control` para cachear el prefijo.
+# OpenAI y DeepSeek cachean prefijos automáticamente, por lo que no necesitan marcadores.
+CACHE_CONTROL_MODEL_HINTS = ("claude", "anthropic/", "gemini")
+
+def supports_cache_control(model : BaseChatModel) -> bool:
+    """Indica si el proveedor del modelo acepta marcadores `cache_control` en los bloques de contenido."""
+    if model._llm_type.startswith("anthropic"):
+        return True
+    model_name = str(getattr(model , "model_name" , None) or getattr(model , "model" , "")).lower()
+    return any(hint in model_name for hint in CACHE_CONTROL_MODEL_HINTS)
+
+def cacheable_system_message(content : str , model : BaseChatModel) -> Dict[str , Any]:
+    """
+    Construye el mensaje de sistema con el prefijo estable del prompt. Si el proveedor lo soporta
+    se marca con `cache_control` para que el prefijo se reutilice entre turnos.
+    """
+    if not supports_cache_control(model):
+        return {"role" : "system" , "content" : content}
+    return {
+        "role" : "system",
+        "content" : [{"type" : "text" , "text" : content , "cache_control" : {"type" : "ephemeral"}}]
+    }
+
+class PromptCacheStats(BaseCallbackHandler):
+    """
+    Callback que acumula los tokens de entrada y los tokens servidos desde la caché de prompts
+    del proveedor, a partir de `usage_metadata.input_token_details` de cada respuesta.
+    """
+    def __init__(self) -> None:
+        self.calls = 0
+        self.input_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_creation_tokens = 0
+        self._lock = threading.Lock()
+
+    def on_llm_end(self , response : LLMResult , **kwargs : Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation , "message" , None) , "usage_metadata" , None)
+                if not usage:
+                    continue
+                details = usage.get("input_token_details") or {}
+                with self._lock:
+                    self.calls += 1
+                    self.input_tokens += usage.get("input_tokens" , 0)
+                    self.cache_read_tokens += details.get("cache_read" , 0) or 0
+                    self.cache_creation_tokens += details.get("cache_creation" , 0) or 0
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.cache_read_tokens / self.input_tokens if self.input_tokens else 0.0
+
+    def snapshot(self) -> Dict[str , float]:
+        return {
+            "calls" : self.calls,
+            "input_tokens" : self.input_tokens,
+            "cache_read_tokens" : self.cache_read_tokens,
+            "cache_creation_tokens" : self.cache_creation_tokens,
+            "hit_ratio" : round(self.hit_ratio , 4)
+        }
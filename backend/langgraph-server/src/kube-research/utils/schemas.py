@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Dict , List , Literal , Optional, Any, Deque
+from typing import Dict , List , Literal , Optional, Any, Deque, Union, Annotated
+import time
 from langgraph.graph import MessagesState
 from subgraphs.planner_research.planner_schemas import PlanSection, PlanArgTool
 
@@ -39,15 +40,97 @@ class ObservabilityNoteInjectedAgent(ObservabilityNote):
     agent_name: str = Field(..., description="Nombre del agente de observabilidad que genera el hallazgo")
     timestamp: datetime = Field(default_factory=datetime.now, description="Fecha y hora del hallazgo")
 
+class BudgetUsage(BaseModel):
+    tokens : int = Field(default=0, description="Tokens consumidos (entrada + salida)")
+    llm_calls : int = Field(default=0, description="Llamadas a modelos")
+    tool_calls : int = Field(default=0, description="Llamadas a herramientas")
+
+    def __add__(self , other : "BudgetUsage") -> "BudgetUsage":
+        return BudgetUsage(
+            tokens=self.tokens + other.tokens,
+            llm_calls=self.llm_calls + other.llm_calls,
+            tool_calls=self.tool_calls + other.tool_calls
+        )
+
+    def __sub__(self , other : "BudgetUsage") -> "BudgetUsage":
+        return BudgetUsage(
+            tokens=self.tokens - other.tokens,
+            llm_calls=self.llm_calls - other.llm_calls,
+            tool_calls=self.tool_calls - other.tool_calls
+        )
+
+class InvestigationBudget(BaseModel):
+    """
+    Presupuesto de una investigación (o de una sección). Los límites en None no se aplican, por lo que
+    `InvestigationBudget()` es un presupuesto ilimitado. El tiempo se mide desde `started_at` (epoch)
+    y es un deadline compartido por todas las secciones derivadas con `split`.
+    """
+    max_tokens : Optional[int] = Field(default=None)
+    max_llm_calls : Optional[int] = Field(default=None)
+    max_tool_calls : Optional[int] = Field(default=None)
+    max_wall_seconds : Optional[float] = Field(default=None)
+    started_at : float = Field(default_factory=time.time)
+    used : BudgetUsage = Field(default_factory=BudgetUsage)
+
+    def consume(self , usage : BudgetUsage) -> "InvestigationBudget":
+        return self.model_copy(update={"used" : self.used + usage})
+
+    def exhausted_reason(self) -> Optional[str]:
+        """Motivo por el que se agotó el presupuesto o None si aún queda presupuesto."""
+        if self.max_tokens is not None and self.used.tokens >= self.max_tokens:
+            return f"tokens ({self.used.tokens}/{self.max_tokens})"
+        if self.max_llm_calls is not None and self.used.llm_calls >= self.max_llm_calls:
+            return f"llamadas al modelo ({self.used.llm_calls}/{self.max_llm_calls})"
+        if self.max_tool_calls is not None and self.used.tool_calls >= self.max_tool_calls:
+            return f"llamadas a herramientas ({self.used.tool_calls}/{self.max_tool_calls})"
+        if self.max_wall_seconds is not None and time.time() - self.started_at >= self.max_wall_seconds:
+            return f"tiempo ({self.max_wall_seconds}s)"
+        return None
+
+    @property
+    def exhausted(self) -> bool:
+        return self.exhausted_reason() is not None
+
+    def split(self , parts : int) -> List["InvestigationBudget"]:
+        """Reparte en partes iguales el presupuesto restante entre `parts` secciones, con el mismo deadline."""
+        def share(limit : Optional[float] , used : float) -> Optional[int]:
+            return None if limit is None else max(int((limit - used) // max(parts , 1)) , 0)
+        return [
+            InvestigationBudget(
+                max_tokens=share(self.max_tokens , self.used.tokens),
+                max_llm_calls=share(self.max_llm_calls , self.used.llm_calls),
+                max_tool_calls=share(self.max_tool_calls , self.used.tool_calls),
+                max_wall_seconds=self.max_wall_seconds,
+                started_at=self.started_at
+            )
+            for _ in range(parts)
+        ]
+
+def consume_budget(current : Optional[InvestigationBudget] , update : Union[InvestigationBudget , BudgetUsage , None]) -> InvestigationBudget:
+    """
+    Reducer de LangGraph para el presupuesto: un `BudgetUsage` descuenta consumo del presupuesto vigente
+    y un `InvestigationBudget` lo reemplaza, lo que se reserva para la inicialización. Los subgrafos que
+    corren en paralelo (handoffs con `Send`) devuelven solo su consumo como `BudgetUsage`, que se suma.
+    """
+    current = current if current is not None else InvestigationBudget()
+    if update is None:
+        return current
+    if isinstance(update , BudgetUsage):
+        return current.consume(update)
+    return update
+
 class TaskResearch(BaseModel):
     id : str
     plan_section : PlanSection
     status : Literal["Pending" , "Done" , "Pass"]
     observability_notes : List[ObservabilityNoteInjectedAgent]
+    budget : Optional[InvestigationBudget] = Field(default=None) #Presupuesto asignado a la sección
 
 class KubeResearcherState(MessagesState):
     plan : Optional[PlanArgTool] #Plan generado por el agente planificador de kubernetes
     queue_tasks : Optional[Deque[TaskResearch]] #Tareas que se enviaran al SWARM
     queue_result_tasks : Optional[Deque[TaskResearch]] #Tareas que ya fueron abordadas por el SWARM
     tools_ctx : str #Contexto de las herramientas
+    budget : Annotated[InvestigationBudget , consume_budget] #Presupuesto global de la investigación
+    cluster_context : Optional[str] #Hechos base del clúster compartidos por todas las secciones (cluster_snapshot)
 
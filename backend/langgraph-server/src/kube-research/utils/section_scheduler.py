@@ -0,0 +1,148 @@
+from utils.schemas import TaskResearch, InvestigationBudget, BudgetUsage
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+import asyncio
+import attrs
+import logging
+
+logger = logging.getLogger(__name__)
+
+SectionRunner = Callable[[TaskResearch , List[TaskResearch]] , Awaitable[TaskResearch]]
+
+@attrs.define
+class SectionDAG:
+    """
+    Grafo de dependencias entre las secciones del plan (`PlanSection.depends_on`). Las aristas hacia
+    secciones inexistentes se ignoran y los ciclos se rompen dejando independientes a sus secciones,
+    por lo que el grafo resultante siempre es un DAG ejecutable.
+
+    La prioridad de cada sección es la longitud del camino crítico que comienza en ella (su costo más
+    el del camino más costoso hacia las secciones que dependen de ella), de modo que las cadenas
+    largas se despachan primero y el tiempo total del reporte tiende a la cadena de dependencias más larga.
+
+    ```text
+    1. Uso de recursos ──┐
+                         ├──▶ 3. Causa raíz ──▶ 4. Recomendaciones     prioridad: 1→3, 2→3, 3→2, 4→1, 5→1
+    2. Alertas ──────────┘
+    5. Inventario (independiente)
+    ```
+    """
+    tasks : Dict[int , TaskResearch]
+    dependencies : Dict[int , Set[int]]
+    dependents : Dict[int , Set[int]] = attrs.field(factory=dict)
+    priority : Dict[int , float] = attrs.field(factory=dict)
+
+    @classmethod
+    def from_tasks(cls , tasks : Iterable[TaskResearch] , cost : Optional[Callable[[TaskResearch] , float]] = None) -> "SectionDAG":
+        tasks = {task.plan_section.number : task for task in tasks}
+        dependencies = {
+            number : {dependency for dependency in task.plan_section.depends_on if dependency in tasks and dependency != number}
+            for number, task in tasks.items()
+        }
+        dag = cls(tasks=tasks , dependencies=dependencies)
+        order = dag.__topological_order()
+        dag.dependents = {number : set() for number in tasks}
+        for number, upstream in dag.dependencies.items():
+            for dependency in upstream:
+                dag.dependents[dependency].add(number)
+        cost = cost or (lambda task: 1.0)
+        for number in reversed(order):
+            dag.priority[number] = cost(tasks[number]) + max((dag.priority[dependent] for dependent in dag.dependents[number]) , default=0.0)
+        return dag
+
+    def __topological_order(self) -> List[int]:
+        """Orden topológico (Kahn), las secciones que quedan en un ciclo pierden sus dependencias entre sí."""
+        pending = {number : set(upstream) for number, upstream in self.dependencies.items()}
+        order : List[int] = []
+        while pending:
+            ready = sorted(number for number, upstream in pending.items() if not upstream)
+            if not ready:
+                cycle = {number for number in pending if self.__reaches(number , number , pending)}
+                logger.warning("Dependencias circulares entre las secciones %s, se ejecutarán sin ellas" , sorted(cycle))
+                for number in cycle:
+                    self.dependencies[number] -= cycle
+                    pending[number] -= cycle
+                continue
+            for number in ready:
+                order.append(number)
+                pending.pop(number)
+            for upstream in pending.values():
+                upstream.difference_update(ready)
+        return order
+
+    @staticmethod
+    def __reaches(source : int , target : int , edges : Dict[int , Set[int]]) -> bool:
+        stack, seen = list(edges[source]) , set()
+        while stack:
+            number = stack.pop()
+            if number == target:
+                return True
+            if number not in seen:
+                seen.add(number)
+                stack.extend(edges.get(number , ()))
+        return False
+
+    def ready(self , finished : Iterable[int] , started : Iterable[int]) -> List[int]:
+        """Secciones con todas sus dependencias terminadas, ordenadas por camino crítico y luego por número."""
+        finished, started = set(finished) , set(started)
+        return sorted(
+            (number for number in self.tasks if number not in finished and number not in started and self.dependencies[number] <= finished),
+            key=lambda number: (-self.priority[number] , number)
+        )
+
+    @property
+    def critical_path_length(self) -> float:
+        return max(self.priority.values() , default=0.0)
+
+async def run_section_dag(
+    dag : SectionDAG ,
+    run_section : SectionRunner ,
+    max_parallel : int = 3 ,
+    budget : Optional[InvestigationBudget] = None
+) -> List[TaskResearch]:
+    """
+    Ejecuta las secciones del DAG con hasta `max_parallel` secciones en paralelo. Cada sección recibe
+    las tareas ya terminadas de las que depende (con sus notas) y, al terminar cualquiera, se despachan
+    las secciones que quedaron listas. Una sección que falla queda con estado "Pass" y sin notas, sin
+    detener a las que dependen de ella. Devuelve las tareas en orden de término.
+
+    Con el presupuesto global (`budget`), el consumo de las secciones terminadas se descuenta de él y,
+    una vez agotado, no se despachan más secciones: las pendientes quedan en "Pass" y solo se esperan
+    las que ya están en curso.
+    """
+    results : Dict[int , TaskResearch] = dict()
+    completed : List[TaskResearch] = []
+    running : Dict[asyncio.Task , int] = dict()
+    spent = BudgetUsage()
+    max_parallel = max(max_parallel , 1)
+    try:
+        while len(results) < len(dag.tasks):
+            reason = budget.consume(spent).exhausted_reason() if budget is not None else None
+            if reason is not None:
+                skipped = [number for number in dag.tasks if number not in results and number not in running.values()]
+                if skipped:
+                    logger.warning("Presupuesto global agotado por %s, las secciones %s no se investigarán" , reason , skipped)
+                for number in skipped:
+                    results[number] = dag.tasks[number].model_copy(update={"status" : "Pass"})
+                    completed.append(results[number])
+            else:
+                for number in dag.ready(results , running.values())[:max_parallel - len(running)]:
+                    upstream = [results[dependency] for dependency in sorted(dag.dependencies[number])]
+                    running[asyncio.create_task(run_section(dag.tasks[number] , upstream) , name=f"section-{number}")] = number
+            if not running:
+                break
+            done, _ = await asyncio.wait(running , return_when=asyncio.FIRST_COMPLETED)
+            for finished in done:
+                number = running.pop(finished)
+                try:
+                    results[number] = finished.result()
+                except Exception:
+                    logger.exception("La sección %s falló, queda en 'Pass'" , number)
+                    results[number] = dag.tasks[number].model_copy(update={"status" : "Pass"})
+                if results[number].budget is not None:
+                    spent = spent + results[number].budget.used
+                completed.append(results[number])
+    finally:
+        # Si el nodo se cancela no quedan secciones huérfanas ejecutándose
+        for pending in running:
+            pending.cancel()
+    return completed
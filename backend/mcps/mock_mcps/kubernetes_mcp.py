@@ -1,12 +1,22 @@
 import json
 import asyncio
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Deque, Dict, List, Optional, Tuple
 from dataclasses import dataclass, asdict
+import os
 import random
+import string
+import time
 import uuid
+import zlib
 
 from fastmcp import FastMCP, Context
+from mcp.types import TextContent
+
+from multiworker import SingleWriter, serve
+from response_encoding import ResponseEncoder, dumps
+from rollout_sim import PodLifecycle, Rollout, RolloutConfig, RolloutJournal, RolloutSimulator, format_age, template_hash
 
 
 @dataclass
@@ -54,13 +64,29 @@ class Node:
     os_image: str
 
 
+# Watch events kept for `watch_events`, older resource versions must re-list like a 410 Gone
+WATCH_HISTORY = 1000
+# How often the writer reveals the simulated rollouts up to the wall clock
+ROLLOUT_TICK_SECONDS = 1.0
+
+
 class MockKubernetesData:
     """Mock data generator for Kubernetes objects"""
     
     def __init__(self):
         self.cluster_name = "test-cluster"
         self.namespaces = ["default", "kube-system", "monitoring", "ingress-nginx"]
+        # Monotonic version of the object store, bumped by every mutation, with the events that bumped it
+        self.resource_version = 1
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=WATCH_HISTORY)
+        # Newest resource version whose event is no longer retained, watches from before it must re-list
+        self.evicted_version = 0
         self._generate_mock_data()
+        # Latest simulated rollout of each deployment, shared with the Prometheus mock through the journal
+        self.rollouts: Dict[str, Rollout] = {}
+        self.simulator = RolloutSimulator(RolloutConfig.from_env(), [node.name for node in self.nodes])
+        self.journal = RolloutJournal.from_env()
+        self._replay()
     
     def _generate_mock_data(self):
         """Generate mock Kubernetes objects for simulation"""
@@ -102,28 +128,265 @@ class MockKubernetesData:
             Service("prometheus-server", "monitoring", "ClusterIP", "10.96.2.50", "<none>", "9090/TCP", "10d"),
         ]
 
+    def snapshot(self) -> bytes:
+        """Serialize the mutable cluster objects and the watch history, shared with the serving workers"""
+        return dumps({
+            "nodes": self.nodes, "deployments": self.deployments, "pods": self.pods, "services": self.services,
+            "resource_version": self.resource_version, "events": list(self.events), "evicted_version": self.evicted_version,
+            "rollouts": self.rollouts
+        })
+
+    def restore(self, payload: bytes):
+        state = json.loads(payload)
+        self.nodes = [Node(**node) for node in state["nodes"]]
+        self.deployments = [Deployment(**deployment) for deployment in state["deployments"]]
+        self.pods = [Pod(**pod) for pod in state["pods"]]
+        self.services = [Service(**service) for service in state["services"]]
+        self.resource_version = state["resource_version"]
+        self.events = deque(state["events"], maxlen=WATCH_HISTORY)
+        self.evicted_version = state["evicted_version"]
+        self.rollouts = {key: Rollout.from_dict(rollout) for key, rollout in state["rollouts"].items()}
+
+    def _replay(self):
+        """Apply the rollouts of previous runs from the journal, so the pods keep matching the Prometheus series"""
+        for rollout in self.journal.read_new():
+            self.rollouts[rollout.key] = rollout
+            deployment = self._deployment(rollout.deployment, rollout.namespace)
+            if deployment:
+                deployment.replicas = rollout.replicas
+        self.advance()
+        self.events.clear()
+        self.evicted_version = self.resource_version
+
+    def _record(self, event_type: str, kind: str, obj: Any):
+        """Bump the resource version and append an ADDED/MODIFIED/DELETED watch event"""
+        self.resource_version += 1
+        if len(self.events) == self.events.maxlen:
+            self.evicted_version = self.events[0]["resourceVersion"]
+        self.events.append({
+            "type": event_type,
+            "kind": kind,
+            "resourceVersion": self.resource_version,
+            "timestamp": datetime.now().isoformat(),
+            "object": asdict(obj)
+        })
+
+    def watch(self, since: int, kinds: Optional[List[str]] = None, namespace: Optional[str] = None, limit: int = 200) -> Dict[str, Any]:
+        """
+        Events after resource version `since`, oldest first, or every retained event when `since` is 0.
+        When more than `limit` match, the returned resourceVersion is the one of the last event so the
+        caller can continue from it.
+        """
+        if 0 < since < self.evicted_version:
+            return {
+                "error": f"resourceVersion {since} is too old, events up to {self.evicted_version} are no longer retained: re-list and watch from its resourceVersion",
+                "code": 410,
+                "resourceVersion": self.resource_version
+            }
+        kinds = {kind.lower() for kind in kinds} if kinds else None
+        matched = [
+            event for event in self.events
+            if event["resourceVersion"] > since
+            and (kinds is None or event["kind"].lower() in kinds)
+            and (namespace in (None, "all") or event["object"].get("namespace") == namespace)
+        ]
+        events = matched[:limit]
+        more = len(matched) > limit
+        return {
+            "resourceVersion": events[-1]["resourceVersion"] if more else self.resource_version,
+            "events": events,
+            "more": more
+        }
+
+    def _deployment(self, name: str, namespace: str) -> Optional[Deployment]:
+        return next((d for d in self.deployments if d.name == name and d.namespace == namespace), None)
+
+    def _deployment_pods(self, deployment: Deployment) -> List[Pod]:
+        return [p for p in self.pods if p.namespace == deployment.namespace and p.name.startswith(f"{deployment.name}-")]
+
+    def _current_pods(self, deployment: Deployment, now_ms: int) -> Tuple[List[PodLifecycle], List[str]]:
+        """Pods a new rollout starts from: those of the previous rollout, or the initial mock pods"""
+        rollout = self.rollouts.get(f"{deployment.namespace}/{deployment.name}")
+        if rollout is not None:
+            return rollout.carried_over(now_ms)
+        pods = []
+        for pod in self._deployment_pods(deployment):
+            ready, containers = (int(count) for count in pod.ready.split("/"))
+            pods.append(PodLifecycle(
+                pod.name, pod.namespace, pod.node, pod.image, containers=containers, base_restarts=pod.restarts,
+                ready_ms=0 if ready == containers else None
+            ))
+        return pods, []
+
+    def _start_rollout(self, deployment: Deployment, reason: str, new_hash: str) -> Rollout:
+        now_ms = int(time.time() * 1000)
+        self.advance(now_ms)
+        key = f"{deployment.namespace}/{deployment.name}"
+        pods, cancelled = self._current_pods(deployment, now_ms)
+        previous = self.rollouts.get(key)
+        revision = (previous.revision if previous else 1) + (reason == "restart")
+        image = pods[-1].image if pods else previous.pods[-1].image if previous and previous.pods else ""
+        rollout = self.simulator.simulate(
+            deployment.name, deployment.namespace, reason, revision, new_hash, image, deployment.replicas,
+            pods, now_ms, seed=zlib.crc32(f"{key}:{revision}:{now_ms}".encode()), cancelled=cancelled
+        )
+        if previous:
+            # The timeline keeps what already happened to the pods it inherits
+            carried = {pod.name for pod in pods}
+            rollout.events[:0] = [event for event in previous.events if event.name in carried and event.at_ms <= now_ms]
+        self.rollouts[key] = rollout
+        self.journal.append(rollout)
+        self.advance(now_ms)
+        return rollout
+
+    def advance(self, now_ms: Optional[int] = None) -> bool:
+        """
+        Bring the pods and deployments of the simulated rollouts up to `now_ms` (the wall clock by default),
+        recording a watch event for every object that changed. Returns whether anything changed.
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        version = self.resource_version
+        for rollout in self.rollouts.values():
+            deployment = self._deployment(rollout.deployment, rollout.namespace)
+            if deployment is None:
+                continue
+            current = {pod.name: pod for pod in self._deployment_pods(deployment)}
+            desired: Dict[str, Pod] = {}
+            for lifecycle in rollout.pods:
+                if not lifecycle.exists(now_ms):
+                    continue
+                existing = current.get(lifecycle.name)
+                ready = lifecycle.containers if lifecycle.is_ready(now_ms) else 0
+                pod = Pod(
+                    lifecycle.name, lifecycle.namespace, lifecycle.status_at(now_ms), f"{ready}/{lifecycle.containers}",
+                    lifecycle.base_restarts + lifecycle.restarts_at(now_ms),
+                    existing.age if existing and lifecycle.created_ms is None else format_age(now_ms - (lifecycle.created_ms or now_ms)),
+                    lifecycle.node_at(now_ms), lifecycle.image
+                )
+                if existing is None:
+                    self._record("ADDED", "Pod", pod)
+                elif (existing.status, existing.ready, existing.restarts, existing.node) != (pod.status, pod.ready, pod.restarts, pod.node):
+                    self._record("MODIFIED", "Pod", pod)
+                else:
+                    pod = existing
+                desired[pod.name] = pod
+            for name, pod in current.items():
+                if name not in desired:
+                    self._record("DELETED", "Pod", pod)
+            if self.resource_version != version:
+                self.pods = [p for p in self.pods if p.name not in current] + list(desired.values())
+
+            serving = [lifecycle for lifecycle in rollout.pods if lifecycle.exists(now_ms) and not lifecycle.terminating(now_ms)]
+            ready = sum(1 for lifecycle in serving if lifecycle.is_ready(now_ms))
+            up_to_date = sum(1 for lifecycle in serving if template_hash(deployment.name, lifecycle.name) == rollout.template_hash)
+            counters = (f"{ready}/{deployment.replicas}", up_to_date, ready)
+            if (deployment.ready, deployment.up_to_date, deployment.available) != counters:
+                deployment.ready, deployment.up_to_date, deployment.available = counters
+                self._record("MODIFIED", "Deployment", deployment)
+        return self.resource_version != version
+
+    def scale_deployment(self, deployment_name: str, namespace: str, replicas: int) -> Dict[str, Any]:
+        """Set the replicas and let the simulated ReplicaSet controller create or delete the pods"""
+        deployment = self._deployment(deployment_name, namespace)
+        
+        if not deployment:
+            return {"error": f"Deployment {deployment_name} not found in namespace {namespace}"}
+        if replicas < 0:
+            return {"error": f"Invalid replicas {replicas}: must be 0 or more"}
+        
+        old_replicas = deployment.replicas
+        deployment.replicas = replicas
+        self._record("MODIFIED", "Deployment", deployment)
+        # Scaling keeps the current pod template, pods left from an unfinished rollout are still replaced
+        previous = self.rollouts.get(f"{namespace}/{deployment_name}")
+        pods = self._deployment_pods(deployment)
+        current_hash = previous.template_hash if previous else template_hash(deployment_name, pods[-1].name) if pods else self._new_template_hash()
+        rollout = self._start_rollout(deployment, "scale", current_hash)
+        
+        return {
+            "success": True,
+            "message": f"Deployment {deployment_name} scaling from {old_replicas} to {replicas} replicas",
+            "deployment": asdict(deployment),
+            "rollout": rollout.report(rollout.started_ms),
+            "resourceVersion": self.resource_version
+        }
+
+    def restart_deployment(self, deployment_name: str, namespace: str) -> Dict[str, Any]:
+        """Roll out a new pod template hash, like `kubectl rollout restart`, replacing the pods over the simulated time"""
+        deployment = self._deployment(deployment_name, namespace)
+        
+        if not deployment:
+            return {"error": f"Deployment {deployment_name} not found in namespace {namespace}"}
+        
+        rollout = self._start_rollout(deployment, "restart", self._new_template_hash())
+        
+        return {
+            "success": True,
+            "message": f"Deployment {deployment_name} restart initiated, rolling out revision {rollout.revision}",
+            "deployment": deployment_name,
+            "namespace": namespace,
+            "restart_time": datetime.now().isoformat(),
+            "rollout": rollout.report(rollout.started_ms),
+            "resourceVersion": self.resource_version
+        }
+
+    def rollout_status(self, deployment_name: str, namespace: str) -> Dict[str, Any]:
+        """Deployment counters and the rollout timeline up to now, like `kubectl rollout status` and its events"""
+        deployment = self._deployment(deployment_name, namespace)
+        if not deployment:
+            return {"error": f"Deployment {deployment_name} not found in namespace {namespace}"}
+        rollout = self.rollouts.get(f"{namespace}/{deployment_name}")
+        return {
+            "deployment": asdict(deployment),
+            "rollout": rollout.report(int(time.time() * 1000)) if rollout else {"revision": 1, "status": "Complete", "events": []},
+            "resourceVersion": self.resource_version
+        }
+
+    def pod_history(self, pod: Pod) -> Tuple[Optional[PodLifecycle], List[Dict[str, Any]]]:
+        """Simulated lifecycle of a pod and its timeline events so far, (None, []) for pods no rollout touched"""
+        now_ms = int(time.time() * 1000)
+        for rollout in self.rollouts.values():
+            lifecycle = next((lifecycle for lifecycle in rollout.pods if lifecycle.name == pod.name), None)
+            if lifecycle is not None:
+                events = [event.report() for event in rollout.events if event.name == pod.name and event.at_ms <= now_ms]
+                return lifecycle, events
+        return None, []
+
+    @staticmethod
+    def _new_template_hash() -> str:
+        return "".join(random.choices(string.hexdigits.lower()[:16], k=10))
+
 
 # Initialize FastMCP server and mock data
 mcp = FastMCP("Kubernetes Cluster Manager", version="1.0.0" , host="localhost" ,port=3000)
 k8s_data = MockKubernetesData()
+# Every mutation goes through the single writer, the supervisor process when serving with several workers
+cluster = SingleWriter("k8s", k8s_data.snapshot, k8s_data.restore)
+cluster.register("scale_deployment", k8s_data.scale_deployment)
+cluster.register("restart_deployment", k8s_data.restart_deployment)
+cluster.register("advance", k8s_data.advance)
+cluster.every(ROLLOUT_TICK_SECONDS, "advance")
+# Object lists are encoded once in compact JSON, straight from the dataclasses
+encoder = ResponseEncoder()
 
 
 # Resources - read-only data access
 @mcp.resource("k8s://cluster/info")
 async def get_cluster_info():
     """Get general information about the Kubernetes cluster"""
-    return {
-        "cluster_name": k8s_data.cluster_name,
-        "version": "v1.28.2",
-        "nodes": len(k8s_data.nodes),
-        "total_pods": len(k8s_data.pods),
-        "total_services": len(k8s_data.services),
-        "total_deployments": len(k8s_data.deployments),
-        "namespaces": k8s_data.namespaces,
-        "cluster_status": "Healthy",
-        "api_server": "https://k8s-api.example.com:6443",
-        "dns_service": "10.96.0.10"
-    }
+    with cluster.reading():
+        return {
+            "cluster_name": k8s_data.cluster_name,
+            "version": "v1.28.2",
+            "nodes": len(k8s_data.nodes),
+            "total_pods": len(k8s_data.pods),
+            "total_services": len(k8s_data.services),
+            "total_deployments": len(k8s_data.deployments),
+            "namespaces": k8s_data.namespaces,
+            "cluster_status": "Healthy",
+            "api_server": "https://k8s-api.example.com:6443",
+            "dns_service": "10.96.0.10"
+        }
 
 
 @mcp.resource("k8s://namespaces")
@@ -132,43 +395,53 @@ async def get_namespaces():
     return {"namespaces": k8s_data.namespaces}
 
 
-@mcp.resource("k8s://nodes")
+@mcp.resource("k8s://nodes", mime_type="application/json")
 async def get_nodes():
     """Get all cluster nodes"""
-    return {"nodes": [asdict(node) for node in k8s_data.nodes]}
+    with cluster.reading():
+        return encoder.encode("k8s://nodes", {"nodes": k8s_data.nodes})
 
 
-@mcp.resource("k8s://pods/{namespace}")
+@mcp.resource("k8s://pods/{namespace}", mime_type="application/json")
 async def get_pods_by_namespace(namespace: str):
     """Get pods filtered by namespace"""
-    if namespace == "all":
-        filtered_pods = k8s_data.pods
-    else:
-        filtered_pods = [p for p in k8s_data.pods if p.namespace == namespace]
-    
-    return {"namespace": namespace, "pods": [asdict(pod) for pod in filtered_pods]}
+    with cluster.reading():
+        if namespace == "all":
+            filtered_pods = k8s_data.pods
+        else:
+            filtered_pods = [p for p in k8s_data.pods if p.namespace == namespace]
+        
+        return encoder.encode("k8s://pods", {"namespace": namespace, "resourceVersion": k8s_data.resource_version, "pods": filtered_pods})
 
 
-@mcp.resource("k8s://services/{namespace}")
+@mcp.resource("k8s://services/{namespace}", mime_type="application/json")
 async def get_services_by_namespace(namespace: str):
     """Get services filtered by namespace"""
-    if namespace == "all":
-        filtered_services = k8s_data.services
-    else:
-        filtered_services = [s for s in k8s_data.services if s.namespace == namespace]
-    
-    return {"namespace": namespace, "services": [asdict(service) for service in filtered_services]}
+    with cluster.reading():
+        if namespace == "all":
+            filtered_services = k8s_data.services
+        else:
+            filtered_services = [s for s in k8s_data.services if s.namespace == namespace]
+        
+        return encoder.encode("k8s://services", {"namespace": namespace, "resourceVersion": k8s_data.resource_version, "services": filtered_services})
 
 
-@mcp.resource("k8s://deployments/{namespace}")
+@mcp.resource("k8s://deployments/{namespace}", mime_type="application/json")
 async def get_deployments_by_namespace(namespace: str):
     """Get deployments filtered by namespace"""
-    if namespace == "all":
-        filtered_deployments = k8s_data.deployments
-    else:
-        filtered_deployments = [d for d in k8s_data.deployments if d.namespace == namespace]
-    
-    return {"namespace": namespace, "deployments": [asdict(deployment) for deployment in filtered_deployments]}
+    with cluster.reading():
+        if namespace == "all":
+            filtered_deployments = k8s_data.deployments
+        else:
+            filtered_deployments = [d for d in k8s_data.deployments if d.namespace == namespace]
+        
+        return encoder.encode("k8s://deployments", {"namespace": namespace, "resourceVersion": k8s_data.resource_version, "deployments": filtered_deployments})
+
+
+@mcp.resource("k8s://server/stats")
+async def get_server_stats():
+    """Get the encoded size of the responses served so far, per resource"""
+    return {"responses": encoder.stats()}
 
 
 # Tools - interactive functions with side effects
@@ -186,7 +459,8 @@ async def get_pod_logs(pod_name: str, namespace: str = "default", tail: int = 10
         await ctx.info(f"Fetching logs for pod {pod_name} in namespace {namespace}")
     
     # Check if pod exists
-    pod = next((p for p in k8s_data.pods if p.name == pod_name and p.namespace == namespace), None)
+    with cluster.reading():
+        pod = next((p for p in k8s_data.pods if p.name == pod_name and p.namespace == namespace), None)
     if not pod:
         if ctx:
             await ctx.error(f"Pod {pod_name} not found in namespace {namespace}")
@@ -228,7 +502,10 @@ async def describe_pod(pod_name: str, namespace: str = "default", ctx: Context =
         await ctx.info(f"Describing pod {pod_name} in namespace {namespace}")
     
     # Find the pod
-    pod = next((p for p in k8s_data.pods if p.name == pod_name and p.namespace == namespace), None)
+    with cluster.reading():
+        pod = next((p for p in k8s_data.pods if p.name == pod_name and p.namespace == namespace), None)
+        # Pods created by a simulated rollout describe their lifecycle and events so far
+        lifecycle, events = k8s_data.pod_history(pod) if pod else (None, [])
     
     if not pod:
         error_msg = f"Pod {pod_name} not found in namespace {namespace}"
@@ -236,24 +513,33 @@ async def describe_pod(pod_name: str, namespace: str = "default", ctx: Context =
             await ctx.error(error_msg)
         return {"error": error_msg}
     
-    # Simulate detailed pod description
+    ready = pod.ready.split("/")[0] == pod.ready.split("/")[1]
+    scheduled = pod.node != "<none>"
+    created = "2023-12-01T10:00:00Z"
+    state: Dict[str, Any] = {"running": {"startedAt": created}}
+    if lifecycle is not None and lifecycle.created_ms is not None:
+        created = datetime.fromtimestamp(lifecycle.created_ms / 1000).isoformat(timespec="seconds")
+        state = {"running": {"startedAt": datetime.fromtimestamp(lifecycle.started_ms / 1000).isoformat(timespec="seconds")}}
+    if pod.status in ("Pending", "ContainerCreating", "CrashLoopBackOff"):
+        state = {"waiting": {"reason": pod.status}}
+    
     return {
         "name": pod.name,
         "namespace": pod.namespace,
         "status": {
-            "phase": pod.status,
+            "phase": "Pending" if pod.status in ("Pending", "ContainerCreating") else "Running",
             "conditions": [
-                {"type": "Initialized", "status": "True"},
-                {"type": "Ready", "status": "True"},
-                {"type": "ContainersReady", "status": "True"},
-                {"type": "PodScheduled", "status": "True"}
+                {"type": "Initialized", "status": str(scheduled)},
+                {"type": "Ready", "status": str(ready)},
+                {"type": "ContainersReady", "status": str(ready)},
+                {"type": "PodScheduled", "status": str(scheduled)}
             ],
             "containerStatuses": [{
                 "name": "main",
-                "ready": True,
+                "ready": ready,
                 "restartCount": pod.restarts,
                 "image": pod.image,
-                "state": {"running": {"startedAt": "2023-12-01T10:00:00Z"}}
+                "state": state
             }]
         },
         "spec": {
@@ -268,8 +554,9 @@ async def describe_pod(pod_name: str, namespace: str = "default", ctx: Context =
                 }
             }]
         },
+        "events": events,
         "metadata": {
-            "creationTimestamp": "2023-12-01T10:00:00Z",
+            "creationTimestamp": created,
             "labels": {"app": pod.name.split("-")[0], "version": "v1"},
             "uid": str(uuid.uuid4())
         }
@@ -279,7 +566,7 @@ async def describe_pod(pod_name: str, namespace: str = "default", ctx: Context =
 @mcp.tool
 async def scale_deployment(deployment_name: str, replicas: int, namespace: str = "default", ctx: Context = None) -> Dict[str, Any]:
     """
-    Scale a deployment to specified number of replicas
+    Scale a deployment to specified number of replicas. Pods are created or deleted gradually, follow it with get_rollout_status
     
     Args:
         deployment_name: Name of the deployment
@@ -289,32 +576,13 @@ async def scale_deployment(deployment_name: str, replicas: int, namespace: str =
     if ctx:
         await ctx.info(f"Scaling deployment {deployment_name} to {replicas} replicas in namespace {namespace}")
     
-    # Find the deployment
-    deployment = next((d for d in k8s_data.deployments 
-                      if d.name == deployment_name and d.namespace == namespace), None)
-    
-    if not deployment:
-        error_msg = f"Deployment {deployment_name} not found in namespace {namespace}"
-        if ctx:
-            await ctx.error(error_msg)
-        return {"error": error_msg}
-    
-    # Simulate scaling
-    old_replicas = deployment.replicas
-    deployment.replicas = replicas
-    deployment.ready = f"{replicas}/{replicas}"
-    deployment.up_to_date = replicas
-    deployment.available = replicas
+    result = await cluster.call("scale_deployment", deployment_name=deployment_name, namespace=namespace, replicas=replicas)
+    if ctx and "error" in result:
+        await ctx.error(result["error"])
+    elif ctx:
+        await ctx.info(result["message"])
     
-    success_msg = f"Deployment {deployment_name} scaled from {old_replicas} to {replicas} replicas"
-    if ctx:
-        await ctx.info(success_msg)
-    
-    return {
-        "success": True,
-        "message": success_msg,
-        "deployment": asdict(deployment)
-    }
+    return result
 
 
 @mcp.tool
@@ -333,10 +601,13 @@ async def get_resource_usage(namespace: Optional[str] = None, ctx: Context = Non
     base_cpu_used = 2.5
     base_memory_used = 6.2
     
-    if namespace and namespace != "all":
-        # Scale down for specific namespace
+    with cluster.reading():
         pods_in_ns = len([p for p in k8s_data.pods if p.namespace == namespace])
         total_pods = len(k8s_data.pods)
+        pods_used = len([p for p in k8s_data.pods if not namespace or namespace == "all" or p.namespace == namespace])
+    
+    if namespace and namespace != "all":
+        # Scale down for specific namespace
         scale_factor = pods_in_ns / total_pods
         base_cpu_used *= scale_factor
         base_memory_used *= scale_factor
@@ -359,7 +630,7 @@ async def get_resource_usage(namespace: Optional[str] = None, ctx: Context = Non
             "percentage": "45%"
         },
         "pods": {
-            "used": len([p for p in k8s_data.pods if not namespace or namespace == "all" or p.namespace == namespace]),
+            "used": pods_used,
             "total": "110"
         }
     }
@@ -368,7 +639,7 @@ async def get_resource_usage(namespace: Optional[str] = None, ctx: Context = Non
 @mcp.tool
 async def restart_deployment(deployment_name: str, namespace: str = "default", ctx: Context = None) -> Dict[str, Any]:
     """
-    Restart a deployment by triggering a rolling restart
+    Restart a deployment by triggering a rolling restart. Pods are replaced gradually, follow it with get_rollout_status
     
     Args:
         deployment_name: Name of the deployment to restart
@@ -377,32 +648,71 @@ async def restart_deployment(deployment_name: str, namespace: str = "default", c
     if ctx:
         await ctx.info(f"Restarting deployment {deployment_name} in namespace {namespace}")
     
-    # Find the deployment
-    deployment = next((d for d in k8s_data.deployments 
-                      if d.name == deployment_name and d.namespace == namespace), None)
+    result = await cluster.call("restart_deployment", deployment_name=deployment_name, namespace=namespace)
+    if ctx and "error" in result:
+        await ctx.error(result["error"])
+    elif ctx:
+        await ctx.info(result["message"])
     
-    if not deployment:
-        error_msg = f"Deployment {deployment_name} not found in namespace {namespace}"
-        if ctx:
-            await ctx.error(error_msg)
-        return {"error": error_msg}
+    return result
+
+
+@mcp.tool
+async def get_rollout_status(deployment_name: str, namespace: str = "default", wait_seconds: int = 0, ctx: Context = None) -> TextContent:
+    """
+    Get the rollout progress of a deployment and its event timeline so far, like `kubectl rollout status`
     
-    # Simulate restart process
-    success_msg = f"Deployment {deployment_name} restart initiated. Rolling restart in progress..."
+    Args:
+        deployment_name: Name of the deployment
+        namespace: Namespace of the deployment (default: default)
+        wait_seconds: Wait up to this many seconds (at most 300) for the rollout to complete or exceed its progress deadline
+    """
+    if ctx:
+        await ctx.info(f"Getting rollout status of deployment {deployment_name} in namespace {namespace}")
+    
+    with cluster.reading():
+        result = k8s_data.rollout_status(deployment_name, namespace)
+    for _ in range(min(wait_seconds, 300)):
+        if "error" in result or result["rollout"]["status"] != "Progressing":
+            break
+        await asyncio.sleep(1)
+        with cluster.reading():
+            result = k8s_data.rollout_status(deployment_name, namespace)
+    
+    if ctx and "error" in result:
+        await ctx.error(result["error"])
+    elif ctx:
+        await ctx.info(f"Rollout {result['rollout']['status']}: {result['deployment']['ready']} ready")
+    
+    return encoder.content("get_rollout_status", result)
+
+
+@mcp.tool
+async def watch_events(
+    since_resource_version: int = 0,
+    kinds: Optional[List[str]] = None,
+    namespace: Optional[str] = None,
+    limit: int = 200,
+    ctx: Context = None
+) -> TextContent:
+    """
+    Get the ADDED/MODIFIED/DELETED events of cluster objects since a resourceVersion, instead of re-listing
     
+    Args:
+        since_resource_version: resourceVersion of a previous list or watch response (0 for every retained event)
+        kinds: Object kinds to include, e.g. ["Pod", "Deployment"] (optional, all kinds if not specified)
+        namespace: Namespace to filter events (optional)
+        limit: Maximum number of events, continue from the returned resourceVersion when "more" is true
+    """
     if ctx:
-        await ctx.info("Rolling restart initiated")
-        await ctx.info("Terminating old pods...")
-        await ctx.info("Starting new pods...")
-        await ctx.info("Rolling restart completed successfully")
+        await ctx.info(f"Watching events since resourceVersion {since_resource_version}")
     
-    return {
-        "success": True,
-        "message": success_msg,
-        "deployment": deployment_name,
-        "namespace": namespace,
-        "restart_time": datetime.now().isoformat()
-    }
+    with cluster.reading():
+        result = k8s_data.watch(since_resource_version, kinds, namespace, limit)
+    if ctx and "error" in result:
+        await ctx.error(result["error"])
+    
+    return encoder.content("watch_events", result)
 
 
 # Prompts - reusable templates for LLM interactions
@@ -469,11 +779,14 @@ async def health_check(ctx: Context = None) -> Dict[str, Any]:
         await ctx.info("Performing cluster health check...")
     
     # Simulate health checks
-    healthy_nodes = len([n for n in k8s_data.nodes if n.status == "Ready"])
-    total_nodes = len(k8s_data.nodes)
-    
-    running_pods = len([p for p in k8s_data.pods if p.status == "Running"])
-    total_pods = len(k8s_data.pods)
+    with cluster.reading():
+        healthy_nodes = len([n for n in k8s_data.nodes if n.status == "Ready"])
+        total_nodes = len(k8s_data.nodes)
+        
+        running_pods = len([p for p in k8s_data.pods if p.status == "Running"])
+        total_pods = len(k8s_data.pods)
+        total_services = len(k8s_data.services)
+        total_deployments = len(k8s_data.deployments)
     
     health_status = "Healthy" if healthy_nodes == total_nodes and running_pods == total_pods else "Warning"
     
@@ -494,18 +807,28 @@ async def health_check(ctx: Context = None) -> Dict[str, Any]:
             "status": "Healthy" if running_pods == total_pods else "Warning"
         },
         "services": {
-            "total": len(k8s_data.services),
+            "total": total_services,
             "status": "Healthy"
         },
         "deployments": {
-            "total": len(k8s_data.deployments),
+            "total": total_deployments,
             "status": "Healthy"
         }
     }
 
 
+def http_app():
+    """Stateless app for the multi-worker mode, any worker can serve any request of a session"""
+    return mcp.http_app(transport="streamable-http", stateless_http=True)
+
+
 if __name__ == "__main__":
     # Run the FastMCP server    
     # Run with default STDIO transport for local testing
     # Use mcp.run(transport="http", port=8000) for web deployment
-    mcp.run(transport="streamable-http")
\ No newline at end of file
+    # MOCK_MCP_WORKERS > 1 serves from several processes sharing the port
+    workers = int(os.getenv("MOCK_MCP_WORKERS", "1"))
+    if workers > 1:
+        serve(http_app, host="localhost", port=3000, workers=workers)
+    else:
+        mcp.run(transport="streamable-http")
\ No newline at end of file
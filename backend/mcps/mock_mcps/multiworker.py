@@ -0,0 +1,266 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+HEADER = struct.Struct("<QQ")  # snapshot version, payload length
+SNAPSHOT_CAPACITY = 4 * 1024 * 1024
+POLL_INTERVAL_SECONDS = 0.2
+
+_hubs: Dict[str, "SingleWriter"] = {}
+
+
+def is_worker() -> bool:
+    """True inside a serving worker spawned by `serve`, where state is a read-only replica"""
+    return multiprocessing.parent_process() is not None
+
+
+class SharedSnapshot:
+    """
+    Versioned state snapshot in a shared memory segment, published by one writer and read by every
+    worker. The version works as a seqlock: it is odd while the writer copies the payload, so a reader
+    that sees an odd or changed version retries instead of loading a torn snapshot.
+    """
+
+    def __init__(self, name: Optional[str] = None, capacity: int = SNAPSHOT_CAPACITY):
+        self._memory = shared_memory.SharedMemory(name=name, create=name is None, size=HEADER.size + capacity)
+        self.name = self._memory.name
+        self.capacity = self._memory.size - HEADER.size
+
+    @property
+    def version(self) -> int:
+        return HEADER.unpack_from(self._memory.buf, 0)[0]
+
+    def publish(self, payload: bytes):
+        if len(payload) > self.capacity:
+            raise ValueError(f"snapshot of {len(payload)} bytes exceeds the {self.capacity} bytes shared segment")
+        version = self.version
+        HEADER.pack_into(self._memory.buf, 0, version + 1, 0)
+        self._memory.buf[HEADER.size:HEADER.size + len(payload)] = payload
+        HEADER.pack_into(self._memory.buf, 0, version + 2, len(payload))
+
+    def read(self) -> Tuple[int, bytes]:
+        while True:
+            version, length = HEADER.unpack_from(self._memory.buf, 0)
+            if version % 2 == 0:
+                payload = bytes(self._memory.buf[HEADER.size:HEADER.size + length])
+                if HEADER.unpack_from(self._memory.buf, 0)[0] == version:
+                    return version, payload
+            time.sleep(0)
+
+    def close(self, unlink: bool = False):
+        self._memory.close()
+        if unlink:
+            self._memory.unlink()
+
+
+class SingleWriter:
+    """
+    Single-writer channel for a piece of mutable server state (e.g. the mock cluster).
+
+    In a single process, `call` applies the registered mutation directly. Under `serve`, the supervisor
+    process owns the state: workers send mutations through a queue, the supervisor applies them one at
+    a time, publishes a new `SharedSnapshot` and replies. Workers reload the snapshot when its version
+    changes (right after their own writes, and by polling for everyone else's), so reads never cross
+    processes.
+    """
+
+    def __init__(self, name: str, snapshot: Callable[[], bytes], restore: Callable[[bytes], None]):
+        self.name = name
+        self.snapshot = snapshot
+        self.restore = restore
+        self._handlers: Dict[str, Callable[..., Any]] = {}
+        self._lock = threading.Lock()
+        self._shared: Optional[SharedSnapshot] = None
+        self._published = b""  # last payload the supervisor published, the state a rejected write rolls back to
+        self._requests = None
+        self._replies = None
+        self._worker_index = 0
+        self._version = 0
+        self._pending: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._ids = itertools.count(1)
+        _hubs[name] = self
+
+    def register(self, name: str, handler: Callable[..., Any]):
+        self._handlers[name] = handler
+
+    def every(self, interval_seconds: float, op: str):
+        """
+        Apply the registered mutation `op` (taking no arguments) periodically in the writer process, e.g.
+        to reveal simulated changes as time passes. It returns whether the state changed, and only
+        changes are published. Serving workers never run it, they receive its changes with the snapshots.
+        """
+        if is_worker():
+            return
+
+        def tick():
+            while True:
+                time.sleep(interval_seconds)
+                with self._lock:
+                    try:
+                        self._apply(op, {}, only_changes=True)
+                    except ValueError as e:
+                        print(f"{self.name}: {e}")
+
+        threading.Thread(target=tick, name=f"{self.name}-{op}", daemon=True).start()
+
+    async def call(self, op: str, **kwargs: Any) -> Any:
+        if self._requests is None:
+            with self._lock:
+                return self._apply(op, kwargs)
+        request_id = next(self._ids)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[request_id] = (loop, future)
+        self._requests.put((self._worker_index, request_id, op, kwargs))
+        result, version = await future
+        self.refresh(min_version=version)
+        return result
+
+    def _apply(self, op: str, kwargs: Dict[str, Any], only_changes: bool = False) -> Any:
+        """
+        Run a mutation and publish the new snapshot. If the snapshot does not fit in the shared segment
+        the state is rolled back to the last published one, so the writer never keeps a state the workers cannot load.
+        """
+        result = self._handlers[op](**kwargs)
+        if self._shared is not None and (result or not only_changes):
+            payload = self.snapshot()
+            if len(payload) > self._shared.capacity:
+                self.restore(self._published)
+                raise ValueError(f"{op} rolled back: its snapshot of {len(payload)} bytes exceeds the {self._shared.capacity} bytes shared segment")
+            self._shared.publish(payload)
+            self._published = payload
+        return result
+
+    @contextmanager
+    def reading(self) -> Iterator[None]:
+        """
+        Hold the writer lock while reading the state, so a read never overlaps a mutation (e.g. the `every`
+        tick thread) or a snapshot reload. Keep the block short and do not await inside it.
+        """
+        with self._lock:
+            yield
+
+    def refresh(self, min_version: int = 0):
+        """Reload the state from the shared snapshot if a newer version was published"""
+        if self._shared is None or self._shared.version == self._version:
+            return
+        with self._lock:
+            version, payload = self._shared.read()
+            if version > self._version and version >= min_version:
+                self.restore(payload)
+                self._version = version
+
+    # Supervisor side
+    def _share(self, workers: int, context) -> Dict[str, Any]:
+        self._shared = SharedSnapshot()
+        self._published = self.snapshot()
+        self._shared.publish(self._published)
+        self._requests = context.Queue()
+        self._replies = [context.Queue() for _ in range(workers)]
+        return {"snapshot": self._shared.name, "requests": self._requests, "replies": self._replies}
+
+    def _serve_writes(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            worker_index, request_id, op, kwargs = request
+            with self._lock:
+                try:
+                    result = self._apply(op, kwargs)
+                except Exception as e:
+                    result = {"error": f"{op} failed: {e}"}
+            self._replies[worker_index].put((request_id, result, self._shared.version))
+
+    # Worker side
+    def _attach(self, config: Dict[str, Any], worker_index: int):
+        self._shared = SharedSnapshot(config["snapshot"])
+        self._requests = config["requests"]
+        self._replies = config["replies"][worker_index]
+        self._worker_index = worker_index
+        self.refresh()
+        threading.Thread(target=self._dispatch_replies, name=f"{self.name}-replies", daemon=True).start()
+        threading.Thread(target=self._poll, name=f"{self.name}-snapshot", daemon=True).start()
+
+    def _dispatch_replies(self):
+        while True:
+            request_id, result, version = self._replies.get()
+            loop, future = self._pending.pop(request_id)
+            loop.call_soon_threadsafe(_resolve, future, (result, version))
+
+    def _poll(self):
+        while True:
+            time.sleep(POLL_INTERVAL_SECONDS)
+            self.refresh()
+
+
+def _resolve(future: asyncio.Future, value: Any):
+    # The request may have been cancelled while the supervisor was applying it
+    if not future.done():
+        future.set_result(value)
+
+
+def _run_worker(app_factory: Callable[[], Any], sock: socket.socket, hubs: Dict[str, Dict[str, Any]], worker_index: int, log_level: str):
+    import uvicorn
+
+    # Unpickling `app_factory` imported the server module, which created its hubs and read-only state
+    for name, config in hubs.items():
+        _hubs[name]._attach(config, worker_index)
+    config = uvicorn.Config(app_factory(), log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(app_factory: Callable[[], Any], host: str, port: int, workers: Optional[int] = None, log_level: str = "info"):
+    """
+    Serve an ASGI app from `workers` processes sharing one listening socket, like `uvicorn --workers`.
+
+    The calling process becomes the supervisor: it keeps the state it already built (the TSDB writer,
+    the mock cluster) and the single writer of every `SingleWriter`, while the workers only serve
+    requests. `app_factory` must be a module-level function of the server module: it is pickled by
+    reference, so each spawned worker imports that module again and builds its own read-only replicas.
+    The app must be stateless (e.g. FastMCP `stateless_http=True`), since consecutive requests of one
+    client can reach different workers.
+    """
+    workers = workers or os.cpu_count() or 1
+    context = multiprocessing.get_context("spawn")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    hubs = {name: hub._share(workers, context) for name, hub in _hubs.items()}
+    writers = [threading.Thread(target=hub._serve_writes, name=f"{name}-writer", daemon=True) for name, hub in _hubs.items()]
+    for writer in writers:
+        writer.start()
+
+    processes: List[multiprocessing.Process] = [
+        context.Process(target=_run_worker, args=(app_factory, sock, hubs, index, log_level), name=f"mcp-worker-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    print(f"Serving on http://{host}:{port} with {workers} workers")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # run the cleanup below on termination too
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for hub in _hubs.values():
+            hub._requests.put(None)
+            hub._shared.close(unlink=True)
+        sock.close()
@@ -0,0 +1,80 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from query_planner import Deadline
+
+
+class ExecutorOverloaded(Exception):
+    """Every worker is busy and the wait queue is full"""
+
+
+class BoundedExecutor:
+    """
+    Runs CPU-heavy query evaluation on a bounded thread pool so the FastMCP event loop keeps serving
+    resources and cheap tools while a large query is evaluated.
+
+    Backpressure: at most `max_workers` evaluations run and `max_queued` more wait for a worker. A call
+    that finds the queue full waits up to `queue_timeout` seconds for a slot and then raises
+    `ExecutorOverloaded`, instead of piling up work nobody will wait for. If the calling request is
+    cancelled its `Deadline` is cancelled too, so the worker stops at its next check, and its slot stays
+    taken until it does.
+
+    Threads instead of processes: the head block lives in this process, so a process pool would need
+    its own copy of the TSDB. The GIL still bounds pure-Python decoding to one core at a time, but the
+    event loop gets the interpreter back at every switch interval instead of waiting for the whole query.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_queued: int = 16, queue_timeout: float = 5.0, name: str = "query"):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix=name)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, func: Callable[..., Any], *args: Any, deadline: Optional[Deadline] = None) -> Any:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queued)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ExecutorOverloaded(
+                f"{self.max_workers} queries running and {self.max_queued} queued for over {self.queue_timeout}s, retry later"
+            )
+        self.admitted += 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._pool.submit(func, *args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is freed when the worker thread finishes, not when the caller stops waiting for it
+        future.add_done_callback(lambda _: loop.is_closed() or loop.call_soon_threadsafe(self._release))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if deadline:
+                deadline.cancel()
+            raise
+
+    def _release(self):
+        self._slots.release()
+        self.completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_workers": self.max_workers,
+            "max_queued": self.max_queued,
+            "in_flight": self.admitted - self.completed,
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,12 +1,32 @@
 import json
 import asyncio
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, Tuple
-from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Dict, List, Literal, Optional, Tuple
+from dataclasses import dataclass
+import math
+import os
 import random
+import threading
 import time
+import zlib
 
 from fastmcp import FastMCP, Context
+from mcp.types import TextContent
+
+from multiworker import is_worker, serve
+from offload import BoundedExecutor, ExecutorOverloaded
+from response_encoding import ResponseEncoder, columnar, format_value, matrix
+from query_cache import RangeQueryCache
+from query_planner import Deadline, QueryLimits, QueryRejected, QueryTimeout, parse_duration, parse_time, plan_range_query
+from rollout_sim import PodLifecycle, RolloutJournal
+from series_index import LabelMatcher, Labels, PostingsIndex, SelectorError, parse_selector
+from tsdb_blocks import STALE_NAN, BlockStorage, is_stale, series_key
+
+DAY_MS = 24 * 3600 * 1000
+RETENTION_MS = 15 * DAY_MS
+# Instant and range queries use the newest sample within the lookback, like Prometheus
+LOOKBACK_MS = 5 * 60 * 1000
 
 
 @dataclass
@@ -54,7 +74,227 @@ class MockPrometheusData:
             "prometheus-server-789abc-yza78": {"namespace": "monitoring", "node": "node-3", "app": "prometheus"},
         }
         self.services = ["nginx-service", "api-service", "frontend-service", "kube-dns", "prometheus-server"]
+        self.scrape_interval_seconds = 15
+        self.backfill_hours = float(os.getenv("PROMETHEUS_MOCK_BACKFILL_HOURS", "24"))
+        self.index = PostingsIndex()
+        self.query_cache = RangeQueryCache()
+        self.query_limits = QueryLimits.from_env()
+        self.executor = BoundedExecutor(
+            max_workers=int(os.getenv("PROMETHEUS_MOCK_QUERY_WORKERS", "0")) or None,
+            max_queued=int(os.getenv("PROMETHEUS_MOCK_QUERY_QUEUE", "16"))
+        )
+        self.storage = BlockStorage(
+            data_dir=Path(os.getenv("PROMETHEUS_MOCK_DATA_DIR", Path(__file__).parent / "data" / "prometheus")),
+            retention_ms=RETENTION_MS,
+            read_only=is_worker()  # serving workers replicate the blocks written by the supervisor
+        )
+        self._scraper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.backfilled = threading.Event()
+        # Pods created or deleted by the rollouts simulated in the Kubernetes mock
+        self.lifecycles: Dict[str, PodLifecycle] = {}
+        self.journal = RolloutJournal.from_env()
+        self._register_series()
+        self._load_rollouts()
         self._generate_alerts()
+
+    def _register_series(self):
+        """Register every scraped series in the label index"""
+        for node in self.nodes:
+            target = {"instance": f"{node}:9100", "node": node}
+            self.index.add({"__name__": "up", "job": "node-exporter", "role": "node", **target})
+            self.index.add({"__name__": "node_memory_usage_percent", **target})
+            self.index.add({"__name__": "node_cpu_usage_percent", **target})
+
+        self.index.add({"__name__": "up", "job": "kubernetes-apiservers", "instance": "k8s-api.example.com:6443", "component": "apiserver"})
+
+        for pod_name, pod_info in self.pods.items():
+            self._register_pod(pod_name, pod_info)
+
+    def _register_pod(self, pod_name: str, pod_info: Dict[str, str]):
+        self.index.add({"__name__": "kube_pod_status_ready", "pod": pod_name, "namespace": pod_info["namespace"], "node": pod_info["node"]})
+        self.index.add({"__name__": "kube_pod_container_status_restarts_total", "pod": pod_name, "namespace": pod_info["namespace"], "container": "main"})
+        if pod_info["app"] in ["nginx", "api", "frontend"]:  # Only app pods have metrics
+            self.index.add({
+                "__name__": "up", "job": f"{pod_info['app']}-metrics", "instance": f"{pod_name}:8080",
+                "pod": pod_name, "namespace": pod_info["namespace"], "app": pod_info["app"], "node": pod_info["node"]
+            })
+            self.index.add({"__name__": "http_requests_total", "pod": pod_name, "app": pod_info["app"], "status": "200"})
+            self.index.add({"__name__": "http_requests_per_second", "pod": pod_name, "app": pod_info["app"]})
+
+    def _load_rollouts(self):
+        """Follow the rollouts journaled by the Kubernetes mock: register the series of new pods and their lifecycles"""
+        for rollout in self.journal.read_new():
+            prefix = f"{rollout.deployment}-"
+            app = next((info["app"] for name, info in self.pods.items() if name.startswith(prefix) and info["namespace"] == rollout.namespace), rollout.deployment)
+            for lifecycle in rollout.pods:
+                self.lifecycles[lifecycle.name] = lifecycle
+                if lifecycle.name not in self.pods:
+                    self.pods[lifecycle.name] = {"namespace": lifecycle.namespace, "node": lifecycle.node, "app": app}
+                    self._register_pod(lifecycle.name, self.pods[lifecycle.name])
+            for name in rollout.cancelled:
+                lifecycle = self.lifecycles.get(name)
+                if lifecycle is not None:  # superseded before it was created: it never gets samples
+                    lifecycle.deleted_ms = lifecycle.created_ms
+
+    def pod_running(self, pod_name: str) -> bool:
+        """False for the pods a simulated rollout deleted (or has not created yet)"""
+        lifecycle = self.lifecycles.get(pod_name)
+        return lifecycle is None or lifecycle.exists(int(time.time() * 1000))
+
+    def select_series(self, metric: str, query: str = "") -> List[Labels]:
+        """
+        Series of `metric` matching the label matchers of the query selector.
+        The metric name of the query is replaced by `metric`, the series the mock actually serves for it.
+        """
+        matchers = [m for m in parse_selector(query) if m.name != "__name__"]
+        return [self.index.key(series_id) for series_id in self.index.select([LabelMatcher("__name__", "=", metric), *matchers])]
+
+    def value_at(self, labels: Labels, timestamp_ms: int) -> Optional[float]:
+        """
+        Deterministic sample of a series at a scrape timestamp: a per-series base, a daily cycle and
+        hashed noise. The same series and timestamp always give the same value, so the data written
+        before a restart and the data generated after it line up.
+
+        The series of pods touched by a simulated rollout follow the pod lifecycle instead: no sample
+        outside the pod's lifetime (None), not ready and without traffic until its readiness probe passes
+        and once it is terminating, and the restarts of a crash loop.
+        """
+        lifecycle = self.lifecycles.get(next((value for label, value in labels if label == "pod"), ""))
+        if lifecycle is None:
+            return self._generated_value(labels, timestamp_ms)
+        if not lifecycle.exists(timestamp_ms):
+            return None
+        name = dict(labels)["__name__"]
+        new_pod = lifecycle.created_ms is not None
+        if name == "kube_pod_status_ready":
+            if not new_pod and not lifecycle.terminating(timestamp_ms):
+                return self._generated_value(labels, timestamp_ms)
+            return float(lifecycle.is_ready(timestamp_ms))
+        if name == "kube_pod_container_status_restarts_total":
+            return (0.0 if new_pod else self._generated_value(labels, timestamp_ms)) + lifecycle.restarts_at(timestamp_ms)
+        if name == "up":
+            status = lifecycle.status_at(timestamp_ms)
+            if status in ("Pending", "ContainerCreating"):
+                return None  # not a scrape target before its container starts
+            return 0.0 if status == "CrashLoopBackOff" else 1.0
+        if name == "http_requests_per_second":
+            return self._generated_value(labels, timestamp_ms) if lifecycle.is_ready(timestamp_ms) else 0.0
+        if name == "http_requests_total":
+            # The counter only grows while the pod serves, from its readiness (or midnight) to its termination
+            end = timestamp_ms if lifecycle.deleting_ms is None else min(timestamp_ms, lifecycle.deleting_ms)
+            if not new_pod:
+                return self._generated_value(labels, end)
+            if lifecycle.ready_ms is None or end < lifecycle.ready_ms:
+                return 0.0
+            start = max(lifecycle.ready_ms, end - end % DAY_MS)
+            return self._generated_value(labels, end) - self._generated_value(labels, start)
+        return self._generated_value(labels, timestamp_ms)
+
+    def _generated_value(self, labels: Labels, timestamp_ms: int) -> float:
+        series = dict(labels)
+        name = series["__name__"]
+        seed = zlib.crc32(series_key(labels).encode())
+        step = timestamp_ms // (self.scrape_interval_seconds * 1000)
+        noise = zlib.crc32(f"{seed}:{step}".encode()) / 0xFFFFFFFF * 2 - 1  # [-1, 1]
+        daily = math.sin(2 * math.pi * (timestamp_ms % DAY_MS) / DAY_MS + seed % 360)
+
+        if name == "node_memory_usage_percent":
+            return round(max(20.0, min(95.0, 40 + seed % 40 + 8 * daily + 3 * noise)), 2)
+        if name == "node_cpu_usage_percent":
+            return round(max(5.0, min(95.0, 15 + seed % 50 + 15 * daily + 8 * noise)), 2)
+        if name == "kube_pod_status_ready":
+            return 0.0 if noise > 0.9 else 1.0  # ~5% not ready
+        if name == "kube_pod_container_status_restarts_total":
+            # Counter of the day like http_requests_total: most pods never restart, one in four
+            # restarts every few hours, so increase() over the last hours is non-zero for it
+            if seed % 4 != 3:
+                return 0.0
+            period_ms = (2 + seed % 5) * 3600 * 1000
+            return float((timestamp_ms % DAY_MS + seed % period_ms) // period_ms)
+        if name == "http_requests_total":
+            # Counter that resets at midnight, as if the pod restarted daily
+            return float(int((20 + seed % 60) * (timestamp_ms % DAY_MS) / 1000))
+        if name == "http_requests_per_second":
+            return round(max(0.0, 20 + seed % 60 + 15 * daily + 10 * noise), 2)
+        return 1.0  # up
+
+    def _ingest(self, until_ms: int):
+        """Scrape every series from the newest stored sample (or the backfill start) up to `until_ms`"""
+        self._load_rollouts()
+        interval_ms = self.scrape_interval_seconds * 1000
+        resume = self.storage.maxt
+        if resume is None:
+            resume = (until_ms - int(self.backfill_hours * 3600 * 1000)) // interval_ms * interval_ms - interval_ms
+        keys = [self.index.key(series_id) for series_id in self.index.select([])]
+        steps_per_block = self.storage.block_range_ms // interval_ms
+        for step, timestamp in enumerate(range(resume + interval_ms, until_ms + 1, interval_ms), start=1):
+            for labels in keys:
+                value = self.value_at(labels, timestamp)
+                if value is not None:
+                    self.storage.append(labels, timestamp, value)
+                elif self.value_at(labels, timestamp - interval_ms) is not None:
+                    self.storage.append(labels, timestamp, STALE_NAN)  # the series just disappeared
+            if step % steps_per_block == 0:
+                self.storage.maintain()  # keep the head small while backfilling
+
+    def stop(self):
+        self._stop.set()
+        self.storage.stop()
+        self.executor.shutdown()
+
+    def start(self):
+        """
+        Backfill the storage, then keep scraping every interval and compacting, all on a background
+        thread: queries are served during the backfill and `backfilled` is set once it completes.
+        There is no WAL: the head samples lost on shutdown are generated again on the next start.
+        Read-only replicas generate the same deterministic samples into their own head and reload the
+        blocks instead of compacting.
+        """
+        if self._scraper is not None:
+            return
+
+        def scrape():
+            self._ingest(int(time.time() * 1000))
+            self.storage.maintain()
+            self.storage.start_background()
+            self.backfilled.set()
+            while not self._stop.wait(self.scrape_interval_seconds):
+                self._ingest(int(time.time() * 1000))
+
+        self._scraper = threading.Thread(target=scrape, name="prometheus-scraper", daemon=True)
+        self._scraper.start()
+
+    def instant_value(self, labels: Labels) -> Optional[List[Any]]:
+        """Newest `[timestamp, "value"]` of a series"""
+        sample = self.storage.latest(labels)
+        if sample is None or sample[0] < time.time() * 1000 - LOOKBACK_MS or is_stale(sample[1]):
+            return None
+        return [sample[0] / 1000, format_value(sample[1])]
+
+    def evaluate_instant(self, metric: str, query: str) -> List[Dict[str, Any]]:
+        """Vector result of the `metric` series selected by the query, series without a recent sample are left out"""
+        results = []
+        for labels in self.select_series(metric, query):
+            value = self.instant_value(labels)
+            if value is not None:
+                results.append({"metric": dict(labels), "value": value})
+        return results
+
+    def evaluate_range(self, metric: str, query: str, start_ms: int, end_ms: int, step_ms: int, deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """Range result of the `metric` series selected by the query as timestamp/value columns, series without points are left out"""
+        results = []
+        for labels in self.select_series(metric, query):
+            if deadline:
+                deadline.check()
+            timestamps, values = self.storage.at_steps(labels, start_ms, end_ms, step_ms, LOOKBACK_MS)
+            if timestamps:
+                results.append({"metric": dict(labels), "timestamps": timestamps, "values": values})
+        return results
+
+    @property
+    def head_samples(self) -> int:
+        return self.storage.head.num_samples
     
     def _generate_alerts(self):
         """Generate sample alerts"""
@@ -104,6 +344,7 @@ class MockPrometheusData:
 # Initialize FastMCP server and mock data
 mcp = FastMCP("Prometheus Monitoring Server", version="1.0.0" , port="3001")
 prom_data = MockPrometheusData()
+encoder = ResponseEncoder()
 
 
 # Resources - read-only data access
@@ -117,13 +358,16 @@ async def get_prometheus_status():
         "retention": "15d",
         "scrape_interval": "15s",
         "evaluation_interval": "15s",
-        "storage_path": "/prometheus/data",
+        "storage_path": str(prom_data.storage.data_dir),
         "config_file": "/etc/prometheus/prometheus.yml",
-        "active_targets": 25,
+        "active_targets": len(prom_data.index.postings("__name__", "up")),
         "dropped_targets": 0,
         "active_alerts": len([a for a in prom_data.alerts if a.state == "firing"]),
-        "total_series": 12847,
-        "head_samples": 2834,
+        "total_series": len(prom_data.index),
+        "head_samples": prom_data.head_samples,
+        "query_cache": prom_data.query_cache.stats(),
+        "query_executor": prom_data.executor.stats(),
+        "responses": encoder.stats(),
         "wal_size": "245MB"
     }
 
@@ -133,51 +377,47 @@ async def get_targets():
     """Get all scrape targets and their status"""
     targets = []
     
-    # Node exporter targets
-    for node in prom_data.nodes:
+    # Every target exposes an `up` series, the index holds their labels
+    for labels in prom_data.index.select_labels([LabelMatcher("__name__", "=", "up")]):
+        job = labels.pop("job")
+        instance = labels.pop("instance")
+        labels.pop("__name__")
+        is_pod = "pod" in labels
+        if is_pod and not prom_data.pod_running(labels["pod"]):
+            continue
+        lifecycle = prom_data.lifecycles.get(labels.get("pod", ""))
+        if lifecycle is not None:
+            healthy = lifecycle.status_at(int(time.time() * 1000)) not in ("Pending", "ContainerCreating", "CrashLoopBackOff")
+        else:
+            healthy = not is_pod or random.random() > 0.1
         targets.append({
-            "job": "node-exporter",
-            "instance": f"{node}:9100",
-            "health": "up",
+            "job": job,
+            "instance": instance,
+            "health": "up" if healthy else "down",
             "last_scrape": "2023-12-05T11:30:00Z",
-            "scrape_duration": "0.045s",
-            "labels": {"node": node, "role": "node"}
+            "scrape_duration": f"0.{random.randint(20, 80)}s" if is_pod else ("0.045s" if job == "node-exporter" else "0.028s"),
+            "labels": labels
         })
     
-    # Kubernetes API server
-    targets.append({
-        "job": "kubernetes-apiservers",
-        "instance": "k8s-api.example.com:6443",
-        "health": "up",
-        "last_scrape": "2023-12-05T11:30:00Z",
-        "scrape_duration": "0.028s",
-        "labels": {"component": "apiserver"}
-    })
-    
-    # Pod targets
-    for pod_name, pod_info in prom_data.pods.items():
-        if pod_info["app"] in ["nginx", "api", "frontend"]:  # Only app pods have metrics
-            targets.append({
-                "job": f"{pod_info['app']}-metrics",
-                "instance": f"{pod_name}:8080",
-                "health": "up" if random.random() > 0.1 else "down",
-                "last_scrape": "2023-12-05T11:30:00Z",
-                "scrape_duration": f"0.{random.randint(20, 80)}s",
-                "labels": {
-                    "pod": pod_name,
-                    "namespace": pod_info["namespace"],
-                    "app": pod_info["app"],
-                    "node": pod_info["node"]
-                }
-            })
-    
     return {"targets": targets}
 
 
-@mcp.resource("prometheus://alerts")
+@mcp.resource("prometheus://tsdb")
+async def get_tsdb_status():
+    """Get TSDB head and cardinality statistics per metric and label"""
+    storage = prom_data.storage.stats()
+    return {
+        "headStats": storage["head"],
+        "blocks": storage["blocks"],
+        "compactions": storage["compactions"],
+        **prom_data.index.cardinality()
+    }
+
+
+@mcp.resource("prometheus://alerts", mime_type="application/json")
 async def get_alerts():
     """Get all active alerts"""
-    return {"alerts": [asdict(alert) for alert in prom_data.alerts]}
+    return encoder.encode("prometheus://alerts", {"alerts": prom_data.alerts})
 
 
 @mcp.resource("prometheus://rules")
@@ -225,7 +465,7 @@ async def get_alerting_rules():
 
 # Tools - interactive query functions
 @mcp.tool
-async def query_prometheus(query: str, time_param: Optional[str] = None, ctx: Context = None) -> Dict[str, Any]:
+async def query_prometheus(query: str, time_param: Optional[str] = None, ctx: Context = None) -> TextContent:
     """
     Execute a PromQL query against Prometheus
     
@@ -236,104 +476,65 @@ async def query_prometheus(query: str, time_param: Optional[str] = None, ctx: Co
     if ctx:
         await ctx.info(f"Executing PromQL query: {query}")
     
-    # Simulate query execution with realistic responses based on query patterns
-    result_type = "vector"
-    results = []
+    try:
+        parse_selector(query)
+    except SelectorError as e:
+        return encoder.content("query_prometheus", {"status": "error", "errorType": "bad_data", "error": str(e)})
+    
+    # Simulate query execution by mapping common query patterns to the stored series
+    metric = None
     
-    # Parse common query patterns and generate appropriate responses
     if "node_memory" in query.lower():
         # Memory metrics
-        for node in prom_data.nodes:
-            memory_used = random.uniform(4.0, 12.0)  # GB
-            memory_total = 16.0
-            percentage = (memory_used / memory_total) * 100
-            
-            results.append({
-                "metric": {
-                    "__name__": "node_memory_usage_percent",
-                    "instance": f"{node}:9100",
-                    "node": node
-                },
-                "value": [time.time(), str(round(percentage, 2))]
-            })
+        metric = "node_memory_usage_percent"
     
     elif "node_cpu" in query.lower():
         # CPU metrics
-        for node in prom_data.nodes:
-            cpu_usage = random.uniform(15.0, 85.0)
-            results.append({
-                "metric": {
-                    "__name__": "node_cpu_usage_percent", 
-                    "instance": f"{node}:9100",
-                    "node": node
-                },
-                "value": [time.time(), str(round(cpu_usage, 2))]
-            })
+        metric = "node_cpu_usage_percent"
     
     elif "kube_pod" in query.lower():
         # Pod metrics
-        for pod_name, pod_info in prom_data.pods.items():
-            if "status" in query.lower():
-                status = 1 if random.random() > 0.05 else 0  # 95% pods running
-                results.append({
-                    "metric": {
-                        "__name__": "kube_pod_status_ready",
-                        "pod": pod_name,
-                        "namespace": pod_info["namespace"],
-                        "node": pod_info["node"]
-                    },
-                    "value": [time.time(), str(status)]
-                })
-            elif "restart" in query.lower():
-                restarts = random.choice([0, 0, 0, 1])  # Mostly 0, sometimes 1
-                results.append({
-                    "metric": {
-                        "__name__": "kube_pod_container_status_restarts_total",
-                        "pod": pod_name,
-                        "namespace": pod_info["namespace"],
-                        "container": "main"
-                    },
-                    "value": [time.time(), str(restarts)]
-                })
+        if "status" in query.lower():
+            metric = "kube_pod_status_ready"
+        elif "restart" in query.lower():
+            metric = "kube_pod_container_status_restarts_total"
     
     elif "http_requests" in query.lower():
-        # Application metrics
-        for pod_name, pod_info in prom_data.pods.items():
-            if pod_info["app"] in ["nginx", "api", "frontend"]:
-                requests_rate = random.uniform(10.0, 100.0)
-                results.append({
-                    "metric": {
-                        "__name__": "http_requests_total",
-                        "pod": pod_name,
-                        "app": pod_info["app"],
-                        "status": "200"
-                    },
-                    "value": [time.time(), str(round(requests_rate, 2))]
-                })
-    
-    else:
-        # Generic response for unknown queries
-        results.append({
-            "metric": {"__name__": "unknown_metric"},
-            "value": [time.time(), str(random.uniform(0, 100))]
-        })
+        # Application metrics: rate() queries read the per-second series, plain selectors the counter
+        metric = "http_requests_per_second" if "rate(" in query or "per_second" in query else "http_requests_total"
     
+    def evaluate() -> Tuple[TextContent, int]:
+        if metric:
+            results = prom_data.evaluate_instant(metric, query)
+        else:
+            # Generic response for unknown queries, the same query always gets the same value
+            results = [{
+                "metric": {"__name__": "unknown_metric"},
+                "value": [time.time(), format_value(zlib.crc32(query.encode()) % 10000 / 100)]
+            }]
+        return encoder.content("query_prometheus", {
+            "status": "success",
+            "data": {
+                "resultType": "vector",
+                "result": results
+            },
+            "query": query,
+            "timestamp": time.time()
+        }), len(results)
+    
+    # Selecting the series and encoding the response both run on the executor threads
+    try:
+        response, result_count = await prom_data.executor.run(evaluate)
+    except ExecutorOverloaded as e:
+        return encoder.content("query_prometheus", {"status": "error", "errorType": "unavailable", "error": str(e)})
     if ctx:
-        await ctx.info(f"Query returned {len(results)} results")
+        await ctx.info(f"Query returned {result_count} results ({len(response.text)} bytes)")
     
-    return {
-        "status": "success",
-        "data": {
-            "resultType": result_type,
-            "result": results
-        },
-        "query": query,
-        "timestamp": time.time()
-    }
+    return response
 
 
 @mcp.tool
-async def query_range(query: str, start: str, end: str, step: str = "15s", ctx: Context = None) -> Dict[str, Any]:
+async def query_range(query: str, start: str, end: str, step: str = "15s", encoding: Literal["matrix", "columnar"] = "matrix", ctx: Context = None) -> TextContent:
     """
     Execute a PromQL range query
     
@@ -342,87 +543,83 @@ async def query_range(query: str, start: str, end: str, step: str = "15s", ctx:
         start: Start time (RFC3339 or relative)
         end: End time (RFC3339 or relative) 
         step: Query resolution step
+        encoding: "matrix" for Prometheus [timestamp, "value"] pairs, "columnar" for compact timestamps/values arrays per series
     """
     if ctx:
         await ctx.info(f"Executing range query: {query} from {start} to {end}")
     
-    # Parse time parameters
     try:
-        if start.endswith('m'):
-            start_minutes = int(start[:-1])
-            start_time = time.time() - (start_minutes * 60)
-        else:
-            start_time = time.time() - 3600  # Default 1 hour
-        
-        end_time = time.time()
-        step_seconds = int(step[:-1]) if step.endswith('s') else 15
-        
-    except:
-        start_time = time.time() - 3600
-        end_time = time.time()
-        step_seconds = 15
-    
-    # Generate time series data
-    results = []
-    
+        parse_selector(query)
+    except SelectorError as e:
+        return encoder.content("query_range", {"status": "error", "errorType": "bad_data", "error": str(e)})
+    
+    # Parse time parameters, defaulting to the last hour at 15s
+    now_ms = int(time.time() * 1000)
+    start_ms = parse_time(start, now_ms)
+    start_ms = now_ms - 3600 * 1000 if start_ms is None else start_ms
+    end_ms = parse_time(end, now_ms) or now_ms
+    step_ms = max(parse_duration(step) or parse_duration(f"{step}s") or 15 * 1000, 1000)
+    
+    metric = None
     if "node_memory" in query.lower():
-        for node in prom_data.nodes:
-            values = []
-            current_time = start_time
-            base_memory = random.uniform(40, 80)  # Base memory percentage
-            
-            while current_time <= end_time:
-                # Add some variance around the base value
-                memory_usage = base_memory + random.uniform(-5, 5)
-                memory_usage = max(20, min(95, memory_usage))  # Clamp between 20-95%
-                values.append([current_time, str(round(memory_usage, 2))])
-                current_time += step_seconds
-            
-            results.append({
-                "metric": {
-                    "__name__": "node_memory_usage_percent",
-                    "instance": f"{node}:9100",
-                    "node": node
-                },
-                "values": values
-            })
+        metric = "node_memory_usage_percent"
     
     elif "http_requests" in query.lower():
-        for pod_name, pod_info in prom_data.pods.items():
-            if pod_info["app"] in ["nginx", "api", "frontend"]:
-                values = []
-                current_time = start_time
-                base_rate = random.uniform(20, 80)
-                
-                while current_time <= end_time:
-                    rate = base_rate + random.uniform(-10, 10)
-                    rate = max(0, rate)
-                    values.append([current_time, str(round(rate, 2))])
-                    current_time += step_seconds
-                
-                results.append({
-                    "metric": {
-                        "__name__": "http_requests_per_second",
-                        "pod": pod_name,
-                        "app": pod_info["app"]
-                    },
-                    "values": values
-                })
+        metric = "http_requests_per_second"
+    
+    # Estimate series x samples before evaluating, coarsening or rejecting queries above the limits
+    try:
+        plan = plan_range_query(
+            len(prom_data.select_series(metric, query)) if metric else 0, start_ms, end_ms, step_ms, prom_data.query_limits,
+            prom_data.scrape_interval_seconds * 1000, LOOKBACK_MS, min_time_ms=now_ms - RETENTION_MS
+        )
+    except QueryRejected as e:
+        if ctx:
+            await ctx.error(f"Range query rejected: {e}")
+        return encoder.content("query_range", {
+            "status": "error", "errorType": "bad_data", "error": str(e), "estimate": e.estimate, "limits": prom_data.query_limits
+        })
+    
+    if ctx and plan.coarsened:
+        await ctx.info(f"Step coarsened from {plan.requested_step_ms / 1000}s to {plan.step_ms / 1000}s to fit the query limits")
+    
+    # Read the stored samples of the matching series at every step, through the extent cache, and
+    # encode the response on the executor threads, so the event loop keeps serving other requests meanwhile
+    deadline = Deadline(plan.limits.timeout_seconds)
+
+    def evaluate() -> Tuple[TextContent, int]:
+        results = prom_data.query_cache.query(
+            query, plan.start_ms, plan.end_ms, plan.step_ms,
+            lambda first, last, step_ms: prom_data.evaluate_range(metric, query, first, last, step_ms, deadline)
+        ) if metric else []
+        return encoder.content("query_range", {
+            "status": "success",
+            "data": {
+                "resultType": encoding if encoding == "columnar" else "matrix",
+                "result": columnar(results) if encoding == "columnar" else matrix(results)
+            },
+            "query": query,
+            "start": plan.start_ms / 1000,
+            "end": plan.end_ms / 1000,
+            "step": plan.step_ms / 1000,
+            "query_plan": plan.report()
+        }), len(results)
+
+    try:
+        response, series_count = await prom_data.executor.run(evaluate, deadline=deadline)
+    except QueryTimeout as e:
+        if ctx:
+            await ctx.error(str(e))
+        return encoder.content("query_range", {"status": "error", "errorType": "timeout", "error": str(e), "query_plan": plan.report()})
+    except ExecutorOverloaded as e:
+        if ctx:
+            await ctx.error(str(e))
+        return encoder.content("query_range", {"status": "error", "errorType": "unavailable", "error": str(e), "query_plan": plan.report()})
     
     if ctx:
-        await ctx.info(f"Range query returned {len(results)} time series")
+        await ctx.info(f"Range query returned {series_count} time series ({len(response.text)} bytes, {encoding})")
     
-    return {
-        "status": "success",
-        "data": {
-            "resultType": "matrix",
-            "result": results
-        },
-        "query": query,
-        "start": start_time,
-        "end": end_time,
-        "step": step_seconds
-    }
+    return response
 
 
 @mcp.tool
@@ -507,11 +704,17 @@ async def get_node_metrics(node: str, ctx: Context = None) -> Dict[str, Any]:
             await ctx.error(error_msg)
         return {"error": error_msg}
     
-    # Generate realistic node metrics
+    # CPU and memory come from the newest stored samples of the node, the rest is generated
+    def latest(metric: str) -> Optional[Tuple[int, float]]:
+        series = prom_data.index.select([LabelMatcher("__name__", "=", metric), LabelMatcher("node", "=", node)])
+        return prom_data.storage.latest(prom_data.index.key(series[0])) if series else None
+
     cpu_cores = 4
     memory_total_gb = 16
-    memory_used_gb = random.uniform(4, 12)
-    cpu_usage_percent = random.uniform(15, 75)
+    memory_sample = latest("node_memory_usage_percent")
+    cpu_sample = latest("node_cpu_usage_percent")
+    memory_used_gb = memory_sample[1] * memory_total_gb / 100 if memory_sample else random.uniform(4, 12)
+    cpu_usage_percent = cpu_sample[1] if cpu_sample else random.uniform(15, 75)
     
     disk_total_gb = 100
     disk_used_gb = random.uniform(30, 60)
@@ -519,8 +722,13 @@ async def get_node_metrics(node: str, ctx: Context = None) -> Dict[str, Any]:
     network_rx_bytes = random.randint(1000000, 10000000)
     network_tx_bytes = random.randint(500000, 5000000)
     
-    # Count pods on this node
-    pods_on_node = [p for p, info in prom_data.pods.items() if info["node"] == node]
+    # Pods on this node, straight from the node="..." postings
+    pods_on_node = [
+        labels["pod"] for labels in prom_data.index.select_labels([
+            LabelMatcher("__name__", "=", "kube_pod_status_ready"),
+            LabelMatcher("node", "=", node)
+        ]) if prom_data.pod_running(labels["pod"])
+    ]
     
     return {
         "node": node,
@@ -667,5 +875,20 @@ Use range queries to analyze historical trends and project future needs.
 """
 
 
+def http_app():
+    """Stateless app for the multi-worker mode, any worker can serve any request of a session"""
+    prom_data.start()  # the worker's replica only generates the head, the blocks come from the supervisor
+    return mcp.http_app(transport="streamable-http", stateless_http=True)
+
+
 if __name__ == "__main__":
-    mcp.run(transport="streamable-http")
\ No newline at end of file
+    # MOCK_MCP_WORKERS > 1 serves from several processes sharing the port, the TSDB blocks are shared
+    # read-only through mmap and this process keeps writing and compacting them
+    workers = int(os.getenv("MOCK_MCP_WORKERS", "1"))
+    prom_data.start()
+    if workers > 1:
+        # The workers replicate the blocks of the backfill instead of generating it again
+        prom_data.backfilled.wait()
+        serve(http_app, host="localhost", port=3001, workers=workers)
+    else:
+        mcp.run(transport="streamable-http")
\ No newline at end of file
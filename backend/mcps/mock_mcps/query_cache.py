@@ -0,0 +1,152 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+# One range query result in columns: [{"metric": {...}, "timestamps": [ms, ...], "values": [float, ...]}, ...]
+Series = List[Dict[str, Any]]
+RangeEvaluator = Callable[[int, int, int], Series]
+
+
+def align_range(start_ms: int, end_ms: int, step_ms: int) -> Tuple[int, int]:
+    """Snap start up and end down to multiples of the step, so every query over the same step shares its timestamps"""
+    return -(-start_ms // step_ms) * step_ms, end_ms // step_ms * step_ms
+
+
+def split_interval(step_ms: int) -> int:
+    """Hour extents for fine steps, day extents from 5m steps up, keeping a few hundred points per extent"""
+    return DAY_MS if step_ms >= 5 * 60 * 1000 else HOUR_MS
+
+
+def _series_key(series: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted(series["metric"].items()))
+
+
+class RangeQueryCache:
+    """
+    Results cache in front of a range evaluator, like the Cortex/Thanos query-frontend.
+
+    A request is aligned to its step and split into fixed extents (`split_interval`) whose boundaries
+    do not depend on the request, so "last 1h" and then "last 6h" of the same expression reuse the
+    extents of the first query and evaluate only the missing ones. Contiguous missing extents are
+    evaluated in a single call and split afterwards. Extents that end within `max_freshness_ms` of now
+    may still receive samples, so they are always evaluated and never cached.
+
+    Entries are `(query, step, extent_start)` with an LRU bound on the number of cached points.
+    """
+
+    def __init__(self, max_samples: int = 1_000_000, max_freshness_ms: int = 60 * 1000):
+        self.max_samples = max_samples
+        self.max_freshness_ms = max_freshness_ms
+        self._extents: "OrderedDict[Tuple[str, int, int], Series]" = OrderedDict()
+        self._samples = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def query(self, query: str, start_ms: int, end_ms: int, step_ms: int, evaluate: RangeEvaluator, now_ms: Optional[int] = None) -> Series:
+        """Series of the aligned [start_ms, end_ms] range, evaluating only the extents not in the cache"""
+        start_ms, end_ms = align_range(start_ms, end_ms, step_ms)
+        if end_ms < start_ms:
+            return []
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        query = " ".join(query.split())
+        split_ms = split_interval(step_ms)
+
+        parts: List[Series] = []
+        missing: List[Tuple[int, int]] = []  # contiguous runs of uncached extents
+        for extent in range(start_ms // split_ms * split_ms, end_ms + 1, split_ms):
+            cached = self._get((query, step_ms, extent))
+            if cached is not None:
+                parts.append(cached)
+                continue
+            if missing and missing[-1][1] == extent:
+                missing[-1] = (missing[-1][0], extent + split_ms)
+            else:
+                missing.append((extent, extent + split_ms))
+            parts.append([])  # filled once the run is evaluated
+
+        for run_start, run_end in missing:
+            # Evaluate whole extents so they can be cached, trimmed to what the request needs if not cacheable
+            first, last = align_range(run_start, run_end - 1, step_ms)
+            if run_end > now_ms - self.max_freshness_ms:
+                last = min(last, end_ms)
+            result = evaluate(first, last, step_ms) if first <= last else []
+            for extent, series in self._split(result, run_start, run_end, split_ms).items():
+                if extent + split_ms <= now_ms - self.max_freshness_ms:
+                    self._put((query, step_ms, extent), series)
+                parts[(extent - start_ms // split_ms * split_ms) // split_ms] = series
+
+        return self._stitch(parts, start_ms, end_ms)
+
+    @staticmethod
+    def _split(result: Series, run_start: int, run_end: int, split_ms: int) -> Dict[int, Series]:
+        extents: Dict[int, Series] = {extent: [] for extent in range(run_start, run_end, split_ms)}
+        for series in result:
+            timestamps, values = series["timestamps"], series["values"]
+            for extent in extents:
+                first, last = bisect.bisect_left(timestamps, extent), bisect.bisect_left(timestamps, extent + split_ms)
+                if first < last:
+                    extents[extent].append({"metric": series["metric"], "timestamps": timestamps[first:last], "values": values[first:last]})
+        return extents
+
+    @staticmethod
+    def _stitch(parts: List[Series], start_ms: int, end_ms: int) -> Series:
+        """Concatenate the extents per series, keeping only the points of the requested range"""
+        stitched: Dict[Tuple[Tuple[str, str], ...], Dict[str, Any]] = {}
+        for part in parts:
+            for series in part:
+                timestamps = series["timestamps"]
+                first, last = bisect.bisect_left(timestamps, start_ms), bisect.bisect_right(timestamps, end_ms)
+                if first < last:
+                    item = stitched.setdefault(_series_key(series), {"metric": dict(series["metric"]), "timestamps": [], "values": []})
+                    item["timestamps"].extend(timestamps[first:last])
+                    item["values"].extend(series["values"][first:last])
+        return list(stitched.values())
+
+    def _get(self, key: Tuple[str, int, int]) -> Optional[Series]:
+        with self._lock:
+            series = self._extents.get(key)
+            if series is None:
+                self.misses += 1
+                return None
+            self._extents.move_to_end(key)
+            self.hits += 1
+            return series
+
+    def _put(self, key: Tuple[str, int, int], series: Series):
+        size = sum(len(item["timestamps"]) for item in series) or 1
+        if size > self.max_samples:
+            return
+        with self._lock:
+            if key in self._extents:
+                return
+            self._extents[key] = series
+            self._samples += size
+            while self._samples > self.max_samples:
+                _, evicted = self._extents.popitem(last=False)
+                self._samples -= sum(len(item["timestamps"]) for item in evicted) or 1
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._extents.clear()
+            self._samples = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "extents": len(self._extents),
+                "samples": self._samples,
+                "max_samples": self.max_samples
+            }
@@ -0,0 +1,171 @@
+import os
+import re
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+DURATION_RE = re.compile(r"^(\d+(?:\.\d+)?)(ms|s|m|h|d|w)$")
+DURATION_MS = {"ms": 1, "s": 1000, "m": 60 * 1000, "h": 3600 * 1000, "d": 24 * 3600 * 1000, "w": 7 * 24 * 3600 * 1000}
+# Steps a coarsened query is rounded up to, so coarsened queries keep hitting the same cache extents
+NICE_STEPS_MS = [
+    15 * 1000, 30 * 1000, 60 * 1000, 5 * 60 * 1000, 15 * 60 * 1000, 30 * 60 * 1000,
+    3600 * 1000, 3 * 3600 * 1000, 6 * 3600 * 1000, 12 * 3600 * 1000, 24 * 3600 * 1000
+]
+
+
+class QueryRejected(Exception):
+    """The query exceeds the limits and cannot be coarsened into them, `estimate` is the rejected cost"""
+
+    def __init__(self, message: str, estimate: "QueryEstimate"):
+        super().__init__(message)
+        self.estimate = estimate
+
+
+class QueryTimeout(Exception):
+    """The evaluation ran past its deadline"""
+
+
+def parse_duration(value: str) -> Optional[int]:
+    """PromQL-style duration ('15s', '5m', '6h', '2d') in milliseconds, None if it is not one"""
+    match = DURATION_RE.match(value.strip())
+    return int(float(match.group(1)) * DURATION_MS[match.group(2)]) if match else None
+
+
+def parse_time(value: str, now_ms: int) -> Optional[int]:
+    """'now', a duration relative to now ('6h' = 6 hours ago), a unix timestamp or an RFC3339 time, in milliseconds"""
+    value = value.strip()
+    if value == "now":
+        return now_ms
+    relative = parse_duration(value)
+    if relative is not None:
+        return now_ms - relative
+    try:
+        return int(float(value) * 1000)
+    except ValueError:
+        pass
+    try:
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class QueryLimits:
+    max_series: int = 1000
+    max_points_per_series: int = 11000  # same limit as the Prometheus API
+    max_samples: int = 2_000_000  # series x steps of one result
+    timeout_seconds: float = 10.0
+    coarsen: bool = True  # raise the step instead of rejecting when only the resolution is too fine
+
+    @classmethod
+    def from_env(cls) -> "QueryLimits":
+        return cls(
+            max_series=int(os.getenv("PROMETHEUS_MOCK_MAX_SERIES", cls.max_series)),
+            max_points_per_series=int(os.getenv("PROMETHEUS_MOCK_MAX_POINTS_PER_SERIES", cls.max_points_per_series)),
+            max_samples=int(os.getenv("PROMETHEUS_MOCK_MAX_SAMPLES", cls.max_samples)),
+            timeout_seconds=float(os.getenv("PROMETHEUS_MOCK_QUERY_TIMEOUT", cls.timeout_seconds)),
+            coarsen=os.getenv("PROMETHEUS_MOCK_COARSEN", "true").lower() in ("1", "true", "yes")
+        )
+
+
+@dataclass
+class QueryEstimate:
+    series: int
+    steps: int  # points per series
+    samples: int  # points in the result: series x steps
+    scanned_samples: int  # stored samples decoded: series x (range + lookback) / scrape interval
+
+
+@dataclass
+class QueryPlan:
+    start_ms: int
+    end_ms: int
+    step_ms: int
+    requested_step_ms: int
+    estimate: QueryEstimate
+    limits: QueryLimits
+
+    @property
+    def coarsened(self) -> bool:
+        return self.step_ms != self.requested_step_ms
+
+    def report(self) -> Dict[str, Any]:
+        """Plan summary returned with the result, so the caller sees what the query cost and why it was changed"""
+        return {
+            "estimate": asdict(self.estimate),
+            "limits": asdict(self.limits),
+            "step": self.step_ms / 1000,
+            "requested_step": self.requested_step_ms / 1000,
+            "coarsened": self.coarsened
+        }
+
+
+def estimate(series: int, start_ms: int, end_ms: int, step_ms: int, scrape_interval_ms: int, lookback_ms: int) -> QueryEstimate:
+    steps = max((end_ms - start_ms) // step_ms + 1, 0)
+    return QueryEstimate(
+        series=series,
+        steps=steps,
+        samples=series * steps,
+        scanned_samples=series * ((end_ms - start_ms + lookback_ms) // scrape_interval_ms + 1)
+    )
+
+
+def plan_range_query(
+    series: int, start_ms: int, end_ms: int, step_ms: int, limits: QueryLimits,
+    scrape_interval_ms: int, lookback_ms: int, min_time_ms: Optional[int] = None
+) -> QueryPlan:
+    """
+    Estimate the cost of a range query before evaluating it and fit it into the limits:
+    the start is clamped to the oldest data kept (`min_time_ms`), a resolution finer than the limits
+    allow is coarsened to the next nice step, and what cannot be fixed that way raises `QueryRejected`.
+    """
+    if min_time_ms is not None:
+        start_ms = max(start_ms, min_time_ms)
+    requested_step_ms = step_ms
+    requested = estimate(series, start_ms, end_ms, step_ms, scrape_interval_ms, lookback_ms)
+    if series > limits.max_series:
+        raise QueryRejected(f"query selects {series} series, the limit is {limits.max_series}: add label matchers", requested)
+
+    points_per_series = min(limits.max_points_per_series, limits.max_samples // max(series, 1))
+    if points_per_series < 1:
+        raise QueryRejected(f"{series} series exceed the limit of {limits.max_samples} samples even at one point each", requested)
+    if (end_ms - start_ms) // step_ms + 1 > points_per_series:
+        if not limits.coarsen:
+            raise QueryRejected(
+                f"step {step_ms / 1000}s gives more than {points_per_series} points per series: raise the step or shorten the range", requested
+            )
+        minimum = (end_ms - start_ms) // points_per_series + 1
+        step_ms = next((nice for nice in NICE_STEPS_MS if nice >= minimum), minimum)
+
+    return QueryPlan(
+        start_ms=start_ms,
+        end_ms=end_ms,
+        step_ms=step_ms,
+        requested_step_ms=requested_step_ms,
+        estimate=estimate(series, start_ms, end_ms, step_ms, scrape_interval_ms, lookback_ms),
+        limits=limits
+    )
+
+
+class Deadline:
+    """Cooperative cancellation: long evaluations call `check()` between units of work"""
+
+    def __init__(self, timeout_seconds: float):
+        self.timeout_seconds = timeout_seconds
+        self.expires_at = time.monotonic() + timeout_seconds
+        self.cancelled = False
+
+    @property
+    def expired(self) -> bool:
+        return self.cancelled or time.monotonic() >= self.expires_at
+
+    def cancel(self):
+        """Stop the evaluation at its next check, e.g. when the request that started it is cancelled"""
+        self.cancelled = True
+
+    def check(self):
+        if self.cancelled:
+            raise QueryTimeout("query evaluation was cancelled")
+        if self.expired:
+            raise QueryTimeout(f"query evaluation exceeded the {self.timeout_seconds}s timeout")
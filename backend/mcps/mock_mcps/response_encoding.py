@@ -0,0 +1,81 @@
+import json
+import threading
+from dataclasses import fields, is_dataclass
+from typing import Any, Dict, List
+
+from mcp.types import TextContent
+
+try:
+    import orjson
+except ImportError:  # optional, the standard library encoder produces the same JSON
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    # Dataclasses are encoded field by field, without the recursive deep copy of `asdict`
+    if is_dataclass(value):
+        return {field.name: getattr(value, field.name) for field in fields(value)}
+    if hasattr(value, "tolist"):  # NumPy arrays and scalars
+        return value.tolist()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact JSON; orjson encodes dataclasses and NumPy arrays natively when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if value.is_integer() else str(round(value, 2))
+
+
+def _seconds(timestamps: List[int]) -> List[Any]:
+    return [timestamp // 1000 if timestamp % 1000 == 0 else timestamp / 1000 for timestamp in timestamps]
+
+
+def matrix(series: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Prometheus API matrix: `[[timestamp_seconds, "value"], ...]` pairs, built only at encoding time"""
+    return [
+        {"metric": item["metric"], "values": [[timestamp, format_value(value)] for timestamp, value in zip(_seconds(item["timestamps"]), item["values"])]}
+        for item in series
+    ]
+
+
+def columnar(series: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Compact encoding: one timestamp and one float array per series, serialized straight from the columns"""
+    return [{"metric": item["metric"], "timestamps": _seconds(item["timestamps"]), "values": item["values"]} for item in series]
+
+
+class ResponseEncoder:
+    """
+    Encodes tool and resource responses once, in compact JSON, and records their encoded size.
+
+    Tools return the `TextContent` and resources the string, so FastMCP sends them as they are instead
+    of re-serializing the nested dicts (resources are otherwise pretty-printed with `indent=2`).
+    """
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def encode(self, name: str, payload: Any) -> str:
+        text = dumps(payload).decode()
+        size = len(text)
+        with self._lock:
+            stats = self._stats.setdefault(name, {"responses": 0, "bytes": 0, "max_bytes": 0, "last_bytes": 0})
+            stats["responses"] += 1
+            stats["bytes"] += size
+            stats["max_bytes"] = max(stats["max_bytes"], size)
+            stats["last_bytes"] = size
+        return text
+
+    def content(self, name: str, payload: Any) -> TextContent:
+        return TextContent(type="text", text=self.encode(name, payload))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
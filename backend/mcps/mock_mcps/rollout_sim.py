@@ -0,0 +1,423 @@
+import heapq
+import json
+import os
+import random
+import threading
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from response_encoding import dumps
+
+# kubelet CrashLoopBackOff: the restart delay doubles from 10s up to 5 minutes
+BACKOFF_START_MS = 10 * 1000
+BACKOFF_MAX_MS = 300 * 1000
+# Alphabet of the pod name suffixes generated by the ReplicaSet controller
+POD_SUFFIX_ALPHABET = "bcdfghjklmnpqrstvwxz2456789"
+
+
+def template_hash(deployment: str, pod_name: str) -> str:
+    """Pod template hash of a pod named `<deployment>-<hash>-<suffix>`"""
+    return pod_name[len(deployment) + 1:].rsplit("-", 1)[0]
+
+
+def resolve_count(value: str, replicas: int, round_up: bool) -> int:
+    """maxSurge/maxUnavailable as an absolute number: '25%' of the replicas (surge rounds up, unavailable down) or '1'"""
+    if value.endswith("%"):
+        scaled = replicas * int(value[:-1])
+        return -(-scaled // 100) if round_up else scaled // 100
+    return int(value)
+
+
+def format_age(ms: int) -> str:
+    """Age in the `kubectl get` format: 45s, 12m, 3h, 5d"""
+    seconds = max(ms // 1000, 0)
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+@dataclass(frozen=True)
+class RolloutConfig:
+    max_surge: str = "25%"
+    max_unavailable: str = "25%"
+    progress_deadline_seconds: float = 600.0
+    # Uniform delays of each step of a new pod, in simulated seconds
+    scheduling_seconds: Tuple[float, float] = (0.2, 1.5)
+    image_pull_seconds: Tuple[float, float] = (2.0, 12.0)
+    readiness_seconds: Tuple[float, float] = (5.0, 20.0)
+    crash_seconds: Tuple[float, float] = (1.0, 8.0)
+    termination_seconds: Tuple[float, float] = (1.0, 30.0)
+    failure_rate: float = 0.0  # probability that a new pod crash loops or never passes its readiness probe
+    time_scale: float = 1.0  # simulated seconds per wall clock second
+
+    @classmethod
+    def from_env(cls) -> "RolloutConfig":
+        return cls(
+            max_surge=os.getenv("KUBERNETES_MOCK_MAX_SURGE", cls.max_surge),
+            max_unavailable=os.getenv("KUBERNETES_MOCK_MAX_UNAVAILABLE", cls.max_unavailable),
+            progress_deadline_seconds=float(os.getenv("KUBERNETES_MOCK_PROGRESS_DEADLINE", cls.progress_deadline_seconds)),
+            failure_rate=float(os.getenv("KUBERNETES_MOCK_FAILURE_RATE", cls.failure_rate)),
+            time_scale=float(os.getenv("KUBERNETES_MOCK_TIME_SCALE", cls.time_scale))
+        )
+
+
+@dataclass
+class PodLifecycle:
+    """
+    Wall clock timestamps (ms) of a pod's life, decided when its rollout is simulated. Pods that existed
+    before any rollout have no `created_ms` and `ready_ms = 0` when they were ready.
+    """
+    name: str
+    namespace: str
+    node: str
+    image: str
+    containers: int = 1
+    base_restarts: int = 0
+    created_ms: Optional[int] = None
+    scheduled_ms: Optional[int] = None
+    started_ms: Optional[int] = None
+    ready_ms: Optional[int] = None
+    crashed_ms: Optional[int] = None  # first crash of a crash looping pod
+    deleting_ms: Optional[int] = None
+    deleted_ms: Optional[int] = None
+    time_scale: float = 1.0
+
+    def exists(self, t: int) -> bool:
+        return (self.created_ms is None or self.created_ms <= t) and (self.deleted_ms is None or t < self.deleted_ms)
+
+    def terminating(self, t: int) -> bool:
+        return self.deleting_ms is not None and self.deleting_ms <= t
+
+    def is_ready(self, t: int) -> bool:
+        return self.ready_ms is not None and self.ready_ms <= t and not self.terminating(t)
+
+    def status_at(self, t: int) -> str:
+        if self.terminating(t):
+            return "Terminating"
+        if self.created_ms is not None:
+            if self.scheduled_ms is None or t < self.scheduled_ms:
+                return "Pending"
+            if self.started_ms is None or t < self.started_ms:
+                return "ContainerCreating"
+        if self.crashed_ms is not None and self.crashed_ms <= t:
+            return "CrashLoopBackOff"
+        return "Running"
+
+    def node_at(self, t: int) -> str:
+        return self.node if self.created_ms is None or (self.scheduled_ms is not None and self.scheduled_ms <= t) else "<none>"
+
+    def restarts_at(self, t: int) -> int:
+        """Restarts of the crash loop up to `t`, the container crashing again right after each back-off"""
+        if self.crashed_ms is None or t < self.crashed_ms:
+            return 0
+        end = t if self.deleting_ms is None else min(t, self.deleting_ms)
+        elapsed = (end - self.crashed_ms) * self.time_scale
+        restarts, backoff = 0, BACKOFF_START_MS
+        while backoff < BACKOFF_MAX_MS:
+            if elapsed < backoff:
+                return restarts
+            elapsed -= backoff
+            restarts += 1
+            backoff *= 2
+        return restarts + int(elapsed // BACKOFF_MAX_MS)
+
+
+@dataclass
+class TimelineEvent:
+    """Kubernetes Event of the rollout timeline (`kubectl get events`)"""
+    at_ms: int
+    type: str  # Normal or Warning
+    reason: str
+    kind: str
+    name: str
+    message: str
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "time": datetime.fromtimestamp(self.at_ms / 1000).isoformat(timespec="seconds"),
+            "type": self.type,
+            "reason": self.reason,
+            "object": f"{self.kind}/{self.name}",
+            "message": self.message
+        }
+
+
+@dataclass
+class Rollout:
+    deployment: str
+    namespace: str
+    revision: int
+    reason: str  # restart or scale
+    template_hash: str
+    replicas: int
+    max_surge: int
+    max_unavailable: int
+    started_ms: int
+    pods: List[PodLifecycle] = field(default_factory=list)
+    events: List[TimelineEvent] = field(default_factory=list)
+    cancelled: List[str] = field(default_factory=list)  # pods of a superseded rollout it never created
+    completed_ms: Optional[int] = None
+    stalled_ms: Optional[int] = None  # progress deadline exceeded
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Rollout":
+        data = dict(data)
+        data["pods"] = [PodLifecycle(**pod) for pod in data["pods"]]
+        data["events"] = [TimelineEvent(**event) for event in data["events"]]
+        return cls(**data)
+
+    @property
+    def key(self) -> str:
+        return f"{self.namespace}/{self.deployment}"
+
+    def status_at(self, t: int) -> str:
+        if self.completed_ms is not None and self.completed_ms <= t:
+            return "Complete"
+        if self.stalled_ms is not None and self.stalled_ms <= t:
+            return "ProgressDeadlineExceeded"
+        return "Progressing"
+
+    def carried_over(self, t: int) -> Tuple[List[PodLifecycle], List[str]]:
+        """
+        Pods a new rollout starting at `t` inherits: the controller decisions after `t` (pods not yet
+        created, deletions not yet started) are dropped, while the pods keep starting on their own.
+        Also returns the names of the pods that will never be created.
+        """
+        pods, cancelled = [], []
+        for pod in self.pods:
+            if pod.created_ms is not None and pod.created_ms > t:
+                cancelled.append(pod.name)
+            elif pod.deleted_ms is None or pod.deleted_ms > t:
+                if pod.deleting_ms is not None and pod.deleting_ms > t:
+                    pod = replace(pod, deleting_ms=None, deleted_ms=None)
+                pods.append(pod)
+        return pods, cancelled
+
+    def report(self, t: int) -> Dict[str, Any]:
+        """Progress as seen at `t`: nothing simulated for later is revealed"""
+        report = {
+            "revision": self.revision,
+            "reason": self.reason,
+            "status": self.status_at(t),
+            "strategy": {"type": "RollingUpdate", "maxSurge": self.max_surge, "maxUnavailable": self.max_unavailable},
+            "startedAt": datetime.fromtimestamp(self.started_ms / 1000).isoformat(timespec="seconds")
+        }
+        if self.completed_ms is not None and self.completed_ms <= t:
+            report["completedAt"] = datetime.fromtimestamp(self.completed_ms / 1000).isoformat(timespec="seconds")
+        report["events"] = [event.report() for event in self.events if event.at_ms <= t]
+        return report
+
+
+class RolloutSimulator:
+    """
+    Discrete-event simulation of the Deployment controller's RollingUpdate strategy.
+
+    A priority queue of pod transitions (scheduled, image pulled and started, ready or crashing,
+    terminated) advances simulated time; every time a pod becomes ready the controller reconciles like
+    the real one: the new ReplicaSet scales up while the pods stay under `replicas + maxSurge`, and the
+    old ones scale down (unhealthy pods first) while `replicas - maxUnavailable` pods stay available.
+    A scale with no old pods creates or deletes pods directly. Without progress for the progress
+    deadline the rollout is marked ProgressDeadlineExceeded, although it still completes if the pods
+    eventually become ready.
+
+    The whole timeline is computed when the rollout starts, from a seeded RNG, and mapped onto the wall
+    clock (scaled by `time_scale`): the Kubernetes mock reveals it as time passes and the Prometheus
+    mock reproduces the same pod series from it.
+    """
+
+    def __init__(self, config: RolloutConfig, nodes: List[str]):
+        self.config = config
+        self.nodes = nodes
+
+    def simulate(
+        self, deployment: str, namespace: str, reason: str, revision: int, new_hash: str, image: str,
+        replicas: int, pods: List[PodLifecycle], start_ms: int, seed: int, cancelled: Optional[List[str]] = None
+    ) -> Rollout:
+        config = self.config
+        rng = random.Random(seed)
+        rollout = Rollout(
+            deployment=deployment, namespace=namespace, revision=revision, reason=reason, template_hash=new_hash,
+            replicas=replicas, max_surge=resolve_count(config.max_surge, replicas, round_up=True),
+            max_unavailable=resolve_count(config.max_unavailable, replicas, round_up=False),
+            started_ms=start_ms, pods=list(pods), cancelled=list(cancelled or [])
+        )
+        if rollout.max_surge == 0 and rollout.max_unavailable == 0:
+            rollout.max_unavailable = 1  # both zero would block the rollout, the API server defaults to this
+        queue: List[Tuple[int, int, str]] = []  # (time, sequence, pod name) of the pods becoming ready
+        by_name = {pod.name: pod for pod in rollout.pods}
+        sequence = 0
+
+        def delay(bounds: Tuple[float, float]) -> int:
+            return int(rng.uniform(*bounds) * 1000 / config.time_scale)
+
+        def event(at_ms: int, kind: str, name: str, reason: str, message: str, type: str = "Normal"):
+            rollout.events.append(TimelineEvent(at_ms, type, reason, kind, name, message))
+
+        def create(now: int) -> PodLifecycle:
+            nonlocal sequence
+            counts = {node: 0 for node in self.nodes}
+            for pod in rollout.pods:
+                if pod.deleting_ms is None and pod.node in counts:
+                    counts[pod.node] += 1
+            node = min(self.nodes, key=lambda name: (counts[name], rng.random()))  # spread like pod topology spreading
+            suffix = "".join(rng.choice(POD_SUFFIX_ALPHABET) for _ in range(5))
+            pod = PodLifecycle(
+                name=f"{deployment}-{new_hash}-{suffix}", namespace=namespace, node=node, image=image,
+                containers=containers, created_ms=now, time_scale=config.time_scale
+            )
+            pod.scheduled_ms = now + delay(config.scheduling_seconds)
+            pod.started_ms = pod.scheduled_ms + delay(config.image_pull_seconds)
+            replica_set = f"{deployment}-{new_hash}"
+            event(now, "ReplicaSet", replica_set, "SuccessfulCreate", f"Created pod: {pod.name}")
+            event(pod.scheduled_ms, "Pod", pod.name, "Scheduled", f"Successfully assigned {namespace}/{pod.name} to {node}")
+            event(pod.started_ms, "Pod", pod.name, "Pulled", f'Container image "{image}" pulled')
+            event(pod.started_ms, "Pod", pod.name, "Started", "Started container main")
+            if rng.random() < config.failure_rate:
+                if rng.random() < 0.5:
+                    pod.crashed_ms = pod.started_ms + delay(config.crash_seconds)
+                    event(pod.crashed_ms, "Pod", pod.name, "BackOff", "Back-off restarting failed container main", "Warning")
+                else:
+                    event(pod.started_ms + delay(config.readiness_seconds), "Pod", pod.name, "Unhealthy",
+                          "Readiness probe failed: HTTP probe failed with statuscode: 503", "Warning")
+            else:
+                pod.ready_ms = pod.started_ms + delay(config.readiness_seconds)
+                sequence += 1
+                heapq.heappush(queue, (pod.ready_ms, sequence, pod.name))
+            rollout.pods.append(pod)
+            by_name[pod.name] = pod
+            return pod
+
+        def terminate(pod: PodLifecycle, now: int):
+            pod.deleting_ms = now
+            pod.deleted_ms = now + delay(config.termination_seconds)
+            event(now, "Pod", pod.name, "Killing", "Stopping container main")
+
+        def scaled(now: int, replica_set: str, direction: str, count: int):
+            event(now, "Deployment", deployment, "ScalingReplicaSet", f"Scaled {direction} replica set {replica_set} to {count}")
+
+        def sync(now: int) -> bool:
+            """One pass of the controller, returns whether it created or deleted pods"""
+            alive = [pod for pod in rollout.pods if pod.deleting_ms is None]
+            new = [pod for pod in alive if template_hash(deployment, pod.name) == new_hash]
+            old = [pod for pod in alive if template_hash(deployment, pod.name) != new_hash]
+            replica_set = f"{deployment}-{new_hash}"
+
+            if not old:
+                if len(new) < replicas:
+                    scaled(now, replica_set, "up", replicas)
+                    for _ in range(replicas - len(new)):
+                        create(now)
+                    return True
+                if len(new) > replicas:
+                    scaled(now, replica_set, "down", replicas)
+                    # Pods not ready yet go first, then the newest
+                    for pod in sorted(new, key=lambda p: (p.is_ready(now), -(p.created_ms or 0)))[:len(new) - replicas]:
+                        terminate(pod, now)
+                    return True
+                return False
+
+            surge = min(replicas - len(new), replicas + rollout.max_surge - len(alive))
+            if surge > 0:
+                scaled(now, replica_set, "up", len(new) + surge)
+                for _ in range(surge):
+                    create(now)
+                new = [pod for pod in rollout.pods if pod.deleting_ms is None and template_hash(deployment, pod.name) == new_hash]
+
+            min_available = replicas - rollout.max_unavailable
+            new_unavailable = sum(1 for pod in new if not pod.is_ready(now))
+            budget = len(old) + len(new) - min_available - new_unavailable
+            available = sum(1 for pod in old + new if pod.is_ready(now))
+            removed: Dict[str, int] = {}
+            for pod in [pod for pod in old if not pod.is_ready(now)]:  # unhealthy old pods do not count as available
+                if budget <= 0:
+                    break
+                terminate(pod, now)
+                removed[template_hash(deployment, pod.name)] = removed.get(template_hash(deployment, pod.name), 0) + 1
+                budget -= 1
+            healthy = sorted((pod for pod in old if pod.is_ready(now)), key=lambda p: p.created_ms or 0)
+            for pod in healthy[:max(min(budget, available - min_available), 0)]:
+                terminate(pod, now)
+                removed[template_hash(deployment, pod.name)] = removed.get(template_hash(deployment, pod.name), 0) + 1
+            for old_hash, count in removed.items():
+                remaining = sum(1 for pod in old if template_hash(deployment, pod.name) == old_hash and pod.deleting_ms is None)
+                scaled(now, f"{deployment}-{old_hash}", "down", remaining)
+            return surge > 0 or bool(removed)
+
+        def reconcile(now: int):
+            # The controller syncs again as soon as its ReplicaSets change, e.g. scaling up after a scale down
+            while sync(now):
+                pass
+
+        def complete(now: int) -> bool:
+            alive = [pod for pod in rollout.pods if pod.deleting_ms is None]
+            return len(alive) == replicas and all(
+                template_hash(deployment, pod.name) == new_hash and pod.is_ready(now) for pod in alive
+            )
+
+        containers = next((pod.containers for pod in pods), 1)
+        # Carried over pods that are still starting make progress on their own schedule
+        for pod in rollout.pods:
+            if pod.deleting_ms is None and pod.ready_ms is not None and pod.ready_ms > start_ms:
+                sequence += 1
+                heapq.heappush(queue, (pod.ready_ms, sequence, pod.name))
+
+        deadline_ms = int(config.progress_deadline_seconds * 1000 / config.time_scale)
+        last_progress = start_ms
+        reconcile(start_ms)
+        now = start_ms
+        while not complete(now) and queue:
+            now, _, name = heapq.heappop(queue)
+            if rollout.stalled_ms is None and now > last_progress + deadline_ms:
+                rollout.stalled_ms = last_progress + deadline_ms
+            if by_name[name].deleting_ms is not None and by_name[name].deleting_ms <= now:
+                continue
+            last_progress = now
+            reconcile(now)
+
+        if complete(now):
+            rollout.completed_ms = now
+            event(now, "Deployment", deployment, "NewReplicaSetAvailable", f'ReplicaSet "{deployment}-{new_hash}" has successfully progressed.')
+        elif rollout.stalled_ms is None:
+            rollout.stalled_ms = last_progress + deadline_ms
+        if rollout.stalled_ms is not None:
+            event(rollout.stalled_ms, "Deployment", deployment, "ProgressDeadlineExceeded",
+                  f'ReplicaSet "{deployment}-{new_hash}" has timed out progressing.', "Warning")
+        rollout.events.sort(key=lambda item: item.at_ms)
+        return rollout
+
+
+class RolloutJournal:
+    """
+    Append-only JSON lines file of the simulated rollouts, written by the Kubernetes mock and read by
+    the Prometheus mock (each process tails it from its own offset), so both serve the same pods.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RolloutJournal":
+        return cls(Path(os.getenv("MOCK_CLUSTER_JOURNAL", Path(__file__).parent / "data" / "cluster" / "rollouts.jsonl")))
+
+    def append(self, rollout: Rollout):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab") as journal:
+            journal.write(dumps(rollout) + b"\n")
+
+    def read_new(self) -> List[Rollout]:
+        """Rollouts appended since the previous call, a line still being written is left for the next one"""
+        with self._lock:
+            try:
+                with open(self.path, "rb") as journal:
+                    journal.seek(self._offset)
+                    data = journal.read()
+            except FileNotFoundError:
+                return []
+            end = data.rfind(b"\n") + 1
+            self._offset += end
+        return [Rollout.from_dict(json.loads(line)) for line in data[:end].splitlines() if line.strip()]
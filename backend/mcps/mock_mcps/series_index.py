@@ -0,0 +1,174 @@
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Canonical series identity: label pairs sorted by name, including __name__
+Labels = Tuple[Tuple[str, str], ...]
+
+IDENTIFIER_RE = re.compile(r"[a-zA-Z_:][a-zA-Z0-9_:]*")
+MATCHER_RE = re.compile(r'\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*(=~|!~|!=|=)\s*"((?:[^"\\]|\\.)*)"\s*,?')
+PROMQL_KEYWORDS = {"bool", "and", "or", "unless", "offset"}
+# Keywords followed by a parenthesized label list that must not be read as metric names
+GROUPING_KEYWORDS = {"by", "without", "on", "ignoring", "group_left", "group_right"}
+AGGREGATIONS = {"sum", "avg", "min", "max", "count", "group", "stddev", "stdvar", "topk", "bottomk", "quantile", "count_values"}
+
+
+class SelectorError(ValueError):
+    """A selector Prometheus would reject while parsing the query (errorType bad_data)"""
+
+
+@dataclass(frozen=True)
+class LabelMatcher:
+    name: str
+    op: str  # =, !=, =~, !~
+    value: str
+    pattern: Optional[re.Pattern] = field(default=None, compare=False, repr=False)
+
+    def __post_init__(self):
+        # Regex matchers are compiled once, when the selector is parsed
+        if self.op in ("=~", "!~") and self.pattern is None:
+            try:
+                object.__setattr__(self, "pattern", re.compile(self.value))
+            except re.error as e:
+                raise SelectorError(f'invalid regular expression in matcher {self.name}{self.op}"{self.value}": {e}') from e
+
+    def matches(self, value: str) -> bool:
+        if self.op == "=":
+            return value == self.value
+        if self.op == "!=":
+            return value != self.value
+        matched = self.pattern.fullmatch(value) is not None
+        return matched if self.op == "=~" else not matched
+
+
+def parse_matchers(body: str) -> List[LabelMatcher]:
+    """Parse the inside of a `{...}` selector into label matchers, raising SelectorError for an invalid regex"""
+    return [LabelMatcher(name, op, value.replace('\\"', '"')) for name, op, value in MATCHER_RE.findall(body)]
+
+
+def parse_selector(query: str) -> List[LabelMatcher]:
+    """
+    Extract the first vector selector of a PromQL expression, e.g.
+    `rate(http_requests_total{app="nginx", status=~"5.."}[5m])` -> __name__="http_requests_total", app="nginx", status=~"5..".
+    Function names, aggregation keywords, label names and range durations are skipped.
+    """
+    position = 0
+    while (match := IDENTIFIER_RE.search(query, position)) is not None:
+        position = match.end()
+        prefix = query[:match.start()]
+        if prefix.count("{") > prefix.count("}") or prefix.count("[") > prefix.count("]") or prefix.count('"') % 2:
+            continue
+        name = match.group()
+        rest = query[match.end():].lstrip()
+        if name in GROUPING_KEYWORDS and rest.startswith("("):
+            position = query.index(")", match.end()) + 1 if ")" in query[match.end():] else len(query)
+            continue
+        if rest.startswith("(") or name in PROMQL_KEYWORDS or (name in AGGREGATIONS and rest.startswith(("by", "without"))):
+            continue
+        matchers = [LabelMatcher("__name__", "=", name)]
+        if rest.startswith("{") and "}" in rest:
+            matchers += parse_matchers(rest[1:rest.index("}")])
+        return matchers
+    if "{" in query and "}" in query:
+        return parse_matchers(query[query.index("{") + 1:query.index("}")])
+    return []
+
+
+class PostingsIndex:
+    """
+    Inverted index from label name/value pairs to series ids, like the postings of the Prometheus head block.
+
+    Selecting series is a set operation over posting lists instead of a scan over every series:
+    equality matchers intersect their postings (smallest first), regex and negative matchers take the
+    union of the postings of the label values they accept. A matcher that accepts the empty string also
+    selects the series that do not have the label, as in PromQL.
+
+    Series are also added while queries run (the pods of a rollout), so updates and lookups that walk
+    the postings hold a lock.
+    """
+
+    def __init__(self):
+        self._series: Dict[int, Labels] = {}
+        self._ids: Dict[Labels, int] = {}
+        self._postings: Dict[str, Dict[str, Set[int]]] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._series)
+
+    def add(self, labels: Dict[str, str]) -> int:
+        """Register a series (idempotent) and return its id"""
+        key: Labels = tuple(sorted((name, str(value)) for name, value in labels.items() if value != ""))
+        with self._lock:
+            series_id = self._ids.get(key)
+            if series_id is not None:
+                return series_id
+            series_id = self._next_id
+            self._next_id += 1
+            self._ids[key] = series_id
+            self._series[series_id] = key
+            for name, value in key:
+                self._postings.setdefault(name, {}).setdefault(value, set()).add(series_id)
+            return series_id
+
+    def labels(self, series_id: int) -> Dict[str, str]:
+        return dict(self._series[series_id])
+
+    def key(self, series_id: int) -> Labels:
+        return self._series[series_id]
+
+    def postings(self, name: str, value: str) -> Set[int]:
+        return self._postings.get(name, {}).get(value, set())
+
+    def label_values(self, name: str) -> List[str]:
+        with self._lock:
+            return sorted(self._postings.get(name, {}))
+
+    def _candidates(self, matcher: LabelMatcher) -> Set[int]:
+        values = self._postings.get(matcher.name, {})
+        if matcher.op == "=" and matcher.value != "":
+            return values.get(matcher.value, set())
+        if matcher.matches(""):
+            # Series without the label match too: everything except the postings of rejected values
+            rejected = [ids for value, ids in values.items() if not matcher.matches(value)]
+            return set(self._series).difference(*rejected)
+        return set().union(*(ids for value, ids in values.items() if matcher.matches(value)))
+
+    def select(self, matchers: Iterable[LabelMatcher]) -> List[int]:
+        """Ids of the series matching every matcher, in ascending order"""
+        with self._lock:
+            candidates = sorted((self._candidates(matcher) for matcher in matchers), key=len)
+            if not candidates:
+                return sorted(self._series)
+            selected = set(candidates[0])
+            for ids in candidates[1:]:
+                if not selected:
+                    break
+                selected &= ids
+            return sorted(selected)
+
+    def select_labels(self, matchers: Iterable[LabelMatcher]) -> List[Dict[str, str]]:
+        return [self.labels(series_id) for series_id in self.select(matchers)]
+
+    def cardinality(self, limit: int = 10) -> Dict[str, object]:
+        """Cardinality stats in the shape of the Prometheus `/api/v1/status/tsdb` endpoint"""
+        def top(items: Iterable[Tuple[str, int]]) -> List[Dict[str, object]]:
+            return [{"name": name, "value": value} for name, value in sorted(items, key=lambda item: (-item[1], item[0]))[:limit]]
+
+        with self._lock:
+            return {
+                "numSeries": len(self._series),
+                "numLabelPairs": sum(len(values) for values in self._postings.values()),
+                "seriesCountByMetricName": top((name, len(ids)) for name, ids in self._postings.get("__name__", {}).items()),
+                "labelValueCountByLabelName": top((name, len(values)) for name, values in self._postings.items()),
+                "seriesCountByLabelName": top(
+                    (name, len(set().union(*values.values()))) for name, values in self._postings.items()
+                ),
+                "seriesCountByLabelValuePair": top(
+                    (f"{name}={value}", len(ids))
+                    for name, values in self._postings.items() if name != "__name__"
+                    for value, ids in values.items()
+                )
+            }
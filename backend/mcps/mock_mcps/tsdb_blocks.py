@@ -0,0 +1,452 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from series_index import Labels
+from tsdb_chunks import Buffer, XORChunk, decode_chunks, iter_chunk, iter_chunks, np
+
+BLOCK_RANGE_MS = 2 * 3600 * 1000
+# Compaction levels: 3 blocks of a level merge into one of the next (2h -> 6h -> 18h -> 54h ...)
+COMPACTION_FACTOR = 3
+# Staleness marker: the NaN Prometheus appends when a series disappears (e.g. its pod was deleted), so
+# queries stop returning its last sample at once instead of for the whole lookback
+STALE_NAN_BITS = 0x7FF0000000000002
+STALE_NAN = struct.unpack("<d", struct.pack("<Q", STALE_NAN_BITS))[0]
+
+
+def is_stale(value: float) -> bool:
+    return value != value and struct.pack("<d", value) == struct.pack("<Q", STALE_NAN_BITS)
+
+
+def series_key(labels: Labels) -> str:
+    return json.dumps(labels, separators=(",", ":"))
+
+
+class Head:
+    """
+    In-memory head block: the most recent samples of every series, not yet persisted. Each series is a
+    list of Gorilla `XORChunk`s whose last one is still open for appends, so a regular 15s series costs
+    ~2 bytes per sample instead of two Python objects.
+    """
+
+    def __init__(self):
+        self.series: Dict[Labels, List[XORChunk]] = {}
+        self.num_samples = 0
+
+    def append(self, labels: Labels, timestamp: int, value: float):
+        chunks = self.series.setdefault(labels, [])
+        if chunks and chunks[-1].maxt is not None and timestamp <= chunks[-1].maxt:
+            return  # out of order or duplicate sample
+        if not chunks or chunks[-1].is_full:
+            chunks.append(XORChunk())
+        chunks[-1].append(timestamp, value)
+        self.num_samples += 1
+
+    @property
+    def mint(self) -> Optional[int]:
+        return min((chunks[0].mint for chunks in self.series.values() if chunks), default=None)
+
+    @property
+    def maxt(self) -> Optional[int]:
+        return max((chunks[-1].maxt for chunks in self.series.values() if chunks), default=None)
+
+    @property
+    def num_bytes(self) -> int:
+        return sum(len(chunk.data) for chunks in self.series.values() for chunk in chunks)
+
+    def last(self, labels: Labels) -> Optional[Tuple[int, float]]:
+        chunks = self.series.get(labels)
+        return chunks[-1].last if chunks else None
+
+    def chunks(self, labels: Labels, mint: int, maxt: int) -> List[Buffer]:
+        """Chunks overlapping [mint, maxt], the open chunk is copied so it can be decoded while appends continue"""
+        chunks = self.series.get(labels, ())
+        return [
+            chunk.data if chunk.is_full else chunk.bytes()
+            for chunk in chunks if chunk.num_samples and chunk.maxt >= mint and chunk.mint <= maxt
+        ]
+
+    def samples(self, labels: Labels, mint: int, maxt: int) -> List[Tuple[int, float]]:
+        return list(iter_chunks(self.chunks(labels, mint, maxt), mint, maxt))
+
+    def truncate(self, before: int):
+        """Drop the samples older than `before`, re-encoding the chunk that straddles it"""
+        for labels, chunks in self.series.items():
+            while chunks and chunks[0].maxt < before:
+                self.num_samples -= chunks.pop(0).num_samples
+            if chunks and chunks[0].mint < before:
+                straddling = chunks[0]
+                kept = XORChunk()
+                for timestamp, value in iter_chunk(straddling.data):
+                    if timestamp >= before:
+                        kept.append(timestamp, value)
+                self.num_samples -= straddling.num_samples - kept.num_samples
+                chunks[0] = kept
+
+
+def _live_blocks(blocks: List["Block"]) -> List["Block"]:
+    """Drop the blocks already merged into a higher level block that still sits next to them on disk"""
+    sources = [(block, set(block.meta["compaction"]["sources"])) for block in blocks]
+    return [
+        block for block, own in sources
+        if not any(other.level > block.level and own <= merged for other, merged in sources)
+    ]
+
+
+class Block:
+    """
+    Immutable, time-partitioned block on disk:
+
+    ```text
+    <data_dir>/<mint>-<maxt>/
+        chunks      concatenated XOR chunks, read through a read-only mmap
+        index.json  series labels -> [[offset, length, mint, maxt], ...]
+        meta.json   time range, sample/series counts and compaction level
+    ```
+
+    Only the chunks that overlap a query range are sliced out of the mmap, so the OS pages in just
+    those bytes. Opening a block reads only its index, which makes restarts immediate.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.meta = json.loads((path / "meta.json").read_text())
+        self.mint: int = self.meta["minTime"]
+        self.maxt: int = self.meta["maxTime"]
+        self.index: Dict[str, List[List[int]]] = json.loads((path / "index.json").read_text())
+        self._file = open(path / "chunks", "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    @property
+    def level(self) -> int:
+        return self.meta["compaction"]["level"]
+
+    def chunks(self, key: str, mint: int, maxt: int) -> List[memoryview]:
+        if self._mmap is None:
+            return []
+        view = memoryview(self._mmap)
+        return [
+            view[offset:offset + length]
+            for offset, length, chunk_mint, chunk_maxt in self.index.get(key, ())
+            if chunk_maxt >= mint and chunk_mint <= maxt
+        ]
+
+    def samples(self, key: str, mint: int, maxt: int) -> Iterator[Tuple[int, float]]:
+        return iter_chunks(self.chunks(key, mint, maxt), mint, maxt)
+
+    @staticmethod
+    def write(data_dir: Path, series: Dict[str, List[Tuple[int, float]]], level: int = 1, sources: Optional[List[str]] = None) -> Optional[Path]:
+        """Encode the samples into a new block, written to a temporary directory and renamed atomically"""
+        series = {key: samples for key, samples in series.items() if samples}
+        if not series:
+            return None
+        mint = min(samples[0][0] for samples in series.values())
+        maxt = max(samples[-1][0] for samples in series.values())
+        tmp = Block._create(data_dir, mint, maxt)
+        index: Dict[str, List[List[int]]] = {}
+        offset = num_chunks = num_samples = 0
+        with open(tmp / "chunks", "wb") as chunks_file:
+            for key in sorted(series):
+                chunk = XORChunk()
+                for timestamp, value in series[key]:
+                    chunk.append(timestamp, value)
+                    if chunk.is_full:
+                        offset = Block._flush(chunks_file, chunk, index.setdefault(key, []), offset)
+                        num_chunks += 1
+                        chunk = XORChunk()
+                if len(chunk):
+                    offset = Block._flush(chunks_file, chunk, index.setdefault(key, []), offset)
+                    num_chunks += 1
+                num_samples += len(series[key])
+        stats = {"numSeries": len(series), "numChunks": num_chunks, "numSamples": num_samples, "numBytes": offset}
+        return Block._commit(data_dir, tmp, index, mint, maxt, stats, level, sources)
+
+    @staticmethod
+    def merge(data_dir: Path, blocks: List["Block"], level: int, sources: List[str]) -> Optional[Path]:
+        """
+        Concatenate time-ordered, non-overlapping blocks into one. The chunks of each series are copied
+        from the mmaps byte for byte and only their offsets in the index are rewritten, so no sample is decoded.
+        """
+        blocks = [block for block in blocks if block.index]
+        if not blocks:
+            return None
+        mint = min(block.mint for block in blocks)
+        maxt = max(block.maxt for block in blocks)
+        tmp = Block._create(data_dir, mint, maxt)
+        index: Dict[str, List[List[int]]] = {}
+        offset = num_chunks = 0
+        with open(tmp / "chunks", "wb") as chunks_file:
+            for key in sorted({key for block in blocks for key in block.index}):
+                refs = index[key] = []
+                for block in blocks:
+                    for chunk_offset, length, chunk_mint, chunk_maxt in block.index.get(key, ()):
+                        chunks_file.write(block._mmap[chunk_offset:chunk_offset + length])
+                        refs.append([offset, length, chunk_mint, chunk_maxt])
+                        offset += length
+                        num_chunks += 1
+        stats = {
+            "numSeries": len(index), "numChunks": num_chunks,
+            "numSamples": sum(block.meta["stats"]["numSamples"] for block in blocks), "numBytes": offset
+        }
+        return Block._commit(data_dir, tmp, index, mint, maxt, stats, level, sources)
+
+    @staticmethod
+    def _create(data_dir: Path, mint: int, maxt: int) -> Path:
+        tmp = data_dir / f"{mint}-{maxt}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        return tmp
+
+    @staticmethod
+    def _commit(
+        data_dir: Path, tmp: Path, index: Dict[str, List[List[int]]], mint: int, maxt: int,
+        stats: Dict[str, int], level: int, sources: Optional[List[str]]
+    ) -> Path:
+        """Write the index and meta of a block whose chunks are in `tmp`, then rename it into place atomically"""
+        name = f"{mint}-{maxt}"
+        (tmp / "index.json").write_text(json.dumps(index, separators=(",", ":")))
+        (tmp / "meta.json").write_text(json.dumps({
+            "minTime": mint,
+            "maxTime": maxt,
+            "stats": stats,
+            "compaction": {"level": level, "sources": sources or [name]}
+        }))
+        final = data_dir / name
+        shutil.rmtree(final, ignore_errors=True)
+        os.rename(tmp, final)
+        return final
+
+    @staticmethod
+    def _flush(chunks_file, chunk: XORChunk, refs: List[List[int]], offset: int) -> int:
+        data = chunk.bytes()
+        chunks_file.write(data)
+        refs.append([offset, len(data), chunk.mint, chunk.maxt])
+        return offset + len(data)
+
+
+class BlockStorage:
+    """
+    Mock TSDB storage: an in-memory head plus immutable mmap-backed blocks on disk.
+
+    - The head is cut into a `block_range_ms` block once it spans 1.5 block ranges, like Prometheus.
+    - A background thread persists the head, compacts `COMPACTION_FACTOR` adjacent blocks of the same
+      level into one larger block (up to `max_block_range_ms`) and deletes blocks past the retention.
+    - Queries merge the blocks overlapping the range (read through mmap) with the head.
+
+    Blocks replaced by compaction are removed from disk while older readers may still hold their
+    mmap, which stays valid on POSIX until it is garbage collected.
+
+    With `read_only=True` the storage is a replica of another process' data directory: it never cuts,
+    compacts or deletes blocks, its maintenance pass reloads the block list from disk instead and drops
+    the head samples that a new block already holds.
+    """
+
+    def __init__(self, data_dir: Path, retention_ms: int, block_range_ms: int = BLOCK_RANGE_MS, max_block_range_ms: Optional[int] = None, read_only: bool = False):
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.retention_ms = retention_ms
+        self.block_range_ms = block_range_ms
+        self.max_block_range_ms = max_block_range_ms or max(retention_ms // 10, block_range_ms)
+        self.read_only = read_only
+        self.head = Head()
+        self.blocks: List[Block] = []
+        self.compactions = 0
+        self._lock = threading.RLock()
+        self._maintenance_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._open_blocks()
+
+    def _open_blocks(self):
+        known = {block.path.name: block for block in self.blocks}
+        blocks = []
+        for path in self.data_dir.iterdir():
+            if path.name.endswith(".tmp"):
+                if not self.read_only:
+                    shutil.rmtree(path, ignore_errors=True)  # left by an interrupted write
+            elif path.name in known:
+                blocks.append(known[path.name])
+            elif (path / "meta.json").exists():
+                try:
+                    blocks.append(Block(path))
+                except (FileNotFoundError, ValueError):
+                    continue  # removed by the writer while listing
+        live = _live_blocks(blocks)
+        if not self.read_only:
+            for block in blocks:
+                if block not in live:
+                    shutil.rmtree(block.path, ignore_errors=True)  # sources of a compaction interrupted before cleanup
+        self.blocks = sorted(live, key=lambda block: block.mint)
+
+    def reload(self):
+        """Replica maintenance: pick up the blocks written or compacted by the writer process"""
+        with self._lock:
+            self._open_blocks()
+            if self.blocks:
+                self.head.truncate(max(block.maxt for block in self.blocks) + 1)
+
+    @property
+    def maxt(self) -> Optional[int]:
+        """Newest persisted or in-memory timestamp, used to resume ingestion after a restart"""
+        head_maxt = self.head.maxt
+        block_maxt = self.blocks[-1].maxt if self.blocks else None
+        return max((t for t in (head_maxt, block_maxt) if t is not None), default=None)
+
+    def append(self, labels: Labels, timestamp: int, value: float):
+        with self._lock:
+            self.head.append(labels, timestamp, value)
+
+    def _chunks(self, labels: Labels, mint: int, maxt: int) -> List[Buffer]:
+        """Chunks of one series overlapping [mint, maxt] across blocks and head, in timestamp order"""
+        with self._lock:
+            blocks = [block for block in self.blocks if block.maxt >= mint and block.mint <= maxt]
+            head = self.head.chunks(labels, mint, maxt)
+        key = series_key(labels)
+        return [chunk for block in blocks for chunk in block.chunks(key, mint, maxt)] + head
+
+    def iter_select(self, labels: Labels, mint: int, maxt: int) -> Iterator[Tuple[int, float]]:
+        """Stream the samples of one series within [mint, maxt], decoding one chunk at a time"""
+        return iter_chunks(self._chunks(labels, mint, maxt), mint, maxt)
+
+    def select(self, labels: Labels, mint: int, maxt: int) -> List[Tuple[int, float]]:
+        return list(self.iter_select(labels, mint, maxt))
+
+    def select_arrays(self, labels: Labels, mint: int, maxt: int):
+        """Samples of one series within [mint, maxt] as NumPy `(timestamps, values)` arrays"""
+        return decode_chunks(self._chunks(labels, mint, maxt), mint, maxt)
+
+    def at_steps(self, labels: Labels, start: int, end: int, step: int, lookback: int) -> Tuple[List[int], List[float]]:
+        """
+        Evaluate a series at every step in [start, end] as `(timestamps, values)` columns: the newest sample
+        within `lookback` of the step, steps without one or where it is a staleness marker are skipped. Vectorized with `searchsorted` when
+        NumPy is installed, otherwise a single streaming pass over the decoded samples.
+        """
+        if np is not None:
+            timestamps, values = self.select_arrays(labels, start - lookback, end)
+            steps = np.arange(start, end + 1, step, dtype=np.int64)
+            positions = np.searchsorted(timestamps, steps, "right") - 1
+            found = positions >= 0
+            found[found] &= timestamps[positions[found]] > steps[found] - lookback
+            found[found] &= values[positions[found]].view(np.uint64) != STALE_NAN_BITS
+            return steps[found].tolist(), values[positions[found]].tolist()
+        steps, values = [], []
+        for timestamp, value in self._iter_steps(labels, start, end, step, lookback):
+            steps.append(timestamp)
+            values.append(value)
+        return steps, values
+
+    def _iter_steps(self, labels: Labels, start: int, end: int, step: int, lookback: int) -> Iterator[Tuple[int, float]]:
+        samples = self.iter_select(labels, start - lookback, end)
+        current = upcoming = None
+        for timestamp in range(start, end + 1, step):
+            while True:
+                if upcoming is None:
+                    upcoming = next(samples, None)
+                if upcoming is None or upcoming[0] > timestamp:
+                    break
+                current, upcoming = upcoming, None
+            if current is not None and current[0] > timestamp - lookback and not is_stale(current[1]):
+                yield timestamp, current[1]
+
+    def latest(self, labels: Labels) -> Optional[Tuple[int, float]]:
+        with self._lock:
+            last = self.head.last(labels)
+            if last is not None:
+                return last
+            blocks = list(self.blocks)
+        for block in reversed(blocks):
+            samples = list(block.samples(series_key(labels), block.mint, block.maxt))
+            if samples:
+                return samples[-1]
+        return None
+
+    def cut_head(self) -> bool:
+        """Persist the oldest block range of the head when the head spans more than 1.5 ranges"""
+        with self._lock:
+            head_mint, head_maxt = self.head.mint, self.head.maxt
+            if head_mint is None or head_maxt - head_mint < self.block_range_ms * 3 // 2:
+                return False
+            boundary = (head_mint // self.block_range_ms + 1) * self.block_range_ms
+            persisted = {labels: self.head.samples(labels, head_mint, boundary - 1) for labels in self.head.series}
+        # Encoding runs outside the lock, the samples stay queryable in the head until the block is added
+        path = Block.write(self.data_dir, {series_key(labels): samples for labels, samples in persisted.items()})
+        with self._lock:
+            if path is not None:
+                self.blocks.append(Block(path))
+                self.blocks.sort(key=lambda block: block.mint)
+            self.head.truncate(boundary)
+        return True
+
+    def compact(self) -> bool:
+        """Merge the oldest run of `COMPACTION_FACTOR` adjacent same-level blocks within the max range"""
+        with self._lock:
+            blocks = list(self.blocks)
+        for start in range(len(blocks) - COMPACTION_FACTOR + 1):
+            group = blocks[start:start + COMPACTION_FACTOR]
+            if len({block.level for block in group}) != 1 or group[-1].maxt - group[0].mint > self.max_block_range_ms:
+                continue
+            path = Block.merge(
+                self.data_dir, group, level=group[0].level + 1,
+                sources=[source for block in group for source in block.meta["compaction"]["sources"]]
+            )
+            with self._lock:
+                self.blocks = sorted([block for block in self.blocks if block not in group] + ([Block(path)] if path else []), key=lambda block: block.mint)
+                self.compactions += 1
+            for block in group:
+                if path is None or block.path != path:
+                    shutil.rmtree(block.path, ignore_errors=True)
+            return True
+        return False
+
+    def apply_retention(self, now_ms: int):
+        with self._lock:
+            expired = [block for block in self.blocks if block.maxt < now_ms - self.retention_ms]
+            self.blocks = [block for block in self.blocks if block not in expired]
+        for block in expired:
+            shutil.rmtree(block.path, ignore_errors=True)
+
+    def maintain(self):
+        """One maintenance pass: cut the head until it is small, then compact until nothing merges"""
+        with self._maintenance_lock:
+            if self.read_only:
+                self.reload()
+                return
+            while self.cut_head():
+                pass
+            while self.compact():
+                pass
+            self.apply_retention(int(time.time() * 1000))
+
+    def start_background(self, interval_seconds: float = 60.0):
+        def loop():
+            while not self._stop.wait(interval_seconds):
+                self.maintain()
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=loop, name="tsdb-compactor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            blocks = list(self.blocks)
+            return {
+                "head": {
+                    "numSeries": len(self.head.series), "numSamples": self.head.num_samples, "numBytes": self.head.num_bytes,
+                    "minTime": self.head.mint, "maxTime": self.head.maxt
+                },
+                "blocks": [
+                    {"ulid": block.path.name, "minTime": block.mint, "maxTime": block.maxt, "level": block.level, **block.meta["stats"]}
+                    for block in blocks
+                ],
+                "compactions": self.compactions
+            }
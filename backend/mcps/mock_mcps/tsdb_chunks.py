@@ -0,0 +1,245 @@
+import struct
+from array import array
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # optional, iter_chunk decodes the same chunks without it
+    np = None
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Delta-of-delta buckets: (control prefix, prefix length, payload bits), as in the Gorilla paper / Prometheus
+DOD_BUCKETS = ((0b10, 2, 14), (0b110, 3, 17), (0b1110, 4, 20))
+MAX_CHUNK_SAMPLES = 120
+HEADER_BYTES = 2  # big-endian sample count
+
+
+def _float_bits(value: float) -> int:
+    return struct.unpack(">Q", struct.pack(">d", value))[0]
+
+
+def _bits_float(bits: int) -> float:
+    return struct.unpack(">d", struct.pack(">Q", bits))[0]
+
+
+class BitWriter:
+    """Append-only bit stream over a `bytearray`, bits are written most significant first"""
+
+    def __init__(self, buffer: Optional[bytearray] = None):
+        self.buffer = buffer if buffer is not None else bytearray()
+        self.bit_length = len(self.buffer) * 8
+
+    def write(self, value: int, bits: int):
+        if bits == 0:
+            return
+        value &= (1 << bits) - 1
+        used = self.bit_length & 7
+        if used:
+            # Fill the free low bits of the last byte first
+            free = 8 - used
+            take = min(free, bits)
+            self.buffer[-1] |= (value >> (bits - take)) << (free - take)
+            bits -= take
+            self.bit_length += take
+            value &= (1 << bits) - 1
+        if bits:
+            padding = (8 - bits % 8) % 8
+            self.buffer += (value << padding).to_bytes((bits + padding) // 8, "big")
+            self.bit_length += bits
+
+
+class BitReader:
+    """Sequential bit reader over any buffer (bytes, bytearray or an `mmap` memoryview slice)"""
+
+    def __init__(self, buffer: Buffer, offset_bits: int = 0):
+        self.buffer = buffer
+        self.position = offset_bits
+
+    def read(self, bits: int) -> int:
+        if bits == 0:
+            return 0
+        start = self.position >> 3
+        end = (self.position + bits + 7) >> 3
+        chunk = int.from_bytes(self.buffer[start:end], "big")
+        shift = end * 8 - (self.position + bits)
+        self.position += bits
+        return (chunk >> shift) & ((1 << bits) - 1)
+
+    def read_bit(self) -> int:
+        byte = self.buffer[self.position >> 3]
+        bit = (byte >> (7 - (self.position & 7))) & 1
+        self.position += 1
+        return bit
+
+
+def _signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+
+class XORChunk:
+    """
+    Gorilla-compressed chunk of one series: millisecond timestamps as delta-of-delta and float values
+    XOR-ed against the previous value, packed in a `bytearray`. Regular 15s scrapes cost ~1 bit per
+    timestamp and slowly changing gauges a few bits per value, versus 16 bytes for the raw pair.
+
+    Layout: 2-byte sample count, first timestamp (64 bits) and value (64 bits), second timestamp as a
+    zig-zag delta (64 bits), then one delta-of-delta + XOR value per sample.
+    """
+
+    def __init__(self):
+        self.data = bytearray(HEADER_BYTES)
+        self._writer = BitWriter(self.data)
+        self.num_samples = 0
+        self.mint: Optional[int] = None
+        self.maxt: Optional[int] = None
+        self._delta = 0
+        self._value_bits = 0
+        self._leading = 0xFF
+        self._trailing = 0
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+    @property
+    def is_full(self) -> bool:
+        return self.num_samples >= MAX_CHUNK_SAMPLES
+
+    def append(self, timestamp: int, value: float):
+        writer = self._writer
+        value_bits = _float_bits(value)
+        if self.num_samples == 0:
+            writer.write(timestamp, 64)
+            writer.write(value_bits, 64)
+            self.mint = timestamp
+        elif self.num_samples == 1:
+            delta = timestamp - self.maxt
+            writer.write((delta << 1) ^ (delta >> 63), 64)
+            self._write_value(value_bits)
+            self._delta = delta
+        else:
+            delta = timestamp - self.maxt
+            dod = delta - self._delta
+            if dod == 0:
+                writer.write(0, 1)
+            else:
+                for prefix, prefix_bits, payload_bits in DOD_BUCKETS:
+                    if -(1 << (payload_bits - 1)) <= dod < (1 << (payload_bits - 1)):
+                        writer.write(prefix, prefix_bits)
+                        writer.write(dod, payload_bits)
+                        break
+                else:
+                    writer.write(0b1111, 4)
+                    writer.write(dod, 64)
+            self._write_value(value_bits)
+            self._delta = delta
+        self.maxt = timestamp
+        self._value_bits = value_bits
+        self.num_samples += 1
+        self.data[0:HEADER_BYTES] = self.num_samples.to_bytes(HEADER_BYTES, "big")
+
+    def _write_value(self, value_bits: int):
+        writer = self._writer
+        xor = value_bits ^ self._value_bits
+        if xor == 0:
+            writer.write(0, 1)
+            return
+        leading = min(64 - xor.bit_length(), 31)
+        trailing = (xor & -xor).bit_length() - 1
+        if self._leading != 0xFF and leading >= self._leading and trailing >= self._trailing:
+            # Meaningful bits fit in the previous window
+            writer.write(0b10, 2)
+            writer.write(xor >> self._trailing, 64 - self._leading - self._trailing)
+            return
+        self._leading, self._trailing = leading, trailing
+        significant = 64 - leading - trailing
+        writer.write(0b11, 2)
+        writer.write(leading, 5)
+        writer.write(significant & 0x3F, 6)  # 64 significant bits is stored as 0
+        writer.write(xor >> trailing, significant)
+
+    @property
+    def last(self) -> Optional[Tuple[int, float]]:
+        return (self.maxt, _bits_float(self._value_bits)) if self.num_samples else None
+
+    def bytes(self) -> bytes:
+        return bytes(self.data)
+
+
+def chunk_num_samples(buffer: Buffer) -> int:
+    return int.from_bytes(buffer[0:HEADER_BYTES], "big")
+
+
+def _iter_raw(buffer: Buffer) -> Iterator[Tuple[int, int]]:
+    """
+    Decode the bit stream into `(delta, xor)` pairs: the first pair is the first timestamp and the raw
+    bits of the first value, so timestamps are the running sum of the deltas and value bits the running XOR.
+    """
+    count = chunk_num_samples(buffer)
+    if count == 0:
+        return
+    reader = BitReader(buffer, HEADER_BYTES * 8)
+    yield _signed(reader.read(64), 64), reader.read(64)
+    delta = 0
+    leading = trailing = 0
+    for index in range(1, count):
+        if index == 1:
+            zigzag = reader.read(64)
+            delta = (zigzag >> 1) ^ -(zigzag & 1)
+        elif reader.read_bit():
+            for payload_bits in (14, 17, 20):
+                if not reader.read_bit():
+                    delta += _signed(reader.read(payload_bits), payload_bits)
+                    break
+            else:
+                delta += _signed(reader.read(64), 64)
+        xor = 0
+        if reader.read_bit():
+            if reader.read_bit():
+                leading = reader.read(5)
+                significant = reader.read(6) or 64
+                trailing = 64 - leading - significant
+            xor = reader.read(64 - leading - trailing) << trailing
+        yield delta, xor
+
+
+def iter_chunk(buffer: Buffer) -> Iterator[Tuple[int, float]]:
+    """Decode a chunk lazily, one `(timestamp_ms, value)` pair at a time"""
+    timestamp = value_bits = 0
+    for delta, xor in _iter_raw(buffer):
+        timestamp += delta
+        value_bits ^= xor
+        yield timestamp, _bits_float(value_bits)
+
+
+def iter_chunks(buffers: Iterable[Buffer], mint: int, maxt: int) -> Iterator[Tuple[int, float]]:
+    """Stream the samples within [mint, maxt] of consecutive chunks of one series, in timestamp order"""
+    for buffer in buffers:
+        for timestamp, value in iter_chunk(buffer):
+            if timestamp > maxt:
+                return
+            if timestamp >= mint:
+                yield timestamp, value
+
+
+def decode_chunks(buffers: Iterable[Buffer], mint: int, maxt: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Decode consecutive chunks of one series into `int64` timestamp and `float64` value arrays.
+    Only the bit parsing runs per sample in Python: timestamps are rebuilt with a cumulative sum of the
+    deltas and values with a cumulative XOR of the raw bits, both vectorized.
+    """
+    if np is None:
+        raise RuntimeError("decode_chunks requires numpy, use iter_chunks instead")
+    timestamps, values = [], []
+    for buffer in buffers:
+        deltas, xors = array("q"), array("Q")
+        for delta, xor in _iter_raw(buffer):
+            deltas.append(delta)
+            xors.append(xor)
+        timestamps.append(np.cumsum(np.frombuffer(deltas, dtype=np.int64)))
+        values.append(np.bitwise_xor.accumulate(np.frombuffer(xors, dtype=np.uint64)).view(np.float64))
+    if not timestamps:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    timestamps, values = np.concatenate(timestamps), np.concatenate(values)
+    start, end = np.searchsorted(timestamps, mint, "left"), np.searchsorted(timestamps, maxt, "right")
+    return timestamps[start:end], values[start:end]